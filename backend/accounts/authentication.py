@@ -0,0 +1,119 @@
+"""
+JWT authentication that trusts the claims of the access token.
+
+``JWTAuthentication`` loads the user row on every request, including each
+chunk of a material download, only to read ``user_type``. This class builds
+the user from the token instead: a ``ClaimsUser`` with the id,
+``user_type`` and ``is_staff`` claims loaded and every other field deferred,
+fetched (all at once) only when something reads it.
+
+Revocation is checked against the account state (active flag, role and a
+digest of the password hash) kept in a per-process cache for
+``JWT_REVOCATION_CHECK_TTL`` seconds. Deactivating a user, changing their
+role or password therefore invalidates their tokens within that delay, and
+immediately in the process that saved the change. Tokens without the claims
+(issued before they were added) are authenticated the regular way.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from courses.metrics import jwt_auth_failures
+
+from .models import ClaimsUser, User
+from .tokens import USER_CLAIMS, auth_hash
+
+
+# Bound on the number of users whose state is cached per process
+REVOCATION_CACHE_MAX_ENTRIES = 10000
+
+
+class RevocationCache:
+    """Account state per user id, refreshed after ``ttl`` seconds"""
+
+    def __init__(self, ttl, max_entries=REVOCATION_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """``{'is_active', 'user_type', 'is_staff', 'auth_hash'}`` or ``None`` for unknown users"""
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        row = User.objects.filter(pk=user_id).values('is_active', *USER_CLAIMS, 'password').first()
+        state = None
+        if row is not None:
+            state = {**row, 'auth_hash': auth_hash(row.pop('password'))}
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries = {key: value for key, value in self._entries.items() if value[0] > now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[user_id] = (now + self.ttl, state)
+        return state
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+_revocation_cache = None
+
+
+def get_revocation_cache():
+    global _revocation_cache
+    if _revocation_cache is None:
+        _revocation_cache = RevocationCache(getattr(settings, 'JWT_REVOCATION_CHECK_TTL', 60))
+    return _revocation_cache
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def discard_revocation_state(sender, instance, **kwargs):
+    get_revocation_cache().discard(instance.pk)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication returning a ClaimsUser built from the token claims"""
+
+    def authenticate(self, request):
+        try:
+            return super().authenticate(request)
+        except AuthenticationFailed as e:
+            codes = e.get_codes()
+            jwt_auth_failures.inc(reason=codes.get('code', e.default_code) if isinstance(codes, dict) else codes)
+            raise
+
+    def get_user(self, validated_token):
+        if not all(claim in validated_token for claim in (*USER_CLAIMS, 'auth_hash')):
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        state = get_revocation_cache().get(user_id)
+        if state is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if not state['is_active']:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if state['auth_hash'] != validated_token['auth_hash'] or any(
+            state[claim] != validated_token[claim] for claim in USER_CLAIMS
+        ):
+            raise AuthenticationFailed('Token revogado.', code='token_revoked')
+
+        loaded = {User._meta.pk.attname: user_id, 'is_active': True}
+        loaded.update((claim, validated_token[claim]) for claim in USER_CLAIMS)
+        # from_db() takes the values in the order of the model fields
+        field_names = [field.attname for field in User._meta.concrete_fields if field.attname in loaded]
+        return ClaimsUser.from_db(None, field_names, [loaded[name] for name in field_names])
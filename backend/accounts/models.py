@@ -30,6 +30,23 @@ class User(AbstractUser):
         return self.user_type == 'teacher'
 
 
+class ClaimsUser(User):
+    """
+    User built from the claims of an access token (see
+    accounts.authentication). Only the claimed fields are loaded; reading
+    any other field loads all of them with a single query.
+    """
+    
+    class Meta:
+        proxy = True
+    
+    def refresh_from_db(self, using=None, fields=None):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = deferred
+        super().refresh_from_db(using=using, fields=fields)
+
+
 class StudentProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='student_profile')
     enrollment_date = models.DateField(auto_now_add=True)
@@ -1,21 +1,28 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
+from courses.previews import preview_url
 from .models import User, StudentProfile, TeacherProfile
 
 
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
+    avatar_preview_url = serializers.SerializerMethodField()
     
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'password', 'first_name', 'last_name', 
-                  'user_type', 'phone', 'avatar', 'date_joined']
+                  'user_type', 'phone', 'avatar', 'avatar_preview_url', 'date_joined']
         read_only_fields = ['id', 'date_joined']
         extra_kwargs = {
             'password': {'write_only': True},
             'email': {'required': True}
         }
     
+    def get_avatar_preview_url(self, obj):
+        if obj.avatar:
+            return preview_url(self.context.get('request'), 'user-avatar', obj.pk)
+        return None
+    
     def create(self, validated_data):
         user = User.objects.create_user(
             username=validated_data['username'],
@@ -37,11 +44,18 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class UserDetailSerializer(serializers.ModelSerializer):
+    avatar_preview_url = serializers.SerializerMethodField()
+    
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 
-                  'user_type', 'phone', 'avatar', 'date_joined']
+                  'user_type', 'phone', 'avatar', 'avatar_preview_url', 'date_joined']
         read_only_fields = ['id', 'date_joined']
+    
+    def get_avatar_preview_url(self, obj):
+        if obj.avatar:
+            return preview_url(self.context.get('request'), 'user-avatar', obj.pk)
+        return None
 
 
 class RegisterSerializer(serializers.Serializer):
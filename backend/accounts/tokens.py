@@ -0,0 +1,38 @@
+"""
+JWT tokens carrying the claims the API authorizes with.
+
+Besides the user id, tokens issued by ``login``/``register`` (and access
+tokens issued by ``refresh``) carry ``user_type`` and ``is_staff`` plus an
+``auth_hash`` derived from the password hash, so
+``StatelessJWTAuthentication`` can authenticate a request without loading
+the user and still reject tokens issued before a password change.
+"""
+from django.utils.crypto import salted_hmac
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+AUTH_HASH_SALT = 'accounts.tokens.auth_hash'
+
+# Claims copied from the user into every token
+USER_CLAIMS = ('user_type', 'is_staff')
+
+
+def auth_hash(password):
+    """Short digest of a password hash; changes whenever the password does"""
+    return salted_hmac(AUTH_HASH_SALT, password or '', algorithm='sha256').hexdigest()[:16]
+
+
+def set_user_claims(token, user):
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    token['auth_hash'] = auth_hash(user.password)
+    return token
+
+
+def tokens_for_user(user):
+    """``{'refresh': ..., 'access': ...}`` for a login/registration response"""
+    refresh = set_user_claims(RefreshToken.for_user(user), user)
+    return {
+        'refresh': str(refresh),
+        'access': str(refresh.access_token),
+    }
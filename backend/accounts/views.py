@@ -2,10 +2,14 @@ from rest_framework import status, viewsets
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from courses.metrics import jwt_auth_failures
+from courses.previews import preview_response
 from .models import User, StudentProfile, TeacherProfile
 from .serializers import UserSerializer, UserDetailSerializer, RegisterSerializer, LoginSerializer
+from .tokens import auth_hash, set_user_claims, tokens_for_user
 
 
 @api_view(['POST'])
@@ -47,14 +51,9 @@ def register(request):
             TeacherProfile.objects.create(user=user)
         
         # Generate tokens
-        refresh = RefreshToken.for_user(user)
-        
         return Response({
             'user': UserDetailSerializer(user).data,
-            'tokens': {
-                'refresh': str(refresh),
-                'access': str(refresh.access_token),
-            },
+            'tokens': tokens_for_user(user),
             'message': 'Usuário criado com sucesso!'
         }, status=status.HTTP_201_CREATED)
     
@@ -82,14 +81,9 @@ def login(request):
         user = authenticate(username=username, password=password)
         
         if user is not None:
-            refresh = RefreshToken.for_user(user)
-            
             return Response({
                 'user': UserDetailSerializer(user).data,
-                'tokens': {
-                    'refresh': str(refresh),
-                    'access': str(refresh.access_token),
-                },
+                'tokens': tokens_for_user(user),
                 'message': 'Login realizado com sucesso!'
             }, status=status.HTTP_200_OK)
         else:
@@ -118,10 +112,17 @@ def refresh_token(request):
     if refresh_token:
         try:
             refresh = RefreshToken(refresh_token)
+            access = refresh.access_token
+            # Claims come from the current account, not from the refresh token
+            user = User.objects.get(pk=refresh[jwt_settings.USER_ID_CLAIM], is_active=True)
+            if refresh.get('auth_hash', auth_hash(user.password)) != auth_hash(user.password):
+                # Issued before a password change
+                raise ValueError('revoked refresh token')
             return Response({
-                'access': str(refresh.access_token),
+                'access': str(set_user_claims(access, user)),
             }, status=status.HTTP_200_OK)
         except Exception as e:
+            jwt_auth_failures.inc(reason='refresh_rejected')
             return Response(
                 {'error': 'Token inválido.'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -131,3 +132,26 @@ def refresh_token(request):
         {'error': 'Token de refresh não fornecido.'},
         status=status.HTTP_400_BAD_REQUEST
     )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def avatar(request, pk):
+    """Serve a resized user avatar (?width=, ?output=webp|jpeg)"""
+    try:
+        user = User.objects.only('avatar').get(pk=pk)
+    except User.DoesNotExist:
+        return Response(
+            {'error': 'Usuário não encontrado.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    response = None
+    if user.avatar:
+        response = preview_response(request, user.avatar.path, 'image')
+    if response is None:
+        return Response(
+            {'error': 'Pré-visualização indisponível.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return response
@@ -0,0 +1,79 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Benchmarks run against a throwaway test database (created and destroyed
+like Django's test runner does), never against db.sqlite3.
+"""
+import os
+import statistics
+import time
+from contextlib import ExitStack, contextmanager
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'english_platform.settings')
+
+import django
+
+django.setup()
+
+from django.conf import settings
+from django.db import connection, connections, reset_queries
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_databases, setup_test_environment, teardown_databases,
+    teardown_test_environment,
+)
+
+
+@contextmanager
+def test_database(name=None):
+    """
+    Creates the test databases (and points the ``readonly`` alias at them)
+    for the duration of the block. ``name`` puts the SQLite database in that
+    file instead of memory, for benchmarks sharing it between processes.
+    Requests keep being sampled by the instrumentation as in production, but
+    get no Server-Timing header and are not logged.
+    """
+    if name:
+        connection.settings_dict['TEST']['NAME'] = name
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    instrumentation = {**getattr(settings, 'COURSES_INSTRUMENTATION', {}), 'SERVER_TIMING': False, 'LOG': False}
+    try:
+        with override_settings(COURSES_INSTRUMENTATION=instrumentation):
+            yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def measure(func, repeat=20, warmup=2):
+    """
+    Calls ``func`` ``repeat`` times and returns latency statistics in
+    milliseconds plus the number of SQL queries of the last call.
+    """
+    for _ in range(warmup):
+        func()
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        reset_queries()
+        with ExitStack() as stack:
+            # Reads may go to the readonly alias
+            captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = sum(len(context) for context in captured)
+    timings.sort()
+    return {
+        'mean_ms': statistics.mean(timings),
+        'p50_ms': percentile(timings, 0.50),
+        'p95_ms': percentile(timings, 0.95),
+        'queries': queries,
+    }
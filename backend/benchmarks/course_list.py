@@ -0,0 +1,80 @@
+"""
+Benchmark for the course and level list endpoints as the catalog grows.
+
+Builds a synthetic catalog in a test database in steps (e.g. 100, 1000 and
+5000 courses, each with a few levels and materials) and after every step
+measures GET /api/courses/ and GET /api/levels/?course=<id>. For
+comparison it also serializes the first page of courses without the count
+annotations, which is what the list did before: one COUNT per row and
+counter.
+
+Usage (from the backend directory):
+    python -m benchmarks.course_list --sizes 100 1000 5000
+"""
+import argparse
+
+from benchmarks.common import measure, test_database
+
+from django.test import Client
+
+from courses.models import Course, Level, Material
+from courses.serializers import CourseListSerializer
+
+
+def grow_catalog(total_courses, levels_per_course, materials_per_level):
+    """Adds courses (with levels and materials) until there are ``total_courses``"""
+    existing = Course.objects.count()
+    missing = total_courses - existing
+    if missing <= 0:
+        return
+    courses = Course.objects.bulk_create(
+        [Course(title=f'Course {existing + i}') for i in range(missing)], batch_size=500,
+    )
+    levels = Level.objects.bulk_create(
+        [
+            Level(course=course, title=f'Level {n}', level_number=n)
+            for course in courses
+            for n in range(1, levels_per_course + 1)
+        ],
+        batch_size=500,
+    )
+    Material.objects.bulk_create(
+        [
+            Material(course=level.course, level=level, title=f'Material {n}', material_type='pdf', order=n)
+            for level in levels
+            for n in range(materials_per_level)
+        ],
+        batch_size=1000,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000], help='Catalog sizes (courses)')
+    parser.add_argument('--levels', type=int, default=5, help='Levels per course')
+    parser.add_argument('--materials', type=int, default=10, help='Materials per level')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    client = Client()
+    with test_database():
+        print(f'{"courses":>8}  {"endpoint":<34}{"mean ms":>9}{"p95 ms":>9}{"queries":>9}')
+        for size in sorted(args.sizes):
+            grow_catalog(size, args.levels, args.materials)
+            course_id = Course.objects.values_list('pk', flat=True).first()
+
+            def unannotated_page():
+                CourseListSerializer(Course.objects.all()[:20], many=True).data
+
+            cases = [
+                ('GET /api/courses/', lambda: client.get('/api/courses/')),
+                ('GET /api/levels/?course=<id>', lambda: client.get(f'/api/levels/?course={course_id}')),
+                ('page without annotations', unannotated_page),
+            ]
+            for name, func in cases:
+                result = measure(func, repeat=args.repeat)
+                print(f'{size:>8}  {name:<34}{result["mean_ms"]:>9.2f}{result["p95_ms"]:>9.2f}{result["queries"]:>9}')
+
+
+if __name__ == '__main__':
+    main()
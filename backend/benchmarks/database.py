@@ -0,0 +1,214 @@
+"""
+Benchmark of concurrent reads and writes against one SQLite file.
+
+Builds a catalog in a file-backed test database and runs ``--processes``
+worker processes for ``--seconds``, each one sending a mix of requests
+through Django's test client: students reading GET /api/courses/,
+/api/courses/<id>/ and /api/materials/?course=<id>, and, for
+``--write-ratio`` of the requests, a teacher editing a course
+(PATCH /api/courses/<id>/) or reordering a level
+(PATCH /api/materials/bulk/). Every database profile is run in turn:
+
+- ``rollback``: the previous setup, rollback journal, synchronous=FULL,
+  deferred transactions, SQLite's default cache, a new connection per
+  request, no readonly alias
+- ``wal``: settings.SQLITE_PROFILE with persistent connections
+- ``wal+readonly``: the same, with reads routed to the readonly alias
+
+and the throughput, latencies and "database is locked" errors of reads and
+writes are reported. The response cache is disabled so every request
+reaches the database.
+
+Usage (from the backend directory):
+    python -m benchmarks.database --processes 8 --seconds 10 --write-ratio 0.1
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from contextlib import closing
+
+from benchmarks.common import percentile, test_database
+
+from django.conf import settings
+from django.db import OperationalError, connections
+from django.test import Client
+from django.test.utils import override_settings
+
+from accounts.models import User
+from accounts.tokens import tokens_for_user
+from courses.database import get_sqlite_profile
+from courses.models import Course, Level, Material
+
+
+PROFILES = {
+    'rollback': {
+        'sqlite': {
+            'JOURNAL_MODE': 'DELETE',
+            'SYNCHRONOUS': 'FULL',
+            'TRANSACTION_MODE': 'DEFERRED',
+            'CACHE_SIZE': 2000 * 1024,
+            'MMAP_SIZE': 0,
+        },
+        'conn_max_age': 0,
+        'read_only': False,
+    },
+    'wal': {'sqlite': {}, 'conn_max_age': 600, 'read_only': False},
+    'wal+readonly': {'sqlite': {}, 'conn_max_age': 600, 'read_only': True},
+}
+
+
+def build_catalog(courses, levels_per_course, materials_per_level):
+    Course.objects.bulk_create([Course(title=f'Course {n}') for n in range(courses)])
+    Level.objects.bulk_create(
+        [
+            Level(course=course, title=f'Level {n}', level_number=n)
+            for course in Course.objects.all()
+            for n in range(1, levels_per_course + 1)
+        ],
+        batch_size=500,
+    )
+    Material.objects.bulk_create(
+        [
+            Material(course_id=level.course_id, level=level, title=f'Material {n}', material_type='pdf', order=n)
+            for level in Level.objects.all()
+            for n in range(materials_per_level)
+        ],
+        batch_size=1000,
+    )
+    teacher = User.objects.create_user('bench-teacher', password='bench-password', user_type='teacher')
+    return tokens_for_user(teacher)['access']
+
+
+def set_journal_mode(path, mode):
+    # journal_mode is stored in the file; switching needs no other connection open
+    with closing(sqlite3.connect(path)) as db:
+        db.execute(f'PRAGMA journal_mode = {mode}')
+
+
+def worker_requests(client, rng, catalog):
+    """(kind, request) for one request of the mix"""
+    course_id = rng.choice(catalog['courses'])
+    if rng.random() >= catalog['write_ratio']:
+        url = rng.choice([
+            '/api/courses/',
+            f'/api/courses/{course_id}/',
+            f'/api/materials/?course={course_id}',
+        ])
+        return 'read', lambda: client.get(url)
+    if rng.random() < 0.5:
+        data = {'description': f'Edited {rng.random()}'}
+        return 'write', lambda: client.patch(f'/api/courses/{course_id}/', data, content_type='application/json')
+    material_ids = catalog['levels'][rng.choice(list(catalog['levels']))]
+    order = list(range(len(material_ids)))
+    rng.shuffle(order)
+    changes = [{'id': pk, 'order': n} for pk, n in zip(material_ids, order)]
+    return 'write', lambda: client.patch('/api/materials/bulk/', changes, content_type='application/json')
+
+
+def run_worker(job):
+    """Sends requests until the deadline; returns latencies (ms) and errors by kind"""
+    number, profile, catalog, deadline = job
+    # Failed requests are counted, not logged with their traceback
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    for alias in connections:
+        connections[alias].settings_dict['CONN_MAX_AGE'] = profile['conn_max_age']
+    routers = settings.DATABASE_ROUTERS if profile['read_only'] else []
+    results = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+    with override_settings(
+        SQLITE_PROFILE={**get_sqlite_profile(), **profile['sqlite']},
+        DATABASE_ROUTERS=routers,
+        COURSES_RESPONSE_CACHE={'ENABLED': False},
+    ):
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {catalog["token"]}')
+        rng = random.Random(number)
+        while time.time() < deadline:
+            kind, request = worker_requests(client, rng, catalog)
+            started = time.perf_counter()
+            try:
+                response = request()
+            except OperationalError:
+                # "database is locked" once busy_timeout ran out
+                errors[kind] += 1
+                continue
+            if response.status_code >= 400:
+                errors[kind] += 1
+                continue
+            results[kind].append((time.perf_counter() - started) * 1000)
+    connections.close_all()
+    return results, errors
+
+
+def run_profile(name, profile, path, catalog, processes, seconds):
+    set_journal_mode(path, profile['sqlite'].get('JOURNAL_MODE', get_sqlite_profile()['JOURNAL_MODE']))
+    deadline = time.time() + seconds
+    jobs = [(number, profile, catalog, deadline) for number in range(processes)]
+    with multiprocessing.get_context('fork').Pool(processes) as pool:
+        outcomes = pool.map(run_worker, jobs)
+
+    summary = {'profile': name}
+    for kind in ('read', 'write'):
+        latencies = sorted(latency for results, _ in outcomes for latency in results[kind])
+        summary[kind] = {
+            'per_s': len(latencies) / seconds,
+            'mean_ms': statistics.mean(latencies) if latencies else 0.0,
+            'p95_ms': percentile(latencies, 0.95),
+            'errors': sum(errors[kind] for _, errors in outcomes),
+        }
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=8, help='Worker processes')
+    parser.add_argument('--seconds', type=float, default=10, help='Duration of each profile')
+    parser.add_argument('--write-ratio', type=float, default=0.1, help='Share of requests that write')
+    parser.add_argument('--courses', type=int, default=50)
+    parser.add_argument('--levels', type=int, default=5, help='Levels per course')
+    parser.add_argument('--materials', type=int, default=20, help='Materials per level')
+    parser.add_argument('--profiles', nargs='+', default=list(PROFILES), choices=PROFILES)
+    args = parser.parse_args(argv)
+
+    if connections['default'].vendor != 'sqlite':
+        parser.error('this benchmark needs DATABASE_PROFILE=sqlite')
+    directory = tempfile.mkdtemp(prefix='bench-db-')
+    path = os.path.join(directory, 'db.sqlite3')
+    try:
+        with test_database(name=path):
+            token = build_catalog(args.courses, args.levels, args.materials)
+            levels = {}
+            for level_id, pk in Material.objects.order_by('level', 'order').values_list('level', 'pk'):
+                levels.setdefault(level_id, []).append(pk)
+            catalog = {
+                'token': token,
+                'courses': list(Course.objects.values_list('pk', flat=True)),
+                'levels': levels,
+                'write_ratio': args.write_ratio,
+            }
+            # The workers are forked and open their own connections
+            connections.close_all()
+
+            print(
+                f'{"profile":<14}{"reads/s":>9}{"read p95":>10}{"read err":>10}'
+                f'{"writes/s":>10}{"write p95":>11}{"write err":>11}'
+            )
+            for name in args.profiles:
+                summary = run_profile(name, PROFILES[name], path, catalog, args.processes, args.seconds)
+                read, write = summary['read'], summary['write']
+                print(
+                    f'{name:<14}{read["per_s"]:>9.1f}{read["p95_ms"]:>10.1f}{read["errors"]:>10}'
+                    f'{write["per_s"]:>10.1f}{write["p95_ms"]:>11.1f}{write["errors"]:>11}'
+                )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Benchmark for the material file serving backends.
+
+Drives MaterialViewSet.file through Django's WSGI handler with a pool of
+threads standing in for WSGI workers and reports, for every value of
+MATERIALS_SERVE_BACKEND, the request throughput, the bytes moved by the
+worker itself and how long each request kept its worker busy (the time
+until the response body has been fully handed over).
+
+With the proxy backends (x-accel-redirect, x-sendfile) the body is sent by
+the proxy, so only the worker side is measured. The 'sendfile' backend is
+run with a wsgi.file_wrapper that behaves like gunicorn's and pushes the
+file to /dev/null with os.sendfile.
+
+Usage (from the backend directory):
+    python -m benchmarks.file_serving --size-mb 64 --workers 8 --requests 200
+"""
+import argparse
+import io
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import test_database
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.test.utils import override_settings
+
+from courses.file_serving import SERVE_BACKENDS
+from courses.models import Material
+
+
+class SendfileWrapper:
+    """wsgi.file_wrapper that mimics gunicorn: os.sendfile bounded by Content-Length"""
+
+    def __init__(self, filelike, block_size=8192):
+        self.filelike = filelike
+        self.block_size = block_size
+
+    def __iter__(self):
+        return iter(lambda: self.filelike.read(self.block_size), b'')
+
+    def close(self):
+        self.filelike.close()
+
+
+def make_environ(path, range_header=None):
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'testserver',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'wsgi.file_wrapper': SendfileWrapper,
+    }
+    if range_header:
+        environ['HTTP_RANGE'] = range_header
+    return environ
+
+
+def run_request(app, path, sink_fd, range_header=None):
+    """Runs one request and returns (worker seconds, bytes written by the worker)"""
+    captured = {}
+
+    def start_response(status, headers, exc_info=None):
+        captured['status'] = status
+        captured['headers'] = dict(headers)
+
+    started = time.perf_counter()
+    result = app(make_environ(path, range_header), start_response)
+    sent = 0
+    try:
+        if isinstance(result, SendfileWrapper) and hasattr(result.filelike, 'fileno'):
+            fileno = result.filelike.fileno()
+            offset = os.lseek(fileno, 0, os.SEEK_CUR)
+            remaining = int(captured['headers'].get('Content-Length', 0))
+            while remaining > 0:
+                count = os.sendfile(sink_fd, fileno, offset, min(remaining, 1 << 20))
+                if count == 0:
+                    break
+                offset += count
+                remaining -= count
+                sent += count
+        else:
+            for chunk in result:
+                os.write(sink_fd, chunk)
+                sent += len(chunk)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return time.perf_counter() - started, sent
+
+
+def benchmark_backend(backend, path, file_size, workers, requests, range_size):
+    app = WSGIHandler()
+    sink_fd = os.open(os.devnull, os.O_WRONLY)
+    local = random.Random(42)
+
+    def one(_):
+        range_header = None
+        if range_size:
+            start = local.randrange(0, max(file_size - range_size, 1))
+            range_header = f'bytes={start}-{start + range_size - 1}'
+        return run_request(app, path, sink_fd, range_header)
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(one, range(requests)))
+        elapsed = time.perf_counter() - started
+    finally:
+        os.close(sink_fd)
+
+    busy = sorted(seconds for seconds, _ in results)
+    return {
+        'backend': backend,
+        'requests': requests,
+        'workers': workers,
+        'elapsed_s': elapsed,
+        'requests_per_s': requests / elapsed,
+        'worker_mb_per_s': sum(sent for _, sent in results) / elapsed / (1024 * 1024),
+        'worker_busy_mean_ms': statistics.mean(busy) * 1000,
+        'worker_busy_p95_ms': busy[int(len(busy) * 0.95) - 1] * 1000,
+        # Share of the wall clock the worker pool spent pinned by transfers
+        'worker_occupancy': sum(busy) / (elapsed * workers),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=32, help='Size of the served file')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent worker threads')
+    parser.add_argument('--requests', type=int, default=100, help='Total requests per backend')
+    parser.add_argument('--range-kb', type=int, default=0, help='Request random ranges of this size instead of the full file')
+    parser.add_argument('--backends', nargs='+', default=list(SERVE_BACKENDS), choices=SERVE_BACKENDS)
+    args = parser.parse_args(argv)
+
+    with test_database():
+        materials_root = tempfile.mkdtemp(prefix='bench-materials-')
+        try:
+            file_size = args.size_mb * 1024 * 1024
+            with open(os.path.join(materials_root, 'lesson.mp3'), 'wb') as f:
+                block = os.urandom(1024 * 1024)
+                for _ in range(args.size_mb):
+                    f.write(block)
+            material = Material.objects.create(title='lesson.mp3', file_path='lesson.mp3', material_type='mp3')
+            path = f'/api/materials/{material.pk}/file/'
+
+            print(f'{"backend":<18}{"req/s":>10}{"worker MB/s":>14}{"busy mean ms":>15}{"busy p95 ms":>14}{"occupancy":>11}')
+            for backend in args.backends:
+                with override_settings(
+                    MATERIALS_ROOT=materials_root,
+                    MATERIALS_SERVE_BACKEND=backend,
+                    MATERIALS_ACCEL_REDIRECT_LOCATIONS={materials_root: '/protected/materials/'},
+                ):
+                    result = benchmark_backend(
+                        backend, path, file_size, args.workers, args.requests, args.range_kb * 1024,
+                    )
+                print(
+                    f'{backend:<18}{result["requests_per_s"]:>10.1f}{result["worker_mb_per_s"]:>14.1f}'
+                    f'{result["worker_busy_mean_ms"]:>15.2f}{result["worker_busy_p95_ms"]:>14.2f}'
+                    f'{result["worker_occupancy"]:>11.0%}'
+                )
+        finally:
+            shutil.rmtree(materials_root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
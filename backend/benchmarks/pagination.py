@@ -0,0 +1,84 @@
+"""
+Benchmark of deep pages of the material list: page numbers against cursors.
+
+Builds a synthetic catalog of ``--materials`` materials in a test database
+(with many equal ``order`` values, as in real courses) and measures the
+first, middle and last pages of GET /api/materials/ both as ``?page=N``
+(COUNT(*) plus OFFSET) and as ``?cursor=`` (a seek on the ordering index).
+The cursor for a given depth is built from the row just before it, which is
+what a client walking the ``next`` links would send.
+
+The response cache is disabled so every request reaches the database.
+
+Usage (from the backend directory):
+    python -m benchmarks.pagination --materials 100000
+"""
+import argparse
+
+from benchmarks.common import measure, test_database
+
+from django.test import Client
+from django.test.utils import override_settings
+
+from courses.models import Course, Level, Material
+from courses.pagination import MaterialPagination
+
+
+def grow_materials(total, per_level=50):
+    """Adds materials (spread over levels of one course) until there are ``total``"""
+    missing = total - Material.objects.count()
+    if missing <= 0:
+        return
+    course = Course.objects.create(title='Benchmark course')
+    levels = Level.objects.bulk_create(
+        [Level(course=course, title=f'Level {n}', level_number=n) for n in range(1, missing // per_level + 2)],
+        batch_size=500,
+    )
+    Material.objects.bulk_create(
+        [
+            Material(
+                course=course, level=levels[i // per_level], title=f'Material {i}',
+                material_type='pdf', order=i % per_level,
+            )
+            for i in range(missing)
+        ],
+        batch_size=2000,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--materials', type=int, default=100000, help='Catalog size (materials)')
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    client = Client()
+    paginator = MaterialPagination()
+    with test_database(), override_settings(COURSES_RESPONSE_CACHE={'ENABLED': False}):
+        grow_materials(args.materials)
+        total = Material.objects.count()
+        last_page = (total - 1) // args.page_size + 1
+
+        print(f'{"materials":>10}  {"depth":<8}{"style":<8}{"mean ms":>9}{"p95 ms":>9}{"queries":>9}')
+        for depth, page in (('first', 1), ('middle', last_page // 2), ('last', last_page)):
+            offset = (page - 1) * args.page_size
+            if offset:
+                previous_row = Material.objects.order_by(*paginator.ordering)[offset - 1]
+                cursor = f'cursor={paginator.encode_cursor(False, previous_row)}'
+            else:
+                cursor = 'pagination=cursor'
+            cases = [
+                ('page', f'/api/materials/?page={page}&page_size={args.page_size}'),
+                ('cursor', f'/api/materials/?{cursor}&page_size={args.page_size}'),
+            ]
+            for style, url in cases:
+                result = measure(lambda: client.get(url), repeat=args.repeat)
+                print(
+                    f'{total:>10}  {depth:<8}{style:<8}'
+                    f'{result["mean_ms"]:>9.2f}{result["p95_ms"]:>9.2f}{result["queries"]:>9}'
+                )
+
+
+if __name__ == '__main__':
+    main()
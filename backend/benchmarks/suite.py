@@ -0,0 +1,295 @@
+"""
+Reproducible benchmark suite of the main endpoints.
+
+Generates a catalog with ``manage.py generate_catalog`` (sparse files in a
+temporary MATERIALS_ROOT, thousands of users) in a test database, then
+measures through Django's test client, one request at a time:
+
+- course list and detail, material lists filtered by course and by level
+- file serving, the whole file and 64 KiB ranges ('python' backend, so the
+  worker streams every byte)
+- a resumable upload (open, one PUT, finalize)
+- login (password hashing included)
+- scans of the generated tree, full and incremental
+
+For every scenario the latency (mean, p50, p95), the throughput of a single
+client and the SQL queries of one call are written to a JSON file
+(``benchmarks/results/suite-<time>.json`` by default) along with the
+parameters, the commit and the versions, and compared with an earlier file
+when ``--compare`` is given. The response cache is disabled unless
+``--cache`` is passed.
+
+Usage (from the backend directory):
+    python -m benchmarks.suite --courses 20 --levels 5 --materials 20 --users 2000
+    python -m benchmarks.suite --compare benchmarks/results/suite-20240101-120000.json
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+
+from benchmarks.common import measure, test_database
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+
+from accounts.models import User
+from accounts.tokens import tokens_for_user
+from courses.models import Course, Level, Material
+from courses.scanner import MaterialScanner
+
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+RANGE_SIZE = 64 * 1024
+
+# (name, Scenarios method), in the order they are run and reported
+SCENARIOS = [
+    ('course list', 'course_list'),
+    ('course detail', 'course_detail'),
+    ('materials by course', 'materials_by_course'),
+    ('materials by level', 'materials_by_level'),
+    ('file full', 'file_full'),
+    ('file range', 'file_range'),
+    ('upload', 'upload'),
+    ('login', 'login'),
+    ('scan full', 'scan_full'),
+    ('scan incremental', 'scan_incremental'),
+]
+
+# Scenarios whose calls take seconds get fewer repetitions
+SLOW_SCENARIOS = ('login', 'scan full', 'scan incremental')
+
+
+class UnexpectedResponse(Exception):
+    """A benchmarked request did not succeed; its timings would be meaningless"""
+
+
+def check(response, expected=200):
+    if response.status_code != expected:
+        raise UnexpectedResponse(f'{response.status_code} instead of {expected}: {response.content[:200]!r}')
+    return response
+
+
+def consume(response):
+    """Reads the body like a WSGI server would; returns its size"""
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    response.close()
+    return size
+
+
+class Scenarios:
+    """The benchmarked calls, against the generated catalog"""
+
+    def __init__(self, materials_root, password, upload_size):
+        self.materials_root = materials_root
+        self.password = password
+        self.upload_size = upload_size
+        self.anonymous = Client()
+        self.student = User.objects.filter(user_type='student').order_by('pk').first()
+        teacher = User.objects.filter(user_type='teacher').order_by('pk').first()
+        self.teacher = Client(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(teacher)["access"]}')
+        courses = list(Course.objects.order_by('pk').values_list('pk', flat=True))
+        self.course_id = courses[len(courses) // 2]
+        self.level_id = Level.objects.filter(course=self.course_id).order_by('level_number').values_list(
+            'pk', flat=True,
+        ).first()
+        self.material = Material.objects.filter(course=self.course_id, material_type='pdf').order_by('pk').first()
+
+    def all(self):
+        """``{name: callable}``, in the order they are run and reported"""
+        return {name: getattr(self, method) for name, method in SCENARIOS}
+
+    def course_list(self):
+        return consume(check(self.anonymous.get('/api/courses/')))
+
+    def course_detail(self):
+        return consume(check(self.anonymous.get(f'/api/courses/{self.course_id}/')))
+
+    def materials_by_course(self):
+        return consume(check(self.anonymous.get('/api/materials/', {'course': self.course_id})))
+
+    def materials_by_level(self):
+        return consume(check(self.anonymous.get('/api/materials/', {'level': self.level_id})))
+
+    def file_full(self):
+        return consume(check(self.anonymous.get(f'/api/materials/{self.material.pk}/file/')))
+
+    def file_range(self):
+        start = self.material.file_size // 2
+        response = self.anonymous.get(
+            f'/api/materials/{self.material.pk}/file/', HTTP_RANGE=f'bytes={start}-{start + RANGE_SIZE - 1}',
+        )
+        return consume(check(response, 206))
+
+    def upload(self):
+        response = check(self.teacher.post('/api/materials/uploads/', {
+            # No metadata reader for this extension: nothing to warn about the zeros
+            'filename': 'bench-upload.zip',
+            'size': self.upload_size,
+            'course': self.course_id,
+            'level': self.level_id,
+        }, content_type='application/json'), 201)
+        upload_id = response.json()['id']
+        check(self.teacher.put(
+            f'/api/materials/uploads/{upload_id}/', b'\0' * self.upload_size,
+            content_type='application/octet-stream', HTTP_UPLOAD_OFFSET='0',
+        ))
+        check(self.teacher.post(f'/api/materials/uploads/{upload_id}/finalize/'), 201)
+        return self.upload_size
+
+    def login(self):
+        response = self.anonymous.post(
+            '/api/auth/login/', {'username': self.student.username, 'password': self.password},
+            content_type='application/json',
+        )
+        return consume(check(response))
+
+    def scan_full(self):
+        return MaterialScanner(self.materials_root, full=True).run().existing_count
+
+    def scan_incremental(self):
+        return MaterialScanner(self.materials_root).run().existing_count
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args, materials_root):
+    call_command(
+        'generate_catalog',
+        courses=args.courses, levels=args.levels, materials=args.materials, users=args.users,
+        root=materials_root, password=args.password, seed=args.seed, stdout=io.StringIO(),
+    )
+    scenarios = Scenarios(materials_root, args.password, args.upload_kb * 1024)
+    results = {}
+    for name, func in scenarios.all().items():
+        if args.scenarios and name not in args.scenarios:
+            continue
+        sizes = []
+
+        def call():
+            sizes.append(func())
+
+        repeat = args.slow_repeat if name in SLOW_SCENARIOS else args.repeat
+        result = measure(call, repeat=repeat, warmup=1)
+        result['repeat'] = repeat
+        # One client sending requests back to back
+        result['per_s'] = 1000 / result['mean_ms'] if result['mean_ms'] else 0.0
+        if name.startswith(('file', 'upload')):
+            result['bytes'] = sizes[-1]
+            result['mb_per_s'] = sizes[-1] * result['per_s'] / (1024 * 1024)
+        results[name] = result
+        print_row(name, result)
+    return results
+
+
+def print_header():
+    print(f'{"scenario":<22}{"mean ms":>10}{"p50 ms":>10}{"p95 ms":>10}{"req/s":>10}{"queries":>9}')
+
+
+def print_row(name, result):
+    print(
+        f'{name:<22}{result["mean_ms"]:>10.2f}{result["p50_ms"]:>10.2f}{result["p95_ms"]:>10.2f}'
+        f'{result["per_s"]:>10.1f}{result["queries"]:>9}'
+    )
+
+
+def compare(report, previous):
+    """Prints the change of every scenario against an earlier report"""
+    print(f'\nCompared with {previous["created_at"]} ({previous.get("commit") or "unknown commit"})')
+    if previous['parameters'] != report['parameters']:
+        print('Warning: the runs used different parameters')
+    print(f'{"scenario":<22}{"before ms":>11}{"after ms":>10}{"change":>9}{"queries":>12}')
+    for name, result in report['results'].items():
+        before = previous['results'].get(name)
+        if before is None:
+            continue
+        change = (result['mean_ms'] - before['mean_ms']) / before['mean_ms'] if before['mean_ms'] else 0.0
+        queries = f'{before["queries"]} -> {result["queries"]}'
+        print(f'{name:<22}{before["mean_ms"]:>11.2f}{result["mean_ms"]:>10.2f}{change:>+9.1%}{queries:>12}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=20)
+    parser.add_argument('--levels', type=int, default=5, help='Levels per course')
+    parser.add_argument('--materials', type=int, default=20, help='Materials per level')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--password', default='bench-password', help='Password of the generated users')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the generated file sizes')
+    parser.add_argument('--upload-kb', type=int, default=1024, help='Size of the uploaded file')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--slow-repeat', type=int, default=5, help=f'Repetitions of {", ".join(SLOW_SCENARIOS)}')
+    parser.add_argument('--cache', action='store_true', help='Enable the response cache')
+    parser.add_argument('--scenarios', nargs='+', choices=[name for name, _ in SCENARIOS], metavar='SCENARIO',
+                        help='Only run these scenarios')
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/suite-<time>.json)')
+    parser.add_argument('--compare', help='Earlier results file to compare with')
+    args = parser.parse_args(argv)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    started = datetime.datetime.now(datetime.timezone.utc)
+    materials_root = tempfile.mkdtemp(prefix='bench-catalog-')
+    media_root = tempfile.mkdtemp(prefix='bench-media-')
+    try:
+        with test_database(), override_settings(
+            MATERIALS_ROOT=materials_root,
+            MEDIA_ROOT=media_root,
+            MATERIALS_SERVE_BACKEND='python',
+            COURSES_RESPONSE_CACHE={**getattr(settings, 'COURSES_RESPONSE_CACHE', {}), 'ENABLED': args.cache},
+        ):
+            print_header()
+            results = run_suite(args, materials_root)
+            vendor = connection.vendor
+    finally:
+        shutil.rmtree(materials_root, ignore_errors=True)
+        shutil.rmtree(media_root, ignore_errors=True)
+
+    parameters = {
+        key: value for key, value in vars(args).items() if key not in ('scenarios', 'output', 'compare')
+    }
+    report = {
+        'created_at': started.isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': vendor,
+        'platform': platform.platform(),
+        'parameters': parameters,
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIRECTORY, f'suite-{started:%Y%m%d-%H%M%S}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nResults written to {output}')
+    if previous is not None:
+        compare(report, previous)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,22 @@
 from django.contrib import admin
-from .models import Course, Lesson, Material, Level
+from .models import Course, CourseProgress, Lesson, Material, MaterialProgress, Level, UploadSession
+from .search import search_ids
+
+
+class SearchIndexAdminMixin:
+    """Admin search through the full-text index; ``search_fields`` (icontains) where there is none"""
+    search_kind = None
+    
+    def get_search_results(self, request, queryset, search_term):
+        ids = search_ids(self.search_kind, search_term) if search_term.strip() else None
+        if ids is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=ids), False
 
 
 @admin.register(Course)
-class CourseAdmin(admin.ModelAdmin):
+class CourseAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
+    search_kind = 'course'
     list_display = ['title', 'level', 'created_at']
     list_filter = ['level', 'created_at']
     search_fields = ['title', 'description']
@@ -11,7 +24,8 @@ class CourseAdmin(admin.ModelAdmin):
 
 
 @admin.register(Level)
-class LevelAdmin(admin.ModelAdmin):
+class LevelAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
+    search_kind = 'level'
     list_display = ['title', 'course', 'level_number', 'order']
     list_filter = ['course']
     search_fields = ['title', 'description']
@@ -19,15 +33,37 @@ class LevelAdmin(admin.ModelAdmin):
 
 
 @admin.register(Lesson)
-class LessonAdmin(admin.ModelAdmin):
+class LessonAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
+    search_kind = 'lesson'
     list_display = ['title', 'course', 'order']
     list_filter = ['course']
     search_fields = ['title', 'description']
 
 
 @admin.register(Material)
-class MaterialAdmin(admin.ModelAdmin):
+class MaterialAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
+    search_kind = 'material'
     list_display = ['title', 'material_type', 'course', 'level', 'lesson', 'order']
     list_filter = ['material_type', 'course', 'level']
     search_fields = ['title', 'file_path']
-    readonly_fields = ['created_at']
\ No newline at end of file
+    readonly_fields = ['created_at']
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['file_name', 'user', 'course', 'offset', 'size', 'updated_at']
+    readonly_fields = ['file_name', 'size', 'offset', 'created_at', 'updated_at']
+
+
+@admin.register(MaterialProgress)
+class MaterialProgressAdmin(admin.ModelAdmin):
+    list_display = ['user', 'material', 'percent', 'completed', 'event_at']
+    list_filter = ['completed']
+    raw_id_fields = ['user', 'material']
+
+
+@admin.register(CourseProgress)
+class CourseProgressAdmin(admin.ModelAdmin):
+    list_display = ['user', 'course', 'completed_materials', 'total_materials', 'percent', 'last_activity_at']
+    list_filter = ['course']
+    raw_id_fields = ['user', 'course']
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CoursesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'courses'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        from .database import configure_connection
+        from .instrumentation import instrument_connection
+
+        connection_created.connect(configure_connection, dispatch_uid='courses.database.configure_connection')
+        connection_created.connect(instrument_connection, dispatch_uid='courses.instrumentation.instrument_connection')
@@ -0,0 +1,195 @@
+"""
+Native async view serving material files, for deployments running under
+ASGI (uvicorn, daphne, hypercorn).
+
+Authentication, permission checks and the Material lookup go through
+``MaterialViewSet`` itself, in a single ``sync_to_async`` hop, so the rules
+are the same as for ``MaterialViewSet.file``. The file is then streamed by
+an async generator that reads one chunk at a time in the default executor:
+Django's ASGI handler awaits ``send()`` for every chunk and the server only
+resolves it once the transport buffer has drained, so a slow client never
+makes us read ahead of what it has received and no thread is held while a
+download is in progress.
+
+Responses carry the same status codes and headers as the sync view (Range,
+If-Range, conditional GET, Content-Disposition and CORS headers). The proxy
+backends (``x-accel-redirect``, ``x-sendfile``) are honoured; ``sendfile``
+has no ASGI equivalent and is streamed like ``python``.
+
+Enabled with ``settings.MATERIALS_ASYNC_FILE_VIEW``.
+"""
+import asyncio
+import os
+import secrets
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+from .conditional import check_preconditions, file_etag, set_validator_headers
+from .file_serving import (
+    _multipart_parts, build_offload_response, get_content_type, get_offload_header,
+    multipart_content_length, requested_ranges, set_material_headers, set_range_headers,
+)
+from .metrics import track_file_stream
+from .views import MaterialViewSet
+
+
+# Bytes read per executor call while streaming
+ASYNC_CHUNK_SIZE = 256 * 1024
+
+ACTIONS = {'get': 'file', 'head': 'file'}
+
+
+def _finalize(view, request, response):
+    response = view.finalize_response(request, response)
+    response.render()
+    return response
+
+
+def _resolve_material_file(request, pk):
+    """
+    Runs the DRF side of ``MaterialViewSet.file`` (authentication,
+    permissions, throttling, object lookup) and stats the file.
+
+    Returns ``(user, material_type, file_path, stat, offload_header)`` or a
+    rendered error response.
+    """
+    view = MaterialViewSet(action_map=ACTIONS)
+    view.args, view.kwargs = (), {'pk': pk}
+    request = view.initialize_request(request, pk=pk)
+    view.request = request
+    view.headers = view.default_response_headers
+    try:
+        view.initial(request)
+        material = view.get_object()
+    except Http404:
+        return _finalize(view, request, Response(
+            {'error': f'Material with id {pk} not found'},
+            status=status.HTTP_404_NOT_FOUND
+        ))
+    except APIException as exc:
+        return _finalize(view, request, view.handle_exception(exc))
+
+    file_path = material.get_full_path()
+    if not file_path:
+        return _finalize(view, request, Response(
+            {'error': f'Material {pk} does not have a file path configured'},
+            status=status.HTTP_404_NOT_FOUND
+        ))
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return _finalize(view, request, Response(
+            {'error': f'File not found at path: {file_path}'},
+            status=status.HTTP_404_NOT_FOUND
+        ))
+    return request.user, material.material_type, file_path, stat, get_offload_header(file_path)
+
+
+def _read_at(file_handle, position, size):
+    file_handle.seek(position)
+    return file_handle.read(size)
+
+
+async def _stream_parts(file_handle, parts):
+    """
+    Yields ``parts`` in order: ``bytes`` items as they are, ``(start, end)``
+    items as the inclusive byte range of the file read in chunks.
+    """
+    try:
+        for part in parts:
+            if isinstance(part, bytes):
+                yield part
+                continue
+            position, end = part
+            while position <= end:
+                chunk = await asyncio.to_thread(
+                    _read_at, file_handle, position, min(ASYNC_CHUNK_SIZE, end - position + 1),
+                )
+                if not chunk:
+                    break
+                position += len(chunk)
+                yield chunk
+    finally:
+        file_handle.close()
+
+
+async def build_async_file_response(request, file_path, content_type, etag, stat):
+    """Async counterpart of ``file_serving.build_file_response``"""
+    size = stat.st_size
+    ranges = requested_ranges(request, size, etag, stat.st_mtime)
+
+    if ranges == []:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        set_range_headers(response, stat, etag)
+        return response
+
+    if not ranges:
+        status_code, parts, length = 200, [(0, size - 1)], size
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        status_code, parts, length = 206, [(start, end)], end - start + 1
+    else:
+        status_code = 206
+        boundary = secrets.token_hex(16)
+        part_headers, closing = _multipart_parts(ranges, size, content_type, boundary)
+        parts = [item for header, byte_range in zip(part_headers, ranges) for item in (header, byte_range)]
+        parts.append(closing)
+        length = multipart_content_length(ranges, part_headers, closing)
+        content_type = f'multipart/byteranges; boundary={boundary}'
+
+    if request.method == 'HEAD' or size == 0:
+        response = HttpResponse(status=status_code, content_type=content_type)
+    else:
+        file_handle = await asyncio.to_thread(open, file_path, 'rb')
+        response = StreamingHttpResponse(
+            _stream_parts(file_handle, parts), status=status_code, content_type=content_type,
+        )
+        # Closes the file when the client goes away before the end
+        response._resource_closers.append(file_handle.close)
+    response['Content-Length'] = str(length)
+    if status_code == 206 and len(ranges) == 1:
+        response['Content-Range'] = f'bytes {ranges[0][0]}-{ranges[0][1]}/{size}'
+    set_range_headers(response, stat, etag)
+    return response
+
+
+async def material_file(request, pk):
+    """Serve the material file"""
+    if request.method not in ('GET', 'HEAD'):
+        # OPTIONS and friends keep the DRF behaviour
+        return await sync_to_async(MaterialViewSet.as_view({'get': 'file'}))(request, pk=pk)
+
+    resolved = await sync_to_async(_resolve_material_file)(request, pk)
+    if isinstance(resolved, HttpResponse):
+        return resolved
+    user, material_type, file_path, stat, offload_header = resolved
+
+    etag = file_etag(stat)
+    not_modified = check_preconditions(request, etag, stat.st_mtime)
+    if not_modified is not None:
+        return not_modified
+
+    content_type = get_content_type(file_path)
+    try:
+        if offload_header is not None:
+            response = build_offload_response(offload_header, content_type, stat, etag)
+        else:
+            response = await build_async_file_response(request, file_path, content_type, etag, stat)
+    except IOError as e:
+        return JsonResponse(
+            {'error': f'Error opening file: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    set_validator_headers(response, etag, stat.st_mtime)
+    set_material_headers(response, user, file_path)
+    return track_file_stream(request, response, material_type)
+
+
+# DRF enforces CSRF itself for session-authenticated unsafe methods.
+# (csrf_exempt() cannot wrap coroutine functions before Django 5.0.)
+material_file.csrf_exempt = True
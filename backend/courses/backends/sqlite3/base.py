@@ -0,0 +1,20 @@
+"""
+SQLite backend whose transactions take the write lock when they begin.
+
+Django opens atomic blocks with a plain (deferred) BEGIN: the transaction
+reads first and asks for the write lock at its first write. When another
+connection committed in between, SQLite cannot upgrade the snapshot and
+fails at once with "database is locked", busy_timeout or not. With
+``SQLITE_PROFILE['TRANSACTION_MODE'] = 'IMMEDIATE'`` the lock is taken by
+BEGIN, so concurrent writers wait their turn instead (Django 5.1 has this
+as the ``transaction_mode`` option).
+"""
+from django.db.backends.sqlite3 import base
+
+from courses.database import get_sqlite_profile
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {get_sqlite_profile()["TRANSACTION_MODE"]}')
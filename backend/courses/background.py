@@ -0,0 +1,56 @@
+"""
+Small bounded thread pool for follow-up work that must not hold a request
+open (content hashing, ...).
+
+Jobs are idempotent and picked up again by the next scan, so when the pool
+is saturated new jobs are dropped instead of queueing without bound.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            workers = getattr(settings, 'COURSES_BACKGROUND_WORKERS', 2)
+            queue_size = getattr(settings, 'COURSES_BACKGROUND_QUEUE_SIZE', 32)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='courses-background')
+            _slots = threading.BoundedSemaphore(workers + queue_size)
+        return _executor
+
+
+def _run(func, args, kwargs):
+    close_old_connections()
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('Background job %s failed', getattr(func, '__name__', func))
+    finally:
+        # Worker threads keep their own DB connections; do not leak them
+        connections.close_all()
+        _slots.release()
+
+
+def submit(func, *args, **kwargs):
+    """
+    Runs ``func(*args, **kwargs)`` in the background pool.
+
+    Returns ``False`` (and runs nothing) when the pool is saturated.
+    """
+    executor = _get_executor()
+    if not _slots.acquire(blocking=False):
+        logger.warning('Background pool is full, dropping %s', getattr(func, '__name__', func))
+        return False
+    executor.submit(_run, func, args, kwargs)
+    return True
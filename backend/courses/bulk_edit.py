@@ -0,0 +1,255 @@
+"""
+Bulk reorder / reassign of materials and levels.
+
+Rearranging a level used to take one PATCH per material, each one its own
+request, transaction and ``save()``. ``PATCH /api/materials/bulk/`` and
+``PATCH /api/levels/bulk/`` take every change at once: the rows are locked
+and validated together, written with ``bulk_update`` in one transaction, and
+the response cache scopes and the ETag / Last-Modified timestamps of the
+courses and levels involved are bumped once, after the commit.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import background
+from .cache import CATALOG_SCOPE, course_scope, invalidate_scopes, level_scope
+from .models import Course, Lesson, Level, Material
+from .progress import refresh_courses
+from .search import index_objects
+
+
+# Changes accepted per request
+MAX_BULK_CHANGES = 1000
+
+# Rows per UPDATE statement
+BULK_CHANGE_BATCH_SIZE = 500
+
+MATERIAL_CHANGE_FIELDS = ['order', 'level', 'lesson']
+LEVEL_CHANGE_FIELDS = ['order', 'level_number', 'course']
+
+
+class BulkChangeError(Exception):
+    """Some changes are invalid; nothing was written"""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def _lock_rows(model, changes, fields):
+    """``{pk: row}`` of the changed rows, locked until the transaction ends"""
+    ids = [change['id'] for change in changes]
+    columns = ['pk', 'updated_at', *(model._meta.get_field(field).attname for field in fields)]
+    return model.objects.select_for_update().only(*columns).in_bulk(ids)
+
+
+def _check_ids(changes, rows):
+    """Raises BulkChangeError for repeated or unknown ids"""
+    errors = []
+    seen = set()
+    for change in changes:
+        if change['id'] in seen:
+            errors.append({'id': change['id'], 'error': 'Id repetido.'})
+        elif change['id'] not in rows:
+            errors.append({'id': change['id'], 'error': 'Não encontrado.'})
+        seen.add(change['id'])
+    if errors:
+        raise BulkChangeError(errors)
+
+
+def _changed_fields(changes, fields):
+    return [field for field in fields if any(field in change for change in changes)]
+
+
+def _touch(course_ids, level_ids, now):
+    """
+    Moves the timestamps the ETag / Last-Modified validators read: rows that
+    leave a course or level leave no timestamp behind otherwise.
+    """
+    Course.objects.filter(pk__in=course_ids).update(updated_at=now)
+    if level_ids:
+        Level.objects.filter(pk__in=level_ids).update(updated_at=now)
+
+
+def _after_commit(course_ids, level_ids, moved_course_ids):
+    scopes = {CATALOG_SCOPE}
+    scopes.update(course_scope(pk) for pk in course_ids)
+    scopes.update(level_scope(pk) for pk in level_ids)
+    transaction.on_commit(lambda: invalidate_scopes(*scopes))
+    if moved_course_ids:
+        # Material totals of the progress summaries
+        transaction.on_commit(lambda: background.submit(refresh_courses, moved_course_ids))
+
+
+def apply_material_changes(changes):
+    """
+    Applies ``[{'id', 'order'?, 'level'?, 'lesson'?}, ...]`` (see
+    MaterialChangeSerializer) and returns the updated materials. A new level
+    or lesson must belong to the course of the material, when it has one,
+    and to the same course as each other. Raises BulkChangeError without
+    writing anything when a change is invalid.
+    """
+    fields = _changed_fields(changes, MATERIAL_CHANGE_FIELDS)
+    with transaction.atomic():
+        materials = _lock_rows(Material, changes, ['course', *MATERIAL_CHANGE_FIELDS])
+        _check_ids(changes, materials)
+
+        level_ids = {change['level'] for change in changes if change.get('level')}
+        lesson_ids = {change['lesson'] for change in changes if change.get('lesson')}
+        level_ids.update(material.level_id for material in materials.values() if material.level_id)
+        lesson_ids.update(material.lesson_id for material in materials.values() if material.lesson_id)
+        level_courses = dict(Level.objects.filter(pk__in=level_ids).values_list('pk', 'course_id'))
+        lesson_courses = dict(Lesson.objects.filter(pk__in=lesson_ids).values_list('pk', 'course_id'))
+
+        errors = []
+        course_ids = set()
+        moved_course_ids = set()
+        touched_level_ids = set()
+        for change in changes:
+            material = materials[change['id']]
+            level_id = change.get('level', material.level_id)
+            lesson_id = change.get('lesson', material.lesson_id)
+            if 'level' in change and level_id and level_id not in level_courses:
+                errors.append({'id': material.pk, 'error': f'Nível {level_id} não encontrado.'})
+                continue
+            if 'lesson' in change and lesson_id and lesson_id not in lesson_courses:
+                errors.append({'id': material.pk, 'error': f'Aula {lesson_id} não encontrada.'})
+                continue
+            if 'level' in change or 'lesson' in change:
+                parent_courses = {level_courses.get(level_id), lesson_courses.get(lesson_id), material.course_id}
+                parent_courses.discard(None)
+                if len(parent_courses) > 1:
+                    errors.append({'id': material.pk, 'error': 'Nível e aula devem pertencer ao curso do material.'})
+                    continue
+
+            before = {material.course_id, level_courses.get(material.level_id), lesson_courses.get(material.lesson_id)}
+            after = {material.course_id, level_courses.get(level_id), lesson_courses.get(lesson_id)}
+            course_ids.update(before | after)
+            touched_level_ids.update({material.level_id, level_id})
+            if before != after:
+                moved_course_ids.update(before ^ after)
+            material.order = change.get('order', material.order)
+            material.level_id = level_id
+            material.lesson_id = lesson_id
+        if errors:
+            raise BulkChangeError(errors)
+
+        now = timezone.now()
+        rows = [materials[change['id']] for change in changes]
+        # bulk_update skips auto_now; the ETags depend on updated_at
+        for material in rows:
+            material.updated_at = now
+        Material.objects.bulk_update(rows, [*fields, 'updated_at'], batch_size=BULK_CHANGE_BATCH_SIZE)
+        course_ids.discard(None)
+        touched_level_ids.discard(None)
+        moved_course_ids.discard(None)
+        _touch(course_ids, touched_level_ids, now)
+        _after_commit(course_ids, touched_level_ids, moved_course_ids)
+        if 'level' in fields or 'lesson' in fields:
+            # Indexed under the course of their level or lesson
+            index_objects('material', [material.pk for material in rows])
+    return rows
+
+
+def _check_level_numbers(rows):
+    """
+    Raises BulkChangeError when two levels would end up with the same
+    ``(course, level_number)``: two changed levels, or a changed level and
+    one left as it is.
+    """
+    targets = defaultdict(list)
+    for level in rows:
+        targets[level.course_id, level.level_number].append(level.pk)
+    taken = set(
+        Level.objects.filter(
+            course__in={course_id for course_id, _ in targets},
+            level_number__in={level_number for _, level_number in targets},
+        ).exclude(pk__in=[level.pk for level in rows]).values_list('course_id', 'level_number')
+    )
+    errors = []
+    for (course_id, level_number), pks in targets.items():
+        if len(pks) > 1 or (course_id, level_number) in taken:
+            errors.extend(
+                {'id': pk, 'error': f'O curso {course_id} já tem um nível {level_number}.'} for pk in pks
+            )
+    if errors:
+        raise BulkChangeError(errors)
+
+
+def _park_levels(levels):
+    """
+    Moves ``levels`` (already holding their new values) to level numbers no
+    row uses and no change asks for, so that the final numbers can be
+    written without tripping the ``(course, level_number)`` unique
+    constraint half-way through (swaps, shifts).
+    """
+    highest = Level.objects.aggregate(highest=Max('level_number'))['highest'] or 0
+    start = max(highest, *(level.level_number for level in levels)) + 1
+    parked = [Level(pk=level.pk, level_number=start + n) for n, level in enumerate(levels)]
+    Level.objects.bulk_update(parked, ['level_number'], batch_size=BULK_CHANGE_BATCH_SIZE)
+
+
+def apply_level_changes(changes):
+    """
+    Applies ``[{'id', 'order'?, 'level_number'?, 'course'?}, ...]`` (see
+    LevelChangeSerializer) and returns the updated levels. Materials of a
+    level moved to another course are moved along with it. Raises
+    BulkChangeError without writing anything when a change is invalid.
+    """
+    fields = _changed_fields(changes, LEVEL_CHANGE_FIELDS)
+    with transaction.atomic():
+        levels = _lock_rows(Level, changes, LEVEL_CHANGE_FIELDS)
+        _check_ids(changes, levels)
+
+        new_course_ids = {change['course'] for change in changes if 'course' in change}
+        existing = set(Course.objects.filter(pk__in=new_course_ids).values_list('pk', flat=True))
+        errors = []
+        course_ids = set()
+        moved_course_ids = set()
+        moves = defaultdict(list)
+        # Levels whose (course, level_number) changes
+        renumbered = []
+        for change in changes:
+            level = levels[change['id']]
+            course_id = change.get('course', level.course_id)
+            if course_id not in existing and course_id != level.course_id:
+                errors.append({'id': level.pk, 'error': f'Curso {course_id} não encontrado.'})
+                continue
+            course_ids.update({level.course_id, course_id})
+            if course_id != level.course_id:
+                moved_course_ids.update({level.course_id, course_id})
+                moves[level.course_id, course_id].append(level.pk)
+            level_number = change.get('level_number', level.level_number)
+            if (course_id, level_number) != (level.course_id, level.level_number):
+                renumbered.append(level)
+            level.order = change.get('order', level.order)
+            level.level_number = level_number
+            level.course_id = course_id
+        if errors:
+            raise BulkChangeError(errors)
+
+        rows = [levels[change['id']] for change in changes]
+        if renumbered:
+            _check_level_numbers(rows)
+            _park_levels(renumbered)
+            if 'level_number' not in fields:
+                # Written back over the parked numbers
+                fields.append('level_number')
+
+        now = timezone.now()
+        for level in rows:
+            level.updated_at = now
+        Level.objects.bulk_update(rows, [*fields, 'updated_at'], batch_size=BULK_CHANGE_BATCH_SIZE)
+        # Materials of a moved level follow it to the new course
+        for (old_course_id, course_id), level_ids in moves.items():
+            Material.objects.filter(level__in=level_ids, course=old_course_id).update(course=course_id, updated_at=now)
+        if moves:
+            moved_level_ids = [pk for level_ids in moves.values() for pk in level_ids]
+            index_objects('level', moved_level_ids)
+            index_objects('material', Material.objects.filter(level__in=moved_level_ids).values_list('pk', flat=True))
+        _touch(course_ids, set(), now)
+        _after_commit(course_ids, set(levels), moved_course_ids)
+    return rows
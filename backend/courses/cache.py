@@ -0,0 +1,222 @@
+"""
+Response cache for the course tree endpoints.
+
+Rendered JSON bodies of ``CourseViewSet.retrieve`` and the course, level and
+material lists are cached under keys built from:
+
+- a global generation (bumped by bulk writes such as ``scan_materials``),
+- the version token of every scope the payload depends on
+  (``course:<id>``, ``level:<id>`` or ``catalog`` for unfiltered lists),
+- the scheme, host and full path of the request, so absolute ``file_url``
+  values and pagination links never leak across hosts,
+- the ETag computed for the request by ``ConditionalGetMixin``, when the
+  viewset has one, so a body is only ever served under the validator it was
+  built for, even when a row changed without the versions being bumped.
+
+Version tokens are bumped by the ``post_save`` / ``post_delete`` receivers
+in ``courses.signals``. They live in Django's cache framework (the
+``VERSION_CACHE`` alias), while the bodies go to the pluggable ``BACKEND``:
+``LocalLRUCache`` (per process, bounded) or ``DjangoCache``. With several
+worker processes ``VERSION_CACHE`` must point at a shared cache (Redis,
+Memcached, database or file based), otherwise other workers keep serving
+payloads invalidated elsewhere; the ``courses.W001`` system check warns
+about a process-local one. The cache is disabled unless ``ENABLED`` is set.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+
+CATALOG_SCOPE = 'catalog'
+
+DEFAULT_SETTINGS = {
+    'ENABLED': False,
+    'BACKEND': 'courses.cache.LocalLRUCache',
+    'OPTIONS': {},
+    'TIMEOUT': 600,
+    'VERSION_CACHE': 'default',
+}
+
+
+def course_scope(course_id):
+    return f'course:{course_id}'
+
+
+def level_scope(level_id):
+    return f'level:{level_id}'
+
+
+class LocalLRUCache:
+    """
+    In-process store keeping the ``max_entries`` most recently used bodies,
+    each for at most ``timeout`` seconds (``None`` keeps them until evicted)
+    """
+
+    def __init__(self, max_entries=512, timeout=None):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        # key -> (expiry on the monotonic clock or None, value)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.timeout if self.timeout is not None else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoCache:
+    """Store backed by one of the caches configured in ``CACHES``"""
+
+    def __init__(self, alias='default', timeout=600):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.timeout)
+
+    def clear(self):
+        # Entries expire on their own once the versions move on
+        pass
+
+
+class ResponseCache:
+
+    def __init__(self, config):
+        self.enabled = config['ENABLED']
+        self.timeout = config['TIMEOUT']
+        self.version_cache_alias = config['VERSION_CACHE']
+        options = {'timeout': self.timeout, **config['OPTIONS']}
+        self.store = import_string(config['BACKEND'])(**options)
+
+    @property
+    def versions(self):
+        return caches[self.version_cache_alias]
+
+    def _version_key(self, scope):
+        return f'courses:response-version:{scope}'
+
+    def get_versions(self, scopes):
+        keys = [self._version_key(scope) for scope in ('generation', *scopes)]
+        found = self.versions.get_many(keys)
+        missing = {key: uuid.uuid4().hex for key in keys if key not in found}
+        if missing:
+            # Versions must outlive every entry built with them
+            self.versions.set_many(missing, None)
+            found.update(missing)
+        return [found[key] for key in keys]
+
+    def bump(self, *scopes):
+        """Invalidates every cached payload depending on one of ``scopes``"""
+        self.versions.set_many({self._version_key(scope): uuid.uuid4().hex for scope in scopes}, None)
+
+    def invalidate_all(self):
+        self.bump('generation')
+        self.store.clear()
+
+    def make_key(self, request, scopes, etag=None):
+        location = f'{request.scheme}://{request.get_host()}{request.get_full_path()}|{etag or ""}'
+        digest = hashlib.sha1(location.encode('utf-8'), usedforsecurity=False).hexdigest()
+        versions = '.'.join(self.get_versions(scopes))
+        return f'courses:response:{versions}:{digest}'
+
+
+_response_cache = None
+
+
+def get_response_cache():
+    global _response_cache
+    if _response_cache is None:
+        config = {**DEFAULT_SETTINGS, **getattr(settings, 'COURSES_RESPONSE_CACHE', {})}
+        _response_cache = ResponseCache(config)
+    return _response_cache
+
+
+@receiver(setting_changed)
+def reset_response_cache(setting, **kwargs):
+    global _response_cache
+    if setting in ('COURSES_RESPONSE_CACHE', 'CACHES'):
+        _response_cache = None
+
+
+def invalidate_scopes(*scopes):
+    get_response_cache().bump(*scopes)
+
+
+def invalidate_all():
+    get_response_cache().invalidate_all()
+
+
+class CachedResponseMixin:
+    """
+    Serves ``list`` / ``retrieve`` JSON bodies from the response cache.
+
+    Viewsets implement ``get_cache_scopes()`` returning the scopes the
+    payload of the current action depends on, or ``None`` to bypass the
+    cache. Only JSON renderings are cached; the browsable API is always
+    built fresh. Placed after ``ConditionalGetMixin``, the ETag it sets on
+    ``self.etag`` is part of the key.
+    """
+
+    def get_cache_scopes(self):
+        return None
+
+    def _cached(self, request, build_response):
+        cache = get_response_cache()
+        scopes = self.get_cache_scopes() if cache.enabled else None
+        renderer = getattr(request, 'accepted_renderer', None)
+        if scopes is None or renderer is None or renderer.format != 'json':
+            return build_response()
+
+        key = cache.make_key(request, scopes, getattr(self, 'etag', None))
+        content = cache.store.get(key)
+        if content is None:
+            response = build_response()
+            if response.status_code != 200:
+                return response
+            content = renderer.render(response.data, request.accepted_media_type, self.get_renderer_context())
+            cache.store.set(key, content)
+        response = HttpResponse(content, content_type=f'{request.accepted_media_type}')
+        response['Vary'] = 'Accept'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._cached(request, lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached(request, lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs))
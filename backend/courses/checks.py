@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core import checks
+
+from .cache import DEFAULT_SETTINGS
+
+
+# Cache backends whose entries are private to one process
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@checks.register(checks.Tags.caches)
+def check_response_cache(app_configs, **kwargs):
+    """The response cache must keep its version tokens where every worker sees them"""
+    config = {**DEFAULT_SETTINGS, **getattr(settings, 'COURSES_RESPONSE_CACHE', {})}
+    if not config['ENABLED']:
+        return []
+    alias = config['VERSION_CACHE']
+    if alias not in settings.CACHES:
+        return [checks.Error(
+            f"COURSES_RESPONSE_CACHE['VERSION_CACHE'] is {alias!r}, which is not in CACHES.",
+            id='courses.E001',
+        )]
+    backend = settings.CACHES[alias].get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES:
+        return [checks.Warning(
+            f"COURSES_RESPONSE_CACHE is enabled but its VERSION_CACHE {alias!r} uses {backend}, which is "
+            'private to each process: writes handled by one worker or by a management command do not '
+            'invalidate the responses cached by the other workers.',
+            hint='Point VERSION_CACHE at a cache shared by every process (Redis, Memcached, database or '
+                 'file based), or silence courses.W001 when a single process serves the API.',
+            id='courses.W001',
+        )]
+    return []
@@ -0,0 +1,121 @@
+"""
+Conditional GET support (ETag / Last-Modified / 304) for the courses API.
+
+Material files get strong ETags computed from stat data, serialized course,
+level and material payloads get weak ETags computed from the newest
+``updated_at`` and the row count of every table that feeds the payload.
+Validators are computed with aggregate queries only, so a matching
+If-None-Match / If-Modified-Since is answered before any file is opened or
+any nested serializer runs.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+# Clients must revalidate, but may reuse their copy when we answer 304
+CACHE_CONTROL = 'private, no-cache'
+
+
+def file_etag(stat):
+    """Strong ETag for a file on disk, derived from its size and mtime"""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def check_preconditions(request, etag=None, last_modified=None):
+    """
+    Evaluates If-None-Match / If-Modified-Since (and If-Match /
+    If-Unmodified-Since) against the given validators.
+
+    Returns a 304/412 response when the request can be answered without a
+    body, or ``None`` when the full response has to be built.
+    """
+    validators = HttpResponse()
+    set_validator_headers(validators, etag, last_modified)
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified) if last_modified is not None else None,
+        response=validators,
+    )
+    if response is validators:
+        return None
+    return response
+
+
+def set_validator_headers(response, etag=None, last_modified=None):
+    if etag:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = CACHE_CONTROL
+
+
+def queryset_fingerprint(queryset, **extra_max):
+    """
+    Returns ``(count, timestamps)`` for a queryset using one aggregate query.
+
+    ``timestamps`` holds the newest ``updated_at`` of the queryset plus any
+    extra ``Max()`` lookups given as kwargs. Extra lookups must follow
+    forward relations (e.g. ``course__updated_at``) so the join does not
+    multiply rows and a plain COUNT stays exact.
+    """
+    aggregates = {'_count': Count('pk'), '_last': Max('updated_at')}
+    for name, lookup in extra_max.items():
+        aggregates[name] = Max(lookup)
+    values = queryset.order_by().select_related(None).aggregate(**aggregates)
+    count = values.pop('_count')
+    return count, [value for value in values.values() if value is not None]
+
+
+class ConditionalGetMixin:
+    """
+    Adds weak ETag / Last-Modified validators to ``list`` and ``retrieve``.
+
+    Viewsets implement ``get_validator_querysets()`` returning a list of
+    ``(queryset, extra_max)`` pairs describing every table the payload is
+    built from. Last-Modified is only sent for single objects: deleting a
+    row from a collection does not move its newest timestamp, so lists rely
+    on the ETag (which includes the row counts) alone.
+    """
+
+    def get_validator_querysets(self):
+        raise NotImplementedError
+
+    def get_validators(self, request):
+        parts = [request.get_host(), request.get_full_path()]
+        last_modified = None
+        for queryset, extra_max in self.get_validator_querysets():
+            count, timestamps = queryset_fingerprint(queryset, **extra_max)
+            parts.append(str(count))
+            parts.extend(ts.isoformat() for ts in timestamps)
+            if timestamps:
+                newest = max(timestamps)
+                if last_modified is None or newest > last_modified:
+                    last_modified = newest
+        digest = hashlib.md5('|'.join(parts).encode('utf-8'), usedforsecurity=False).hexdigest()
+        etag = f'W/"{digest}"'
+        if self.action != 'retrieve' or last_modified is None:
+            return etag, None
+        return etag, last_modified.timestamp()
+
+    def _conditional(self, request, build_response):
+        etag, last_modified = self.get_validators(request)
+        # Keys the cached body in CachedResponseMixin
+        self.etag = etag
+        not_modified = check_preconditions(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = build_response()
+        if response.status_code == 200:
+            set_validator_headers(response, etag, last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(request, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
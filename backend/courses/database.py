@@ -0,0 +1,89 @@
+"""
+Database connection profile.
+
+Every new SQLite connection gets the pragmas of ``settings.SQLITE_PROFILE``
+(connected to ``connection_created`` in CoursesConfig.ready). In WAL mode
+student reads keep going while an upload or a scan writes, and a second
+writer waits ``BUSY_TIMEOUT`` milliseconds for the lock instead of failing
+with "database is locked". ``synchronous=NORMAL`` only syncs at WAL
+checkpoints, which is durable across application crashes; a power loss can
+undo the last transactions, never corrupt the file. Atomic blocks take the
+write lock when they begin (see courses/backends/sqlite3), so they wait for
+it too.
+
+When ``settings.DATABASES`` has a ``readonly`` alias (a second connection
+to the same SQLite file, or a PostgreSQL replica) ReadOnlyRouter sends reads
+there, except inside a transaction on ``default``, which must see its own
+uncommitted writes. Writes always go to ``default``.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+READ_ONLY_ALIAS = 'readonly'
+
+DEFAULT_SQLITE_PROFILE = {
+    'JOURNAL_MODE': 'WAL',
+    'SYNCHRONOUS': 'NORMAL',
+    'TRANSACTION_MODE': 'IMMEDIATE',
+    'BUSY_TIMEOUT': 5000,
+    'CACHE_SIZE': 64 * 1024 * 1024,
+    'MMAP_SIZE': 256 * 1024 * 1024,
+    'READ_ONLY_CONNECTIONS': True,
+}
+
+
+def get_sqlite_profile():
+    return {**DEFAULT_SQLITE_PROFILE, **getattr(settings, 'SQLITE_PROFILE', {})}
+
+
+def sqlite_pragmas(profile, read_only=False):
+    """The pragma statements a new connection runs, in order"""
+    pragmas = [f'PRAGMA busy_timeout = {int(profile["BUSY_TIMEOUT"])}']
+    if not read_only:
+        # Persistent in the file; a query_only connection cannot change it
+        pragmas.append(f'PRAGMA journal_mode = {profile["JOURNAL_MODE"]}')
+    pragmas += [
+        f'PRAGMA synchronous = {profile["SYNCHRONOUS"]}',
+        # A negative cache_size is in KiB instead of pages
+        f'PRAGMA cache_size = {-(int(profile["CACHE_SIZE"]) // 1024)}',
+        f'PRAGMA mmap_size = {int(profile["MMAP_SIZE"])}',
+        'PRAGMA temp_store = MEMORY',
+    ]
+    if read_only:
+        pragmas.append('PRAGMA query_only = ON')
+    return pragmas
+
+
+def configure_connection(sender, connection, **kwargs):
+    """connection_created receiver applying the SQLite profile"""
+    if connection.vendor != 'sqlite':
+        return
+    read_only = connection.alias == READ_ONLY_ALIAS
+    with connection.cursor() as cursor:
+        for pragma in sqlite_pragmas(get_sqlite_profile(), read_only=read_only):
+            cursor.execute(pragma)
+
+
+class ReadOnlyRouter:
+    """Routes reads to the ``readonly`` alias when it is configured"""
+
+    def db_for_read(self, model, **hints):
+        if READ_ONLY_ALIAS not in settings.DATABASES:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return READ_ONLY_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Rows read from the readonly alias would be saved back there otherwise
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == READ_ONLY_ALIAS:
+            return False
+        return None
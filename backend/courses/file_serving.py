@@ -0,0 +1,391 @@
+"""
+Helpers used by MaterialViewSet.file to serve material files over HTTP.
+
+Handles the byte-range side of the protocol (RFC 9110 section 14): parsing
+the Range header, If-Range validation and building 206/416 responses with
+single part or multipart/byteranges bodies.
+
+The transfer itself is done by the backend selected with
+``settings.MATERIALS_SERVE_BACKEND``:
+
+- ``python``: the worker reads the file and streams it (development).
+- ``sendfile``: the open file is handed to the WSGI server through
+  ``wsgi.file_wrapper`` (gunicorn, uWSGI), which uses ``os.sendfile``.
+- ``x-accel-redirect``: nginx serves the file from an internal location.
+- ``x-sendfile``: Apache mod_xsendfile / lighttpd serve the file.
+"""
+import os
+import secrets
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+
+CONTENT_TYPE_MAP = {
+    '.pdf': 'application/pdf',
+    '.mp3': 'audio/mpeg',
+    '.wav': 'audio/wav',
+    '.mp4': 'video/mp4',
+    '.avi': 'video/x-msvideo',
+    '.mov': 'video/quicktime',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.exe': 'application/x-msdownload',
+    '.zip': 'application/zip',
+    '.doc': 'application/msword',
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.xls': 'application/vnd.ms-excel',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.ppt': 'application/vnd.ms-powerpoint',
+    '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+}
+
+# Chunk size used when streaming byte ranges
+RANGE_CHUNK_SIZE = 64 * 1024
+
+SERVE_BACKENDS = ('python', 'sendfile', 'x-accel-redirect', 'x-sendfile')
+
+# Requests asking for more ranges than this are answered with the full file,
+# so a client cannot make us seek all over the disk for a single request.
+MAX_RANGES = 16
+
+
+def get_content_type(file_path):
+    """Returns the content type for a file based on its extension"""
+    ext = os.path.splitext(file_path)[1].lower()
+    return CONTENT_TYPE_MAP.get(ext, 'application/octet-stream')
+
+
+def parse_range_header(header, size):
+    """
+    Parses a ``Range: bytes=...`` header against a file of ``size`` bytes.
+
+    Returns a sorted list of inclusive ``(start, end)`` tuples with
+    overlapping and adjacent ranges merged, an empty list when the header is
+    valid but none of the ranges can be satisfied, or ``None`` when the
+    header must be ignored (missing, malformed, other units, too many ranges).
+    """
+    if not header:
+        return None
+    units, _, range_set = header.partition('=')
+    if units.strip().lower() != 'bytes' or not range_set:
+        return None
+
+    ranges = []
+    specs = [spec.strip() for spec in range_set.split(',') if spec.strip()]
+    if not specs or len(specs) > MAX_RANGES:
+        return None
+    for spec in specs:
+        first, sep, last = spec.partition('-')
+        if not sep:
+            return None
+        first, last = first.strip(), last.strip()
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else max(start, size - 1)
+                if start < 0 or end < start:
+                    return None
+            else:
+                # Suffix range: the last N bytes of the file
+                suffix_length = int(last)
+                if suffix_length < 0:
+                    return None
+                if suffix_length == 0:
+                    continue
+                start = max(size - suffix_length, 0)
+                end = size - 1
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def if_range_matches(request, etag=None, last_modified=None):
+    """
+    Checks the If-Range precondition.
+
+    The range request is honoured only when the validator sent by the client
+    still matches the current file, otherwise the full file must be sent.
+    """
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # Only strong entity tags can be used with If-Range
+        return etag is not None and not if_range.startswith('W/') and if_range == etag
+    if last_modified is None:
+        return False
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and if_range_date == int(last_modified)
+
+
+def _read_range(file_handle, start, end):
+    """Yields the bytes between start and end (inclusive) in chunks"""
+    file_handle.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = file_handle.read(min(RANGE_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+def _multipart_parts(ranges, size, content_type, boundary):
+    """Returns the header block for every part and the closing delimiter"""
+    headers = [
+        (
+            f'\r\n--{boundary}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+        ).encode('ascii')
+        for start, end in ranges
+    ]
+    closing = f'\r\n--{boundary}--\r\n'.encode('ascii')
+    return headers, closing
+
+
+def _stream_multipart(file_handle, ranges, part_headers, closing):
+    try:
+        for (start, end), part_header in zip(ranges, part_headers):
+            yield part_header
+            yield from _read_range(file_handle, start, end)
+        yield closing
+    finally:
+        file_handle.close()
+
+
+def _stream_single(file_handle, start, end):
+    try:
+        yield from _read_range(file_handle, start, end)
+    finally:
+        file_handle.close()
+
+
+class FileRange:
+    """
+    File-like view over ``length`` bytes of an open file, starting at
+    ``start``.
+
+    Exposes ``fileno()`` with the file positioned at ``start`` so a WSGI
+    server's ``wsgi.file_wrapper`` can send the range with ``os.sendfile``
+    (bounded by Content-Length); servers without sendfile fall back to
+    ``read()``, which never goes past the end of the range.
+    """
+
+    def __init__(self, file_handle, start, length):
+        file_handle.seek(start)
+        self._file = file_handle
+        self._remaining = length
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def get_serve_backend():
+    backend = getattr(settings, 'MATERIALS_SERVE_BACKEND', 'python')
+    if backend not in SERVE_BACKENDS:
+        raise ImproperlyConfigured(
+            f'MATERIALS_SERVE_BACKEND must be one of {", ".join(SERVE_BACKENDS)}, got {backend!r}'
+        )
+    return backend
+
+
+def get_accel_redirect_location(file_path):
+    """
+    Maps a filesystem path to the internal nginx location serving it, using
+    ``settings.MATERIALS_ACCEL_REDIRECT_LOCATIONS`` ({root: location}).
+    Returns ``None`` when the file is not below any configured root.
+    """
+    real_path = os.path.realpath(file_path)
+    locations = getattr(settings, 'MATERIALS_ACCEL_REDIRECT_LOCATIONS', {})
+    for root, location in locations.items():
+        real_root = os.path.realpath(root)
+        if os.path.commonpath([real_root, real_path]) != real_root:
+            continue
+        relative_path = os.path.relpath(real_path, real_root).replace(os.sep, '/')
+        return location.rstrip('/') + '/' + quote(relative_path)
+    return None
+
+
+def get_offload_header(file_path, backend=None):
+    """
+    Returns the ``(header, value)`` pair handing ``file_path`` to the proxy
+    for the proxy backends, or ``None`` when the worker has to send it.
+    """
+    backend = backend or get_serve_backend()
+    if backend == 'x-accel-redirect':
+        location = get_accel_redirect_location(file_path)
+        if location:
+            return ('X-Accel-Redirect', location)
+    elif backend == 'x-sendfile':
+        return ('X-Sendfile', os.path.realpath(file_path))
+    return None
+
+
+def build_offload_response(offload_header, content_type, stat, etag=None):
+    """Empty response carrying the internal redirect header"""
+    response = HttpResponse(content_type=content_type)
+    response[offload_header[0]] = offload_header[1]
+    set_range_headers(response, stat, etag)
+    return response
+
+
+def set_range_headers(response, stat, etag=None):
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if etag:
+        response['ETag'] = etag
+
+
+def requested_ranges(request, size, etag=None, last_modified=None):
+    """
+    Returns the ranges to send for this request, with the same meaning as
+    ``parse_range_header``: ``None`` for the full file, ``[]`` for a 416.
+    """
+    if request.method not in ('GET', 'HEAD') or not if_range_matches(request, etag, last_modified):
+        return None
+    return parse_range_header(request.META.get('HTTP_RANGE'), size)
+
+
+def multipart_content_length(ranges, part_headers, closing):
+    content_length = sum(len(h) for h in part_headers) + len(closing)
+    return content_length + sum(end - start + 1 for start, end in ranges)
+
+
+def serve_file(request, file_path, content_type, etag=None, stat=None):
+    """
+    Returns the response transferring ``file_path`` with the configured
+    serving backend.
+
+    The proxy backends return an empty response carrying the internal
+    redirect header; the proxy then takes care of Range / If-Range itself.
+    Files outside the configured X-Accel-Redirect roots are streamed by the
+    worker.
+    """
+    backend = get_serve_backend()
+    if stat is None:
+        stat = os.stat(file_path)
+
+    offload_header = get_offload_header(file_path, backend)
+    if offload_header is None:
+        return build_file_response(
+            request, file_path, content_type, etag=etag, stat=stat,
+            use_sendfile=backend == 'sendfile',
+        )
+    return build_offload_response(offload_header, content_type, stat, etag)
+
+
+def build_file_response(request, file_path, content_type, etag=None, stat=None, use_sendfile=False):
+    """
+    Returns a response for ``file_path`` honouring Range and If-Range.
+
+    Produces a 200 FileResponse for the full file, a 206 with a single
+    Content-Range, a 206 multipart/byteranges response, or a 416 when no
+    requested range can be satisfied. With ``use_sendfile`` single ranges
+    are also returned as a FileResponse so the WSGI server can sendfile them.
+    """
+    if stat is None:
+        stat = os.stat(file_path)
+    size = stat.st_size
+    ranges = requested_ranges(request, size, etag, stat.st_mtime)
+
+    if ranges == []:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif not ranges:
+        response = FileResponse(open(file_path, 'rb'), content_type=content_type, as_attachment=False)
+    elif len(ranges) == 1 and use_sendfile:
+        start, end = ranges[0]
+        file_range = FileRange(open(file_path, 'rb'), start, end - start + 1)
+        response = FileResponse(file_range, status=206, content_type=content_type, as_attachment=False)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(
+            _stream_single(open(file_path, 'rb'), start, end),
+            status=206,
+            content_type=content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        boundary = secrets.token_hex(16)
+        part_headers, closing = _multipart_parts(ranges, size, content_type, boundary)
+        response = StreamingHttpResponse(
+            _stream_multipart(open(file_path, 'rb'), ranges, part_headers, closing),
+            status=206,
+            content_type=f'multipart/byteranges; boundary={boundary}',
+        )
+        response['Content-Length'] = str(multipart_content_length(ranges, part_headers, closing))
+
+    set_range_headers(response, stat, etag)
+    return response
+
+
+def set_material_headers(response, user, file_path):
+    """
+    Content-Disposition and cross-origin headers shared by every view
+    serving material files.
+    """
+    filename = os.path.basename(file_path)
+    ext = os.path.splitext(file_path)[1].lower()
+    
+    # Always use inline to prevent download - files should be viewed in platform
+    # Check user type - only students should have download disabled
+    is_student = hasattr(user, 'user_type') and user.user_type == 'student'
+    
+    if is_student:
+        # For students: force inline viewing for most files, but allow .exe to be executable
+        if ext == '.exe':
+            # For .exe files, use inline so they can be executed in the platform
+            response['Content-Disposition'] = f'inline; filename="{filename}"'
+        else:
+            # For other files: force inline viewing, prevent download
+            response['Content-Disposition'] = f'inline; filename="{filename}"'
+            # Prevent download via right-click and other methods
+            response['X-Content-Type-Options'] = 'nosniff'
+            response['Content-Security-Policy'] = "default-src 'self'"
+    else:
+        # For teachers/admins: allow normal access
+        if ext in ['.zip']:
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        else:
+            response['Content-Disposition'] = f'inline; filename="{filename}"'
+    
+    # Add headers for viewing in iframe/embed
+    response['Access-Control-Allow-Origin'] = '*'
+    response['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
+    response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Range, If-Range, If-None-Match, If-Modified-Since'
+    response['Access-Control-Expose-Headers'] = 'Accept-Ranges, Content-Range, Content-Length, ETag, Last-Modified'
+    return response
@@ -0,0 +1,144 @@
+"""
+Content hashing of material files.
+
+Files are streamed in large chunks through SHA-256 by a small thread pool
+(hashlib releases the GIL while digesting). Reads go through a shared
+token bucket capped at ``MATERIAL_HASH_MAX_BYTES_PER_SEC`` and the pages
+read are dropped from the page cache afterwards, so a scan over the whole
+catalog does not starve live file serving of disk bandwidth or cache.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import background
+from .cache import invalidate_all
+from .models import Material
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Rows hashed per bulk_update
+HASH_BATCH_SIZE = 200
+
+
+class Throttle:
+    """Token bucket limiting the bytes per second read by all hashing threads"""
+
+    def __init__(self, bytes_per_second):
+        self.rate = bytes_per_second
+        self._allowance = float(bytes_per_second)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._allowance = min(self.rate, self._allowance + (now - self._last) * self.rate)
+            self._last = now
+            self._allowance -= amount
+            wait = -self._allowance / self.rate if self._allowance < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+def get_throttle():
+    return Throttle(getattr(settings, 'MATERIAL_HASH_MAX_BYTES_PER_SEC', 32 * 1024 * 1024))
+
+
+def hash_file(path, throttle=None):
+    """Returns the SHA-256 hex digest of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb', buffering=0) as f:
+        fd = f.fileno()
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while True:
+            if throttle is not None:
+                throttle.consume(HASH_CHUNK_SIZE)
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+        if hasattr(os, 'posix_fadvise'):
+            # Leave the page cache to the files students are streaming
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    return digest.hexdigest()
+
+
+def _hash_material(material, throttle):
+    path = material.get_full_path()
+    if not path:
+        return None
+    try:
+        return hash_file(path, throttle)
+    except OSError as e:
+        logger.warning('Could not hash material %s (%s): %s', material.pk, path, e)
+        return None
+
+
+def hash_materials(queryset, workers=None, throttle=None):
+    """
+    Hashes the materials of ``queryset`` in a thread pool and stores
+    ``content_hash`` with one bulk_update per batch. Returns the number of
+    materials hashed.
+    """
+    workers = workers or getattr(settings, 'MATERIAL_HASH_WORKERS', 2)
+    throttle = throttle or get_throttle()
+    # Ids first: rows leave the queryset as soon as they are hashed
+    ids = list(queryset.values_list('pk', flat=True))
+    hashed = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='material-hash') as executor:
+        for start in range(0, len(ids), HASH_BATCH_SIZE):
+            batch = Material.objects.filter(pk__in=ids[start:start + HASH_BATCH_SIZE]).only(
+                'pk', 'file', 'file_path', 'duplicate_of'
+            )
+            done = []
+            now = timezone.now()
+            for material, content_hash in executor.map(lambda m: (m, _hash_material(m, throttle)), batch):
+                if content_hash is not None:
+                    material.content_hash = content_hash
+                    # bulk_update skips auto_now; the ETags depend on updated_at
+                    material.updated_at = now
+                    done.append(material)
+            Material.objects.bulk_update(done, ['content_hash', 'updated_at'])
+            hashed += len(done)
+    if hashed:
+        # content_hash is part of the cached material payloads
+        invalidate_all()
+    return hashed
+
+
+def unhashed_materials():
+    """Materials with a stored file of their own but no content hash yet"""
+    has_file = Q(file_path__isnull=False) | (Q(file__isnull=False) & ~Q(file=''))
+    return Material.objects.filter(has_file, content_hash__isnull=True, duplicate_of__isnull=True)
+
+
+def hash_pending_materials(workers=None):
+    """Hashes every material that does not have a content hash yet"""
+    return hash_materials(unhashed_materials(), workers=workers)
+
+
+def schedule_hashing(material_ids=None):
+    """
+    Hashes materials in the background pool: the given ids, or every
+    material still missing a hash.
+    """
+    def job():
+        queryset = unhashed_materials()
+        if material_ids is not None:
+            queryset = queryset.filter(pk__in=material_ids)
+        hash_materials(queryset)
+
+    return background.submit(job)
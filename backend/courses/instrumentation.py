@@ -0,0 +1,351 @@
+"""
+Per-request performance instrumentation.
+
+InstrumentationMiddleware records a sample of the requests
+(``COURSES_INSTRUMENTATION['SAMPLE_RATE']``, or all of them while
+``SERVER_TIMING`` is on). For each one it collects, per route (the HTTP
+method and the URL name, e.g. ``GET material-file``):
+
+- the SQL queries and their time, on every database alias (counted by an
+  execute wrapper installed on every connection, which finds the record of
+  the request in a context variable, also in the threads sync_to_async
+  runs the ORM in),
+- the time spent building ``serializer.data`` in the viewsets using
+  InstrumentedViewMixin (including the queries it triggers),
+- the time until the view returned (``app``), the time to the first byte
+  of the body and its size; bodies streamed by MaterialViewSet.file or the
+  ZIP exports are measured as the server consumes them, files handed to
+  ``wsgi.file_wrapper`` count their Content-Length.
+
+Recorded requests get a ``Server-Timing`` header (when enabled) and are
+kept in a per-process window of the last ``WINDOW`` requests per route,
+summarised with p50/p95/p99 for admins at ``/api/instrumentation/``. Only
+the ones drawn by ``SAMPLE_RATE`` are logged as one JSON line on the
+``courses.instrumentation`` logger, so ``SERVER_TIMING`` does not log every
+request. Requests that are
+not sampled only cost a random draw, and a context variable lookup per
+query. The middleware runs natively under WSGI and ASGI: async views such
+as the ``material_file`` view are awaited without adapter threads.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'SAMPLE_RATE': 0.0,
+    'SERVER_TIMING': False,
+    'LOG': True,
+    'WINDOW': 1000,
+}
+
+# Summarised in the aggregated report, in this order
+METRICS = ['total_ms', 'app_ms', 'ttfb_ms', 'sql_count', 'sql_ms', 'serializer_ms', 'bytes']
+
+_current_record = ContextVar('courses_instrumentation_record', default=None)
+
+
+_config = None
+
+
+def get_instrumentation_settings():
+    # Cached: the middleware reads it on every request
+    global _config
+    if _config is None:
+        _config = {**DEFAULT_SETTINGS, **getattr(settings, 'COURSES_INSTRUMENTATION', {})}
+    return _config
+
+
+class RequestRecord:
+    """Measurements of one sampled request"""
+
+    __slots__ = ('sampled', 'route', 'status', 'started', 'app', 'ttfb', 'total', 'sql_count', 'sql_time',
+                 'serializer_time', 'bytes', 'streamed')
+
+    def __init__(self, sampled=True):
+        # Drawn by SAMPLE_RATE, rather than recorded for Server-Timing only
+        self.sampled = sampled
+        self.route = None
+        self.status = None
+        self.started = time.perf_counter()
+        self.app = self.ttfb = self.total = None
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.bytes = 0
+        self.streamed = False
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute_wrapper counting the queries"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_count += 1
+            self.sql_time += time.perf_counter() - started
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def as_dict(self):
+        return {
+            'route': self.route,
+            'status': self.status,
+            'total_ms': round(self.total * 1000, 3),
+            'app_ms': round(self.app * 1000, 3),
+            'ttfb_ms': round(self.ttfb * 1000, 3),
+            'sql_count': self.sql_count,
+            'sql_ms': round(self.sql_time * 1000, 3),
+            'serializer_ms': round(self.serializer_time * 1000, 3),
+            'bytes': self.bytes,
+            'streamed': self.streamed,
+        }
+
+    def server_timing(self):
+        """Server-Timing value; a streamed body is still being sent when headers go out"""
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.sql_count} queries"',
+            f'serialize;dur={self.serializer_time * 1000:.1f}',
+            f'app;dur={self.app * 1000:.1f}',
+        ])
+
+
+def current_record():
+    """The record of the request being handled, or ``None`` when it is not sampled"""
+    return _current_record.get()
+
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class RouteStats:
+    """The last ``window`` sampled requests of every route, in this process"""
+
+    def __init__(self, window):
+        self.window = window
+        self._routes = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        values = record.as_dict()
+        with self._lock:
+            if record.route not in self._routes:
+                self._routes[record.route] = deque(maxlen=self.window)
+                self._counts[record.route] = 0
+            self._routes[record.route].append([values[metric] for metric in METRICS])
+            self._counts[record.route] += 1
+
+    def summary(self):
+        """``{route: {'sampled', 'window', metric: {'p50', 'p95', 'p99', 'max'}}}``"""
+        with self._lock:
+            routes = {route: (list(rows), self._counts[route]) for route, rows in self._routes.items()}
+        report = {}
+        for route, (rows, sampled) in sorted(routes.items()):
+            entry = {'sampled': sampled, 'window': len(rows)}
+            for position, metric in enumerate(METRICS):
+                values = sorted(row[position] for row in rows)
+                entry[metric] = {
+                    'p50': _percentile(values, 0.50),
+                    'p95': _percentile(values, 0.95),
+                    'p99': _percentile(values, 0.99),
+                    'max': values[-1],
+                }
+            report[route] = entry
+        return report
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+            self._counts.clear()
+
+
+_route_stats = None
+_route_stats_lock = threading.Lock()
+
+
+def get_route_stats():
+    global _route_stats
+    if _route_stats is None:
+        with _route_stats_lock:
+            if _route_stats is None:
+                _route_stats = RouteStats(get_instrumentation_settings()['WINDOW'])
+    return _route_stats
+
+
+@receiver(setting_changed)
+def reset_instrumentation(setting, **kwargs):
+    global _config, _route_stats
+    if setting == 'COURSES_INSTRUMENTATION':
+        _config = None
+        _route_stats = None
+
+
+def _finish(record, config):
+    record.total = record.elapsed()
+    if record.ttfb is None:
+        record.ttfb = record.total
+    get_route_stats().add(record)
+    if config['LOG'] and record.sampled:
+        logger.info(json.dumps(record.as_dict()))
+
+
+def _measure_stream(record, content, on_done):
+    first = True
+    try:
+        for chunk in content:
+            if first:
+                record.ttfb = record.elapsed()
+                first = False
+            record.bytes += len(chunk)
+            yield chunk
+    finally:
+        on_done()
+
+
+async def _measure_async_stream(record, content, on_done):
+    first = True
+    try:
+        async for chunk in content:
+            if first:
+                record.ttfb = record.elapsed()
+                first = False
+            record.bytes += len(chunk)
+            yield chunk
+    finally:
+        on_done()
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper of every connection: counts the queries of sampled requests"""
+    record = _current_record.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    return record(execute, sql, params, many, context)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """
+    connection_created receiver installing record_query. The record is found
+    through a context variable, which follows the request into the threads
+    sync_to_async runs the ORM in under ASGI.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class InstrumentationMiddleware:
+    """Records sampled requests (see the module docstring)"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Checked once: __call__ runs on every request
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _sample(config):
+        """Whether the request is drawn by SAMPLE_RATE, or ``None`` when it is not recorded at all"""
+        if config['SAMPLE_RATE'] and random.random() < config['SAMPLE_RATE']:
+            return True
+        return False if config['SERVER_TIMING'] else None
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        config = get_instrumentation_settings()
+        sampled = self._sample(config)
+        if sampled is None:
+            return self.get_response(request)
+
+        record = RequestRecord(sampled)
+        token = _current_record.set(record)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_record.reset(token)
+        return self._process_response(request, response, record, config)
+
+    async def __acall__(self, request):
+        config = get_instrumentation_settings()
+        sampled = self._sample(config)
+        if sampled is None:
+            return await self.get_response(request)
+
+        record = RequestRecord(sampled)
+        token = _current_record.set(record)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_record.reset(token)
+        return self._process_response(request, response, record, config)
+
+    def _process_response(self, request, response, record, config):
+        record.app = record.elapsed()
+        match = request.resolver_match
+        record.route = f'{request.method} {match.view_name if match else "unresolved"}'
+        record.status = response.status_code
+        if config['SERVER_TIMING']:
+            response['Server-Timing'] = record.server_timing()
+
+        if not response.streaming:
+            record.bytes = len(response.content)
+            _finish(record, config)
+            return response
+
+        record.streamed = True
+        finished = []
+
+        def done():
+            if not finished:
+                finished.append(True)
+                _finish(record, config)
+
+        if getattr(response, 'file_to_stream', None) is not None:
+            # Left to wsgi.file_wrapper (sendfile); the body is not seen here
+            record.bytes = int(response.get('Content-Length') or 0)
+            record.ttfb = record.app
+        elif response.is_async:
+            response.streaming_content = _measure_async_stream(record, response.streaming_content, done)
+        else:
+            response.streaming_content = _measure_stream(record, response.streaming_content, done)
+        # Also covers bodies that were never (fully) iterated
+        response._resource_closers.append(done)
+        return response
+
+
+class InstrumentedViewMixin:
+    """Times ``serializer.data`` of the serializers built by the view, for sampled requests"""
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        record = current_record()
+        if record is not None:
+            to_representation = serializer.to_representation
+
+            def timed(instance):
+                started = time.perf_counter()
+                try:
+                    return to_representation(instance)
+                finally:
+                    record.serializer_time += time.perf_counter() - started
+
+            serializer.to_representation = timed
+        return serializer
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from courses.uploads import discard_upload, stale_upload_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete resumable upload sessions that stopped receiving chunks, together with their partial files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=None,
+                            help='Idle time after which a session is stale (default: MATERIAL_UPLOAD_SESSION_MAX_AGE)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='List stale sessions without deleting them')
+
+    def handle(self, *args, **options):
+        max_age = timedelta(hours=options['hours']) if options['hours'] is not None else None
+        sessions = list(stale_upload_sessions(max_age))
+        for session in sessions:
+            self.stdout.write(f'{session.file_name} ({session.offset}/{session.size} bytes)')
+            if not options['dry_run']:
+                discard_upload(session)
+        
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(sessions)} stale upload sessions'))
@@ -0,0 +1,129 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from rest_framework.test import APIRequestFactory
+
+from courses.conditional import queryset_fingerprint
+from courses.models import Course, Lesson, Level, Material
+from courses.pagination import MaterialPagination
+from courses.views import CourseViewSet, LessonViewSet, LevelViewSet, MaterialViewSet
+
+
+# Full table scan, e.g. "SCAN courses_material" (no "USING ... INDEX")
+FULL_SCAN = re.compile(r'^SCAN (\S+)$')
+
+# Equality and IN filters, which an index can serve
+SELECTIVE_FILTER = re.compile(r' WHERE .*(= %s|IN \()', re.IGNORECASE)
+
+# Prefetches: rows of several parents, so they are sorted after the lookup
+PREFETCH_FILTER = re.compile(r' WHERE .*IN \(', re.IGNORECASE)
+
+
+class Command(BaseCommand):
+    help = ('Run the catalog endpoint queries and check with EXPLAIN QUERY PLAN that every one of them '
+            'is served by an index (SQLite)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help='Print the plan of every query, not only of the ones without an index')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('EXPLAIN QUERY PLAN checks run on SQLite only')
+
+        # Sample rows make the prefetch and detail queries run; they are rolled back
+        with transaction.atomic():
+            course = Course.objects.create(title='Query plan check')
+            level = Level.objects.create(course=course, title='Query plan check', level_number=1)
+            lesson = Lesson.objects.create(course=course, title='Query plan check')
+            material = Material.objects.create(
+                course=course, level=level, lesson=lesson, title='Query plan check', file_path='query-plan-check.pdf',
+            )
+            cursor = MaterialPagination().encode_cursor(False, material)
+            cases = [
+                ('GET /api/courses/', CourseViewSet, 'list', {}, None),
+                ('GET /api/courses/?pagination=cursor', CourseViewSet, 'list', {'pagination': 'cursor'}, None),
+                ('GET /api/courses/{id}/', CourseViewSet, 'retrieve', {}, course.pk),
+                ('GET /api/levels/', LevelViewSet, 'list', {}, None),
+                ('GET /api/levels/?course=', LevelViewSet, 'list', {'course': course.pk}, None),
+                ('GET /api/levels/{id}/', LevelViewSet, 'retrieve', {}, level.pk),
+                ('GET /api/lessons/', LessonViewSet, 'list', {}, None),
+                ('GET /api/materials/', MaterialViewSet, 'list', {}, None),
+                ('GET /api/materials/?cursor=', MaterialViewSet, 'list', {'cursor': cursor}, None),
+                ('GET /api/materials/?course=', MaterialViewSet, 'list', {'course': course.pk}, None),
+                ('GET /api/materials/?level=', MaterialViewSet, 'list', {'level': level.pk}, None),
+                ('GET /api/materials/?course=&cursor=', MaterialViewSet, 'list',
+                 {'course': course.pk, 'cursor': cursor}, None),
+                ('GET /api/materials/{id}/', MaterialViewSet, 'retrieve', {}, material.pk),
+            ]
+            results = [(label, self.run_view(*case)) for label, *case in cases]
+            results.append(('scan_materials path lookup', self.capture(
+                lambda: Material.objects.filter(file_path=material.file_path).first()
+            )))
+
+            problems = 0
+            for label, queries in results:
+                self.stdout.write(self.style.MIGRATE_HEADING(label))
+                for sql, params in queries:
+                    plan = self.explain(sql, params)
+                    issues = self.check_plan(sql, plan)
+                    problems += bool(issues)
+                    if issues or options['verbose_plans']:
+                        self.stdout.write(f'  {sql[:160]}')
+                        for line in plan:
+                            self.stdout.write(f'    {line}')
+                        for issue in issues:
+                            self.stdout.write(self.style.ERROR(f'    ! {issue}'))
+                self.stdout.write(f'  {len(queries)} queries')
+            transaction.set_rollback(True)
+
+        if problems:
+            raise CommandError(f'{problems} queries are not fully served by an index')
+        self.stdout.write(self.style.SUCCESS('Every query is served by an index'))
+
+    def capture(self, func):
+        """Runs ``func`` and returns the ``(sql, params)`` it executed"""
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            func()
+        return queries
+
+    def run_view(self, viewset_class, action, params, pk):
+        """The queries of a viewset action: validators, page (or object) and prefetches"""
+        view = viewset_class(action_map={'get': action})
+        view.args, view.kwargs = (), ({'pk': pk} if pk else {})
+        view.format_kwarg = None
+        view.request = view.initialize_request(APIRequestFactory().get('/', params))
+
+        def run():
+            for queryset, extra in getattr(view, 'get_validator_querysets', lambda: [])():
+                queryset_fingerprint(queryset, **extra)
+            if action == 'list':
+                view.paginate_queryset(view.filter_queryset(view.get_queryset()))
+            else:
+                view.get_object()
+
+        return self.capture(run)
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def check_plan(self, sql, plan):
+        issues = []
+        for line in plan:
+            line = line.strip()
+            match = FULL_SCAN.match(line)
+            # Unfiltered aggregates (validators) read every row anyway
+            if match and SELECTIVE_FILTER.search(sql):
+                issues.append(f'full scan of {match.group(1)}')
+            if 'USE TEMP B-TREE FOR ORDER BY' in line and not PREFETCH_FILTER.search(sql):
+                issues.append('sorted without an index')
+        return issues
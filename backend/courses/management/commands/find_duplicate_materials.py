@@ -0,0 +1,95 @@
+from django.core.management.base import BaseCommand
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count
+from courses.hashing import hash_pending_materials
+from courses.models import Material
+
+
+class Command(BaseCommand):
+    help = 'Report materials with identical content and optionally collapse them onto one stored file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hash', action='store_true',
+                            help='Hash materials that do not have a content hash yet before grouping')
+        parser.add_argument('--collapse', action='store_true',
+                            help='Point every duplicate at the oldest material of its group')
+        parser.add_argument('--delete-files', action='store_true',
+                            help='With --collapse, delete uploaded copies that can reuse the canonical upload')
+
+    def handle(self, *args, **options):
+        if options['hash']:
+            hashed = hash_pending_materials()
+            self.stdout.write(f'Hashed {hashed} materials')
+        
+        duplicate_hashes = (
+            Material.objects.filter(content_hash__isnull=False)
+            .values('content_hash')
+            .annotate(copies=Count('id'))
+            .filter(copies__gt=1)
+            .values_list('content_hash', flat=True)
+        )
+        groups = {}
+        for material in (
+            Material.objects.filter(content_hash__in=list(duplicate_hashes))
+            .select_related('course', 'level')
+            .order_by('content_hash', 'created_at', 'pk')
+        ):
+            groups.setdefault(material.content_hash, []).append(material)
+        
+        wasted_bytes = 0
+        collapsed = 0
+        deleted_files = 0
+        for content_hash, materials in groups.items():
+            # Already collapsed groups keep their canonical row
+            canonical = next((m for m in materials if m.duplicate_of_id is None), materials[0])
+            duplicates = [m for m in materials if m.pk != canonical.pk]
+            wasted_bytes += sum(m.file_size or 0 for m in duplicates if m.duplicate_of_id is None)
+            
+            self.stdout.write(f'\n{content_hash[:12]}  {len(materials)} copies, {canonical.file_size or 0} bytes each')
+            for material in materials:
+                marker = '*' if material.pk == canonical.pk else (
+                    '=' if material.duplicate_of_id == canonical.pk else ' '
+                )
+                location = material.file.name if material.file else material.file_path
+                course = material.course.title if material.course else '-'
+                self.stdout.write(f'  {marker} #{material.pk} [{course}] {location}')
+            
+            if options['collapse']:
+                collapsed_now, deleted_now = self.collapse(canonical, duplicates, options['delete_files'])
+                collapsed += collapsed_now
+                deleted_files += deleted_now
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'\n{len(groups)} duplicate groups, {wasted_bytes / (1024 * 1024):.1f} MB stored more than once'
+        ))
+        if options['collapse']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Collapsed {collapsed} materials, deleted {deleted_files} redundant uploaded files'
+            ))
+    
+    def collapse(self, canonical, duplicates, delete_files):
+        """Points duplicates at the canonical material, optionally dropping uploaded copies"""
+        to_collapse = [m for m in duplicates if m.duplicate_of_id != canonical.pk]
+        redundant_files = set()
+        with transaction.atomic():
+            for material in to_collapse:
+                material.duplicate_of = canonical
+            Material.objects.bulk_update(to_collapse, ['duplicate_of'])
+            
+            if delete_files and canonical.file:
+                # Uploaded copies can share the canonical upload by name, so the
+                # rows stay valid even if the canonical row is deleted later
+                for material in duplicates:
+                    if material.file and material.file.name != canonical.file.name:
+                        redundant_files.add(material.file.name)
+                        material.file.name = canonical.file.name
+                Material.objects.bulk_update([m for m in duplicates if m.file], ['file'])
+        
+        deleted = 0
+        for name in redundant_files:
+            if Material.objects.filter(file=name).exists():
+                continue
+            default_storage.delete(name)
+            deleted += 1
+        return len(to_collapse), deleted
@@ -0,0 +1,159 @@
+import os
+import random
+import tempfile
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts.models import User
+from courses.cache import invalidate_all
+from courses.models import Course, Level, Material
+from courses.search import index_objects
+
+
+# (extension, material type, default size) cycled through the materials of a level
+FILE_KINDS = [
+    ('.pdf', 'pdf', '2M'),
+    ('.mp3', 'mp3', '8M'),
+    ('.mp4', 'video', '64M'),
+    ('.jpg', 'image', '300K'),
+]
+
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+BATCH_SIZE = 1000
+
+
+def parse_size(value):
+    """Bytes of a size such as ``512``, ``300K``, ``8M`` or ``1G``"""
+    text = value.strip().upper()
+    unit = text[-1] if text and text[-1] in SIZE_UNITS else ''
+    try:
+        return int(float(text[:len(text) - len(unit)]) * SIZE_UNITS[unit])
+    except ValueError:
+        raise CommandError(f'Invalid size: {value}')
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a synthetic catalog for benchmarks: courses, levels and materials backed by sparse '
+        'files, plus users sharing one password'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=20)
+        parser.add_argument('--levels', type=int, default=5, help='Levels per course')
+        parser.add_argument('--materials', type=int, default=20, help='Materials per level')
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--teachers', type=float, default=0.02, help='Share of the users that are teachers')
+        parser.add_argument('--password', default='catalog-password', help='Password of every generated user')
+        parser.add_argument('--root', help='Directory receiving the files (default: a new temporary directory); '
+                                           'serve it with MATERIALS_ROOT=<root>')
+        parser.add_argument('--prefix', default='catalog',
+                            help='Subdirectory of the files and prefix of titles and usernames')
+        parser.add_argument('--size', action='append', default=[], metavar='TYPE=SIZE',
+                            help='File size of a material type, e.g. video=200M (repeatable)')
+        parser.add_argument('--jitter', type=float, default=0.5,
+                            help='Sizes vary randomly by up to this fraction around the type size')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the size variation')
+
+    def handle(self, *args, **options):
+        sizes = {material_type: parse_size(size) for _, material_type, size in FILE_KINDS}
+        for override in options['size']:
+            material_type, _, size = override.partition('=')
+            if material_type not in sizes:
+                raise CommandError(f'Unknown material type {material_type!r}; one of {", ".join(sizes)}')
+            sizes[material_type] = parse_size(size)
+
+        root = options['root'] or tempfile.mkdtemp(prefix='catalog-')
+        prefix = options['prefix']
+        if os.path.exists(os.path.join(root, prefix)):
+            raise CommandError(f'{os.path.join(root, prefix)} already exists; pick another --prefix or --root')
+
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            courses, levels, materials = self._create_catalog(root, prefix, sizes, rng, options)
+            users = self._create_users(prefix, options)
+        invalidate_all()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {courses} courses, {levels} levels, {materials} materials and {users} users\n'
+            f'Files: {os.path.join(root, prefix)}\n'
+            f'Serve them with MATERIALS_ROOT={root}'
+        ))
+
+    def _create_catalog(self, root, prefix, sizes, rng, options):
+        courses = Course.objects.bulk_create(
+            [
+                Course(
+                    title=f'{prefix} course {n:04d}',
+                    description=f'Synthetic course {n} generated by generate_catalog',
+                    level=Course.LEVEL_CHOICES[n % len(Course.LEVEL_CHOICES)][0],
+                )
+                for n in range(1, options['courses'] + 1)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        levels = Level.objects.bulk_create(
+            [
+                Level(course=course, title=f'Level {n}', level_number=n, order=n)
+                for course in courses
+                for n in range(1, options['levels'] + 1)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+        to_create = []
+        materials = 0
+        for course_number, course in enumerate(courses, start=1):
+            for level in levels[(course_number - 1) * options['levels']:course_number * options['levels']]:
+                directory = os.path.join(prefix, f'course-{course_number:04d}', f'level-{level.level_number:02d}')
+                os.makedirs(os.path.join(root, directory))
+                for n in range(1, options['materials'] + 1):
+                    extension, material_type, _ = FILE_KINDS[(n - 1) % len(FILE_KINDS)]
+                    size = max(1, int(sizes[material_type] * (1 + rng.uniform(-1, 1) * options['jitter'])))
+                    file_path = os.path.join(directory, f'material-{n:04d}{extension}')
+                    # Sparse: the size is reported and served, no blocks are written
+                    with open(os.path.join(root, file_path), 'wb') as f:
+                        f.truncate(size)
+                    to_create.append(Material(
+                        course=course,
+                        level=level,
+                        title=f'Material {n}{extension}',
+                        file_path=file_path,
+                        material_type=material_type,
+                        file_size=size,
+                        order=n,
+                    ))
+                    if len(to_create) >= BATCH_SIZE:
+                        materials += self._flush_materials(to_create)
+                        to_create = []
+        materials += self._flush_materials(to_create)
+
+        # Bulk writes send no post_save signals
+        index_objects('course', [course.pk for course in courses])
+        index_objects('level', [level.pk for level in levels])
+        return len(courses), len(levels), materials
+
+    def _flush_materials(self, materials):
+        created = Material.objects.bulk_create(materials, batch_size=BATCH_SIZE)
+        index_objects('material', [material.pk for material in created])
+        return len(created)
+
+    def _create_users(self, prefix, options):
+        # Hashing is the slow part of creating users: every one gets the same hash
+        password = make_password(options['password'])
+        # At least one teacher, to upload with
+        teachers = max(1, int(options['users'] * options['teachers'])) if options['users'] else 0
+        users = [
+            User(
+                username=f'{prefix}-user-{n:05d}',
+                email=f'{prefix}-user-{n:05d}@example.com',
+                password=password,
+                user_type='teacher' if n <= teachers else 'student',
+            )
+            for n in range(1, options['users'] + 1)
+        ]
+        User.objects.bulk_create(users, batch_size=BATCH_SIZE, ignore_conflicts=True)
+        return len(users)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from courses.sync import get_sync_settings, prune_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Delete the tombstones of deleted catalog rows older than COURSES_SYNC["TOMBSTONE_RETENTION_DAYS"]'
+
+    def handle(self, *args, **options):
+        deleted = prune_tombstones()
+        days = get_sync_settings()['TOMBSTONE_RETENTION_DAYS']
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} tombstones older than {days} days'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from courses.search import SEARCH_BATCH_SIZE, index_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of courses, levels, lessons and materials (SQLite FTS5)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SEARCH_BATCH_SIZE,
+                            help='Rows read and indexed per batch')
+
+    def handle(self, *args, **options):
+        if not index_available():
+            raise CommandError('The search index is only kept on SQLite; other databases search without it')
+
+        def progress(kind, count):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {kind}: {count}')
+
+        # One transaction: searches keep reading the previous index until it is replaced
+        with transaction.atomic():
+            counts = rebuild_index(batch_size=options['batch_size'], progress=progress)
+        summary = ', '.join(f'{count} {kind}s' for kind, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Indexed {summary}'))
@@ -1,12 +1,26 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from courses.models import Material
+from courses.hashing import hash_pending_materials
+from courses.media_metadata import extract_pending_metadata
+from courses.scanner import DEFAULT_BATCH_SIZE, scan_materials
 import os
 
 
 class Command(BaseCommand):
     help = 'Scan the materials directory and create Material objects'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would change without writing to the database')
+        parser.add_argument('--full', action='store_true',
+                            help='Ignore the directory manifest and re-examine every directory')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Rows per bulk_create/bulk_update batch')
+        parser.add_argument('--no-hash', action='store_true',
+                            help='Do not compute content hashes for new and changed files')
+        parser.add_argument('--no-metadata', action='store_true',
+                            help='Do not read duration, page count and dimensions of new and changed files')
+
     def handle(self, *args, **options):
         materials_root = settings.MATERIALS_ROOT
         
@@ -15,43 +29,37 @@ class Command(BaseCommand):
             return
         
         self.stdout.write(f'Scanning materials directory: {materials_root}')
-        created_count = 0
-        existing_count = 0
+        report = scan_materials(
+            materials_root,
+            dry_run=options['dry_run'],
+            full=options['full'],
+            batch_size=options['batch_size'],
+        )
         
-        # Walk through the directory structure
-        for root, dirs, files in os.walk(materials_root):
-            for file in files:
-                if file.lower().endswith(('.pdf', '.mp3', '.mp4', '.jpg', '.jpeg', '.png')):
-                    file_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(file_path, materials_root)
-                    
-                    # Determine material type
-                    ext = os.path.splitext(file)[1].lower()
-                    material_type_map = {
-                        '.pdf': 'pdf',
-                        '.mp3': 'mp3',
-                        '.mp4': 'video',
-                        '.jpg': 'image',
-                        '.jpeg': 'image',
-                        '.png': 'image',
-                    }
-                    material_type = material_type_map.get(ext, 'other')
-                    
-                    # Check if material already exists
-                    if not Material.objects.filter(file_path=relative_path).exists():
-                        Material.objects.create(
-                            title=file,
-                            file_path=relative_path,
-                            material_type=material_type,
-                            file_size=os.path.getsize(file_path) if os.path.exists(file_path) else None
-                        )
-                        created_count += 1
-                        self.stdout.write(self.style.SUCCESS(f'Created: {relative_path}'))
-                    else:
-                        existing_count += 1
+        prefix = 'Would create' if report.dry_run else 'Created'
+        if options['verbosity'] >= 2:
+            for path in report.created:
+                self.stdout.write(self.style.SUCCESS(f'{prefix}: {path}'))
+        for path in report.changed:
+            self.stdout.write(self.style.WARNING(f'Changed: {path}'))
+        for path in report.deleted:
+            self.stdout.write(self.style.WARNING(f'Deleted from disk: {path}'))
         
         self.stdout.write(self.style.SUCCESS(
-            f'\nScan completed!\n'
-            f'Created: {created_count} new materials\n'
-            f'Existing: {existing_count} materials already in database'
+            f'\nScan completed{" (dry run)" if report.dry_run else ""} in {report.duration:.1f}s!\n'
+            f'{prefix}: {len(report.created)} new materials\n'
+            f'Changed: {len(report.changed)} materials with a new size\n'
+            f'Deleted: {len(report.deleted)} materials missing on disk\n'
+            f'Existing: {report.existing_count} materials already in database\n'
+            f'Directories: {report.directories_scanned} scanned, {report.directories_skipped} unchanged'
         ))
+        
+        if not report.dry_run and not options['no_hash']:
+            self.stdout.write('Hashing new and changed materials...')
+            hashed = hash_pending_materials()
+            self.stdout.write(self.style.SUCCESS(f'Hashed: {hashed} materials'))
+        
+        if not report.dry_run and not options['no_metadata']:
+            self.stdout.write('Reading media metadata...')
+            processed = extract_pending_metadata()
+            self.stdout.write(self.style.SUCCESS(f'Metadata: {processed} materials'))
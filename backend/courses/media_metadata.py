@@ -0,0 +1,668 @@
+"""
+Media metadata extraction for materials: duration of audio/video, page
+count of PDFs and pixel dimensions of images and videos.
+
+The readers are pure Python and seek straight to the structures they need
+instead of reading whole files:
+
+- MP3: ID3v2 tags are skipped, then the first frame header is read. The
+  frame count comes from its Xing/Info or VBRI header. CBR files without
+  one are timed from the audio size and bitrate.
+- WAV: RIFF chunk headers are walked up to ``fmt `` and ``data``.
+- MP4/MOV: atom headers are walked (large ``mdat`` atoms are skipped) to
+  ``moov/mvhd`` for the duration and ``moov/trak/tkhd`` for the size.
+- PDF: ``startxref`` leads to the cross-reference table or stream, which
+  leads to the catalog and the ``/Count`` of the page tree root. Object
+  streams are supported.
+- Images: Django's ``get_image_dimensions`` feeds the header to Pillow
+  chunk by chunk and stops as soon as the size is known.
+
+Extraction runs in the background pool after uploads and scans, and stores
+its results on the Material rows.
+"""
+import logging
+import os
+import re
+import struct
+import zlib
+
+from django.core.files.images import get_image_dimensions
+from django.db.models import Q
+from django.utils import timezone
+
+from . import background
+from .cache import invalidate_all
+from .models import Material
+
+logger = logging.getLogger(__name__)
+
+# Rows updated per bulk_update
+METADATA_BATCH_SIZE = 200
+
+METADATA_FIELDS = ['duration', 'page_count', 'width', 'height']
+
+
+class MetadataError(Exception):
+    """The file does not have the structure its extension promises"""
+
+
+def _read_exact(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise MetadataError('unexpected end of file')
+    return data
+
+
+# MP3 -----------------------------------------------------------------------
+
+# Bitrates in kbps by (MPEG version 1?, layer)
+MP3_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+# Sample rates by version bits (0: MPEG 2.5, 2: MPEG 2, 3: MPEG 1)
+MP3_SAMPLE_RATES = {
+    0: (11025, 12000, 8000),
+    2: (22050, 24000, 16000),
+    3: (44100, 48000, 32000),
+}
+
+# How far past the ID3 tag the first frame is looked for
+MP3_SYNC_WINDOW = 64 * 1024
+
+
+def _parse_mp3_header(header):
+    """Returns ``(frame_length, frame_info)`` for a 4 byte frame header, or ``None``"""
+    value = struct.unpack('>I', header)[0]
+    if value >> 21 != 0x7FF:
+        return None
+    version_bits = (value >> 19) & 3
+    layer = 4 - ((value >> 17) & 3)
+    bitrate_index = (value >> 12) & 0xF
+    sample_rate_index = (value >> 10) & 3
+    if version_bits == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    mpeg1 = version_bits == 3
+    bitrate = MP3_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version_bits][sample_rate_index]
+    padding = (value >> 9) & 1
+    mono = (value >> 6) & 3 == 3
+
+    if layer == 1:
+        samples_per_frame = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples_per_frame = 1152 if mpeg1 or layer == 2 else 576
+        frame_length = samples_per_frame // 8 * bitrate // sample_rate + padding
+    return frame_length, {
+        'mpeg1': mpeg1,
+        'layer': layer,
+        'bitrate': bitrate,
+        'sample_rate': sample_rate,
+        'samples_per_frame': samples_per_frame,
+        'mono': mono,
+    }
+
+
+def _skip_id3v2(f):
+    """Returns the offset of the first byte after the ID3v2 tags"""
+    offset = 0
+    while True:
+        f.seek(offset)
+        header = f.read(10)
+        if len(header) < 10 or header[:3] != b'ID3':
+            return offset
+        size = 0
+        for byte in header[6:10]:
+            size = (size << 7) | (byte & 0x7F)
+        offset += 10 + size + (10 if header[5] & 0x10 else 0)
+
+
+def read_mp3(f, size):
+    start = _skip_id3v2(f)
+    f.seek(start)
+    window = f.read(MP3_SYNC_WINDOW)
+    position = window.find(b'\xff')
+    while 0 <= position <= len(window) - 4:
+        parsed = _parse_mp3_header(window[position:position + 4])
+        if parsed is not None:
+            frame_length, info = parsed
+            # A real frame is followed by another one (or the end of the file)
+            f.seek(start + position + frame_length)
+            following = f.read(4)
+            if len(following) < 4 or _parse_mp3_header(following) is not None:
+                break
+        position = window.find(b'\xff', position + 1)
+    else:
+        raise MetadataError('no MPEG audio frame found')
+
+    frame_offset = start + position
+    if info['mpeg1']:
+        side_info = 17 if info['mono'] else 32
+    else:
+        side_info = 9 if info['mono'] else 17
+    f.seek(frame_offset + 4 + side_info)
+    xing = f.read(12)
+    frames = None
+    if xing[:4] in (b'Xing', b'Info') and len(xing) == 12:
+        flags = struct.unpack('>I', xing[4:8])[0]
+        if flags & 1:
+            frames = struct.unpack('>I', xing[8:12])[0]
+    else:
+        f.seek(frame_offset + 4 + 32)
+        vbri = f.read(18)
+        if vbri[:4] == b'VBRI' and len(vbri) == 18:
+            frames = struct.unpack('>I', vbri[14:18])[0]
+
+    if frames:
+        return {'duration': frames * info['samples_per_frame'] / info['sample_rate']}
+
+    audio_end = size
+    if size >= 128:
+        f.seek(size - 128)
+        if f.read(3) == b'TAG':
+            audio_end -= 128
+    return {'duration': (audio_end - frame_offset) * 8 / info['bitrate']}
+
+
+# WAV -----------------------------------------------------------------------
+
+def read_wav(f, size):
+    header = _read_exact(f, 12)
+    if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+        raise MetadataError('not a RIFF/WAVE file')
+    byte_rate = None
+    offset = 12
+    while offset + 8 <= size:
+        f.seek(offset)
+        chunk_id, chunk_size = struct.unpack('<4sI', _read_exact(f, 8))
+        if chunk_id == b'fmt ':
+            fmt = _read_exact(f, 16)
+            byte_rate = struct.unpack('<I', fmt[8:12])[0]
+        elif chunk_id == b'data':
+            if not byte_rate:
+                raise MetadataError('data chunk before fmt chunk')
+            # Streamed recordings may leave the size unset (0 or 0xFFFFFFFF)
+            data_size = min(chunk_size, size - offset - 8) or size - offset - 8
+            return {'duration': data_size / byte_rate}
+        # Chunks are padded to an even size
+        offset += 8 + chunk_size + (chunk_size & 1)
+    raise MetadataError('no data chunk')
+
+
+# MP4 / QuickTime -----------------------------------------------------------
+
+def _atoms(f, start, end):
+    """Yields ``(type, payload_offset, payload_end)`` for the atoms between start and end"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        atom_size, atom_type = struct.unpack('>I4s', _read_exact(f, 8))
+        header_size = 8
+        if atom_size == 1:
+            atom_size = struct.unpack('>Q', _read_exact(f, 8))[0]
+            header_size = 16
+        elif atom_size == 0:
+            atom_size = end - offset
+        if atom_size < header_size:
+            raise MetadataError('invalid atom size')
+        yield atom_type, offset + header_size, min(offset + atom_size, end)
+        offset += atom_size
+
+
+def _read_mvhd(f, offset):
+    f.seek(offset)
+    version = _read_exact(f, 4)[0]
+    if version == 1:
+        timescale, duration = struct.unpack('>16xIQ', _read_exact(f, 28))
+        unknown = 0xFFFFFFFFFFFFFFFF
+    else:
+        timescale, duration = struct.unpack('>8xII', _read_exact(f, 16))
+        unknown = 0xFFFFFFFF
+    if not timescale or duration == unknown:
+        return None
+    return duration / timescale
+
+
+def _read_tkhd_size(f, offset):
+    f.seek(offset)
+    version = _read_exact(f, 4)[0]
+    f.seek(offset + 4 + (84 if version == 1 else 72))
+    width, height = struct.unpack('>II', _read_exact(f, 8))
+    # 16.16 fixed point
+    return width >> 16, height >> 16
+
+
+def read_mp4(f, size):
+    result = {}
+    for atom_type, start, end in _atoms(f, 0, size):
+        if atom_type != b'moov':
+            continue
+        for child_type, child_start, child_end in _atoms(f, start, end):
+            if child_type == b'mvhd':
+                duration = _read_mvhd(f, child_start)
+                if duration is not None:
+                    result['duration'] = duration
+            elif child_type == b'trak' and 'width' not in result:
+                for track_type, track_start, _ in _atoms(f, child_start, child_end):
+                    if track_type == b'tkhd':
+                        width, height = _read_tkhd_size(f, track_start)
+                        # Audio tracks have no size
+                        if width and height:
+                            result['width'], result['height'] = width, height
+                        break
+        return result
+    raise MetadataError('no moov atom')
+
+
+# PDF -----------------------------------------------------------------------
+
+# Bytes read from the end of the file to find startxref
+PDF_TAIL_SIZE = 2048
+
+# Files whose cross-reference data is broken are scanned for the page tree
+# root only up to this size
+PDF_RECOVERY_SCAN_LIMIT = 8 * 1024 * 1024
+
+PDF_OBJECT_READ_SIZE = 4096
+PDF_MAX_TREE_DEPTH = 32
+PDF_MAX_OBJECT_SIZE = 1024 * 1024
+
+
+def _pdf_int(dictionary, key):
+    match = re.search(rb'/' + key + rb'\s+(\d+)(?!\s+\d+\s+R)', dictionary)
+    return int(match.group(1)) if match else None
+
+
+def _pdf_ref(dictionary, key):
+    match = re.search(rb'/' + key + rb'\s+(\d+)\s+\d+\s+R', dictionary)
+    return int(match.group(1)) if match else None
+
+
+def _pdf_array(dictionary, key):
+    match = re.search(rb'/' + key + rb'\s*\[([^\]]*)\]', dictionary)
+    return [int(value) for value in match.group(1).split()] if match else None
+
+
+def _png_unpredict(data, columns):
+    """Reverses the PNG row filters (predictors 10-15) of a one-byte-per-pixel stream"""
+    row_length = columns + 1
+    previous = bytearray(columns)
+    output = bytearray()
+    for start in range(0, len(data) - row_length + 1, row_length):
+        filter_type = data[start]
+        row = bytearray(data[start + 1:start + row_length])
+        for i in range(columns):
+            left = row[i - 1] if i else 0
+            up = previous[i]
+            if filter_type == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif filter_type == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif filter_type == 3:
+                row[i] = (row[i] + (left + up) // 2) & 0xFF
+            elif filter_type == 4:
+                up_left = previous[i - 1] if i else 0
+                estimate = left + up - up_left
+                distances = (abs(estimate - left), abs(estimate - up), abs(estimate - up_left))
+                predictor = (left, up, up_left)[distances.index(min(distances))]
+                row[i] = (row[i] + predictor) & 0xFF
+        output += row
+        previous = row
+    return bytes(output)
+
+
+class PdfReader:
+    """Follows the cross-reference data of a PDF to the objects it needs"""
+
+    def __init__(self, f, size):
+        self.f = f
+        self.size = size
+        # Newest first: classic subsections as ('table', first, count, position),
+        # xref streams as ('stream', {number: entry})
+        self.sections = []
+        self._object_streams = {}
+
+    def catalog(self):
+        return self.get_object(self._load_xref())
+
+    def page_count(self):
+        pages = self.get_object(_pdf_ref(self.catalog(), b'Pages'))
+        count = _pdf_int(pages, b'Count')
+        if count is None:
+            count = int(self.get_object(_pdf_ref(pages, b'Count')).strip())
+        return count
+
+    def first_page(self):
+        """Body of the first leaf of the page tree"""
+        node = self.get_object(_pdf_ref(self.catalog(), b'Pages'))
+        for _ in range(PDF_MAX_TREE_DEPTH):
+            if not re.search(rb'/Type\s*/Pages\b', node):
+                return node
+            first_kid = re.search(rb'/Kids\s*\[\s*(\d+)\s+\d+\s+R', node)
+            if not first_kid:
+                raise MetadataError('empty page tree')
+            node = self.get_object(int(first_kid.group(1)))
+        raise MetadataError('page tree too deep')
+
+    def first_page_jpeg(self):
+        """Raw bytes of the first JPEG image used by the first page, or ``None``"""
+        node = self.first_page()
+        # Resources may be inherited from the ancestors of the page
+        for _ in range(PDF_MAX_TREE_DEPTH):
+            if b'/Resources' in node:
+                break
+            parent = _pdf_ref(node, b'Parent')
+            if parent is None:
+                return None
+            node = self.get_object(parent)
+        resources_ref = _pdf_ref(node, b'Resources')
+        resources = self.get_object(resources_ref) if resources_ref is not None else node
+
+        xobjects_ref = _pdf_ref(resources, b'XObject')
+        if xobjects_ref is not None:
+            xobjects = self.get_object(xobjects_ref)
+        else:
+            inline = re.search(rb'/XObject\s*<<(.*?)>>', resources, re.S)
+            if not inline:
+                return None
+            xobjects = inline.group(1)
+
+        for number in re.findall(rb'(\d+)\s+\d+\s+R', xobjects):
+            entry = self._lookup(int(number))
+            if entry is None or entry[0] != 1:
+                continue
+            body = self._read_object_at(entry[1])[0]
+            if re.search(rb'/Subtype\s*/Image\b', body) and b'/DCTDecode' in body:
+                return self._read_object_at(entry[1], with_stream=True, decode=False)[1]
+        return None
+
+    def _load_xref(self):
+        self.f.seek(max(self.size - PDF_TAIL_SIZE, 0))
+        matches = re.findall(rb'startxref\s+(\d+)', self.f.read(PDF_TAIL_SIZE))
+        if not matches:
+            raise MetadataError('startxref not found')
+        root = None
+        pending = [int(matches[-1])]
+        visited = set()
+        while pending:
+            offset = pending.pop(0)
+            if offset in visited:
+                continue
+            visited.add(offset)
+            trailer = self._read_xref_section(offset)
+            if root is None:
+                root = _pdf_ref(trailer, b'Root')
+            # Hybrid files keep compressed entries in a separate xref stream
+            for key in (b'XRefStm', b'Prev'):
+                value = _pdf_int(trailer, key)
+                if value is not None:
+                    pending.append(value)
+        if root is None:
+            raise MetadataError('no /Root in trailer')
+        return root
+
+    def _read_xref_section(self, offset):
+        """Registers one xref section and returns its trailer dictionary"""
+        self.f.seek(offset)
+        head = self.f.read(64)
+        if not head.startswith(b'xref'):
+            dictionary, data = self._read_object_at(offset, with_stream=True)
+            self.sections.append(('stream', self._parse_xref_stream(dictionary, data)))
+            return dictionary
+
+        position = offset + 4
+        while True:
+            self.f.seek(position)
+            chunk = self.f.read(64)
+            match = re.match(rb'\s*(\d+)\s+(\d+)[ \t]*\r?\n?', chunk)
+            if not match:
+                break
+            first, count = int(match.group(1)), int(match.group(2))
+            entries_start = position + match.end()
+            self.sections.append(('table', first, count, entries_start))
+            position = entries_start + count * 20
+        trailer = self._read_until(position, rb'>>\s*startxref|startxref')
+        if b'trailer' not in trailer:
+            raise MetadataError('trailer not found')
+        return trailer
+
+    def _read_until(self, offset, pattern):
+        """Reads from ``offset`` until ``pattern`` shows up"""
+        read_size = PDF_OBJECT_READ_SIZE
+        while True:
+            self.f.seek(offset)
+            data = self.f.read(read_size)
+            match = re.search(pattern, data)
+            if match:
+                return data[:match.end()]
+            if len(data) < read_size or read_size >= PDF_MAX_OBJECT_SIZE:
+                return data
+            read_size *= 4
+
+    def _parse_xref_stream(self, dictionary, data):
+        widths = _pdf_array(dictionary, b'W')
+        index = _pdf_array(dictionary, b'Index') or [0, _pdf_int(dictionary, b'Size')]
+        if not widths or None in index:
+            raise MetadataError('invalid xref stream')
+        entries = {}
+        position = 0
+        for first, count in zip(index[::2], index[1::2]):
+            for number in range(first, first + count):
+                fields = []
+                for width in widths:
+                    fields.append(int.from_bytes(data[position:position + width], 'big') if width else None)
+                    position += width
+                entry_type = 1 if fields[0] is None else fields[0]
+                if entry_type in (1, 2):
+                    entries.setdefault(number, (entry_type, fields[1], fields[2] or 0))
+        return entries
+
+    def _lookup(self, number):
+        for section in self.sections:
+            if section[0] == 'stream':
+                if number in section[1]:
+                    return section[1][number]
+                continue
+            _, first, count, position = section
+            if first <= number < first + count:
+                self.f.seek(position + (number - first) * 20)
+                entry = self.f.read(20).split()
+                if len(entry) >= 3 and entry[2] == b'n':
+                    return 1, int(entry[0]), 0
+                # Free here: hybrid files list compressed objects in their
+                # xref stream instead
+        return None
+
+    def get_object(self, number):
+        """Returns the body of object ``number`` (stream data excluded)"""
+        if number is None:
+            raise MetadataError('missing object reference')
+        entry = self._lookup(number)
+        if entry is None:
+            raise MetadataError(f'object {number} not found')
+        if entry[0] == 1:
+            return self._read_object_at(entry[1])[0]
+        return self._object_from_stream(entry[1], entry[2])
+
+    def _read_object_at(self, offset, with_stream=False, decode=True):
+        data = self._read_until(offset, rb'endobj|stream\r?\n')
+        match = re.match(rb'\s*\d+\s+\d+\s+obj', data)
+        if not match:
+            raise MetadataError(f'no object at offset {offset}')
+        body_end = re.search(rb'endobj|stream\r?\n', data)
+        body = data[match.end():body_end.start() if body_end else len(data)]
+        if not with_stream:
+            return body, None
+        if not body_end or not body_end.group(0).startswith(b'stream'):
+            raise MetadataError('stream expected')
+        length = _pdf_int(body, b'Length')
+        if length is None:
+            length = int(self.get_object(_pdf_ref(body, b'Length')).strip())
+        self.f.seek(offset + body_end.end())
+        data = _read_exact(self.f, length)
+        return body, self._decode_stream(body, data) if decode else data
+
+    def _decode_stream(self, dictionary, data):
+        filters = re.search(rb'/Filter\s*(\[[^\]]*\]|/\w+)', dictionary)
+        if filters:
+            names = re.findall(rb'/(\w+)', filters.group(1))
+            if names != [b'FlateDecode']:
+                raise MetadataError('unsupported stream filter')
+            data = zlib.decompress(data)
+            predictor = _pdf_int(dictionary, b'Predictor') or 1
+            if predictor >= 10:
+                data = _png_unpredict(data, _pdf_int(dictionary, b'Columns') or 1)
+        return data
+
+    def _object_from_stream(self, stream_number, index):
+        if stream_number not in self._object_streams:
+            entry = self._lookup(stream_number)
+            if entry is None or entry[0] != 1:
+                raise MetadataError(f'object stream {stream_number} not found')
+            dictionary, data = self._read_object_at(entry[1], with_stream=True)
+            first = _pdf_int(dictionary, b'First')
+            numbers = [int(value) for value in data[:first].split()]
+            offsets = [first + offset for offset in numbers[1::2]] + [len(data)]
+            self._object_streams[stream_number] = (data, offsets)
+        data, offsets = self._object_streams[stream_number]
+        return data[offsets[index]:offsets[index + 1]]
+
+
+def _recover_pdf_page_count(f, size):
+    """Largest /Count of a /Type /Pages node, for files with broken xref data"""
+    if size > PDF_RECOVERY_SCAN_LIMIT:
+        return None
+    f.seek(0)
+    data = f.read()
+    counts = []
+    for match in re.finditer(rb'/Type\s*/Pages\b', data):
+        start = data.rfind(b'obj', 0, match.start())
+        end = data.find(b'endobj', match.end())
+        count = _pdf_int(data[max(start, 0):end if end != -1 else len(data)], b'Count')
+        if count is not None:
+            counts.append(count)
+    return max(counts) if counts else None
+
+
+def read_pdf(f, size):
+    header = f.read(1024)
+    if b'%PDF-' not in header:
+        raise MetadataError('not a PDF file')
+    try:
+        page_count = PdfReader(f, size).page_count()
+    except (MetadataError, ValueError, IndexError, TypeError, zlib.error) as e:
+        logger.debug('Falling back to a full scan of a PDF: %s', e)
+        page_count = _recover_pdf_page_count(f, size)
+    return {'page_count': page_count} if page_count is not None else {}
+
+
+def read_image(f, size):
+    width, height = get_image_dimensions(f)
+    if width is None:
+        raise MetadataError('unrecognised image')
+    return {'width': width, 'height': height}
+
+
+READERS = {
+    '.mp3': read_mp3,
+    '.wav': read_wav,
+    '.mp4': read_mp4,
+    '.m4v': read_mp4,
+    '.m4a': read_mp4,
+    '.mov': read_mp4,
+    '.pdf': read_pdf,
+    '.jpg': read_image,
+    '.jpeg': read_image,
+    '.png': read_image,
+    '.gif': read_image,
+    '.webp': read_image,
+}
+
+
+def extract_file_metadata(path):
+    """
+    Returns a dict with the ``duration`` (seconds), ``page_count``,
+    ``width`` and ``height`` found in the file; keys that do not apply are
+    left out. Raises MetadataError for files that cannot be parsed.
+    """
+    reader = READERS.get(os.path.splitext(path)[1].lower())
+    if reader is None:
+        return {}
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        try:
+            return reader(f, size)
+        except (struct.error, ValueError, IndexError, KeyError) as e:
+            raise MetadataError(str(e)) from e
+
+
+def _material_metadata(material):
+    path = material.get_full_path()
+    if not path:
+        return {}
+    try:
+        metadata = extract_file_metadata(path)
+    except (OSError, MetadataError) as e:
+        logger.warning('Could not read metadata of material %s (%s): %s', material.pk, path, e)
+        return {}
+    if 'duration' in metadata:
+        metadata['duration'] = round(metadata['duration'])
+    return metadata
+
+
+def extract_materials_metadata(queryset):
+    """
+    Extracts the metadata of the materials of ``queryset`` and stores it
+    with one bulk_update per batch. Every material is marked as processed,
+    including files that could not be parsed, so they are not retried until
+    their content changes. Returns the number of materials processed.
+    """
+    ids = list(queryset.values_list('pk', flat=True))
+    for start in range(0, len(ids), METADATA_BATCH_SIZE):
+        batch = list(
+            Material.objects.filter(pk__in=ids[start:start + METADATA_BATCH_SIZE])
+            .select_related('duplicate_of')
+            .only('pk', 'file', 'file_path', *METADATA_FIELDS, 'duplicate_of__file', 'duplicate_of__file_path')
+        )
+        now = timezone.now()
+        for material in batch:
+            for field, value in _material_metadata(material).items():
+                setattr(material, field, value)
+            material.metadata_extracted_at = now
+            # bulk_update skips auto_now; the ETags depend on updated_at
+            material.updated_at = now
+        Material.objects.bulk_update(batch, [*METADATA_FIELDS, 'metadata_extracted_at', 'updated_at'])
+    if ids:
+        # The new fields are part of the cached material payloads
+        invalidate_all()
+    return len(ids)
+
+
+def pending_metadata_materials():
+    """Materials with a file whose metadata has not been extracted yet"""
+    has_file = Q(file_path__isnull=False) | (Q(file__isnull=False) & ~Q(file=''))
+    return Material.objects.filter(has_file, metadata_extracted_at__isnull=True)
+
+
+def extract_pending_metadata():
+    return extract_materials_metadata(pending_metadata_materials())
+
+
+def schedule_metadata_extraction(material_ids=None):
+    """
+    Extracts metadata in the background pool: for the given ids, or for
+    every material still pending.
+    """
+    def job():
+        queryset = pending_metadata_materials()
+        if material_ids is not None:
+            queryset = queryset.filter(pk__in=material_ids)
+        extract_materials_metadata(queryset)
+
+    return background.submit(job)
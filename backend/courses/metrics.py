@@ -0,0 +1,391 @@
+"""
+Counters, gauges and histograms exposed in the Prometheus text format at
+``/api/metrics/`` (staff users, or scrapers sending
+``Authorization: Bearer <COURSES_METRICS['SCRAPE_TOKEN']>``).
+
+Values are kept in memory by every process. With several worker processes
+(gunicorn, the management commands) ``COURSES_METRICS['DIRECTORY']`` must
+name a directory shared by all of them: each process writes its values to
+``<pid>.json`` there at most every ``FLUSH_INTERVAL`` seconds and at exit,
+and the process answering a scrape adds up the files of the others.
+Counters and histograms of processes that exited keep counting; gauges
+only include live processes. Empty the directory when the server is
+restarted.
+
+Request counts and latencies per route (method and URL name, e.g.
+``GET material-file``) are recorded by MetricsMiddleware; the other
+metrics where the work is done (file serving, uploads, scans, JWT
+authentication).
+"""
+import atexit
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.permissions import BasePermission
+
+
+DEFAULT_SETTINGS = {
+    'DIRECTORY': None,
+    'FLUSH_INTERVAL': 5,
+    'SCRAPE_TOKEN': '',
+}
+
+# Seconds; request latencies
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Seconds; scans and upload sessions
+LONG_BUCKETS = (1, 5, 15, 60, 300, 900, 3600, 4 * 3600, 24 * 3600)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_config = None
+
+
+def get_metrics_settings():
+    global _config
+    if _config is None:
+        _config = {**DEFAULT_SETTINGS, **getattr(settings, 'COURSES_METRICS', {})}
+    return _config
+
+
+@receiver(setting_changed)
+def reset_metrics_settings(setting, **kwargs):
+    global _config
+    if setting == 'COURSES_METRICS':
+        _config = None
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._registry = registry
+        self._values = {}
+        registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} takes the labels {self.labelnames}, not {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """``[[label values, value], ...]``, as stored in the process files"""
+        with self._registry.lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        return total + value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._registry.lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._registry.changed()
+
+    def expose(self, values):
+        for key, value in values.items():
+            yield f'{self.name}{_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._registry.lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._registry.changed()
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def expose(self, values):
+        for key, value in values.items():
+            yield f'{self.name}{_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(registry, name, documentation, labelnames)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._registry.lock:
+            # [count per bucket..., count above the last bucket, sum]
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+        self._registry.changed()
+
+    def samples(self):
+        with self._registry.lock:
+            return [[list(key), list(counts)] for key, counts in self._values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        return [a + b for a, b in zip(total, value)]
+
+    def expose(self, values):
+        for key, counts in values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                le = (('le', _format_value(bound) if bound != float('inf') else '+Inf'),)
+                yield f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, key)} {_format_value(counts[-1])}'
+            yield f'{self.name}_count{_labels(self.labelnames, key)} {cumulative}'
+
+
+class Registry:
+    """The metrics of this process, written to / merged with the other processes' files"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._metrics = {}
+        self._last_flush = time.monotonic()
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self._metrics[metric.name] = metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return Counter(self, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return Gauge(self, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return Histogram(self, name, documentation, labelnames, buckets)
+
+    def snapshot(self):
+        return {name: metric.samples() for name, metric in self._metrics.items()}
+
+    def changed(self):
+        """Writes the process file once FLUSH_INTERVAL has passed since the last write"""
+        if time.monotonic() - self._last_flush >= get_metrics_settings()['FLUSH_INTERVAL']:
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        directory = get_metrics_settings()['DIRECTORY']
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        data = json.dumps({'pid': os.getpid(), 'metrics': self.snapshot()})
+        # Readers never see a half-written file
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            os.replace(temporary, os.path.join(directory, f'{os.getpid()}.json'))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def _other_processes(self):
+        """``(pid, metrics)`` from the files of the other processes"""
+        directory = get_metrics_settings()['DIRECTORY']
+        if not directory or not os.path.isdir(directory):
+            return
+        own = f'{os.getpid()}.json'
+        for name in os.listdir(directory):
+            if not name.endswith('.json') or name == own:
+                continue
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            yield data['pid'], data['metrics']
+
+    def collect(self):
+        """``{name: {label values: merged value}}`` over every process"""
+        merged = {name: {} for name in self._metrics}
+
+        def add(name, samples):
+            metric = self._metrics.get(name)
+            if metric is None:
+                return
+            values = merged[name]
+            for key, value in samples:
+                key = tuple(key)
+                values[key] = metric.merge(values[key], value) if key in values else value
+
+        for name, samples in self.snapshot().items():
+            add(name, samples)
+        for pid, metrics in self._other_processes():
+            alive = _process_alive(pid)
+            for name, samples in metrics.items():
+                metric = self._metrics.get(name)
+                if metric is not None and (metric.kind != 'gauge' or alive):
+                    add(name, samples)
+        return merged
+
+    def exposition(self):
+        """Every metric in the Prometheus text format (version 0.0.4)"""
+        lines = []
+        for name, values in self.collect().items():
+            metric = self._metrics[name]
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            lines.extend(metric.expose(dict(sorted(values.items()))))
+        return '\n'.join(lines) + '\n'
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+http_requests = registry.counter(
+    'http_requests_total', 'HTTP requests by route (method and URL name) and status', ['route', 'status'],
+)
+http_request_duration = registry.histogram(
+    'http_request_duration_seconds', 'Time until the view returned its response', ['route'],
+)
+material_bytes_served = registry.counter(
+    'material_bytes_served_total', 'Bytes of material files handed to the server or proxy', ['material_type'],
+)
+material_open_streams = registry.gauge(
+    'material_open_streams', 'Material file responses not closed yet',
+)
+upload_bytes = registry.counter(
+    'material_upload_bytes_total', 'Bytes of uploaded material files written to disk', ['kind'],
+)
+upload_duration = registry.histogram(
+    'material_upload_duration_seconds', 'Time from opening a resumable upload to finalizing it',
+    buckets=LONG_BUCKETS,
+)
+scan_duration = registry.histogram(
+    'scan_materials_duration_seconds', 'Duration of scan_materials runs', ['mode'], buckets=LONG_BUCKETS,
+)
+scan_created = registry.counter(
+    'scan_materials_created_total', 'Materials created by scan_materials',
+)
+jwt_auth_failures = registry.counter(
+    'jwt_auth_failures_total', 'Rejected JWT access tokens by reason', ['reason'],
+)
+
+
+def track_file_stream(request, response, material_type):
+    """Counts ``response`` as an open stream until it is closed, then its bytes as served"""
+    material_open_streams.inc()
+
+    def closed():
+        material_open_streams.dec()
+        if response.status_code in (200, 206) and request.method != 'HEAD':
+            material_bytes_served.inc(int(response.get('Content-Length') or 0), material_type=material_type or '')
+
+    response._resource_closers.append(closed)
+    return response
+
+
+class MetricsMiddleware:
+    """Counts requests and their latency per route, under WSGI and ASGI"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, response, started)
+        return response
+
+    @staticmethod
+    def _observe(request, response, started):
+        match = request.resolver_match
+        route = f'{request.method} {match.view_name if match else "unresolved"}'
+        http_request_duration.observe(time.perf_counter() - started, route=route)
+        http_requests.inc(route=route, status=response.status_code)
+
+
+SCRAPE_TOKEN_AUTH = 'metrics-scrape-token'
+
+
+class ScrapeTokenAuthentication(BaseAuthentication):
+    """Accepts ``Authorization: Bearer <SCRAPE_TOKEN>``; other credentials go to the next class"""
+
+    def authenticate(self, request):
+        token = get_metrics_settings()['SCRAPE_TOKEN']
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if token and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+            return AnonymousUser(), SCRAPE_TOKEN_AUTH
+        return None
+
+
+class CanReadMetrics(BasePermission):
+    """Staff users and scrapers holding the scrape token"""
+
+    def has_permission(self, request, view):
+        if request.auth == SCRAPE_TOKEN_AUTH:
+            return True
+        return bool(request.user and request.user.is_staff)
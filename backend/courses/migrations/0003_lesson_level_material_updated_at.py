@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0002_course_level_course_table_of_contents_material_file_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='level',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='material',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
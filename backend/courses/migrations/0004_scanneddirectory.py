@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0003_lesson_level_material_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScannedDirectory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(help_text="Path relative to MATERIALS_ROOT ('.' for the root)", max_length=500, unique=True)),
+                ('mtime_ns', models.BigIntegerField()),
+                ('scanned_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['path'],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0004_scanneddirectory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='material',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of the file content', max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='material',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, help_text='Material whose stored file is served for this one', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='courses.material'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='material',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, help_text='Height in pixels for images/video', null=True),
+        ),
+        migrations.AddField(
+            model_name='material',
+            name='metadata_extracted_at',
+            field=models.DateTimeField(blank=True, help_text='When duration/pages/dimensions were last read from the file', null=True),
+        ),
+        migrations.AddField(
+            model_name='material',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, help_text='Number of pages for PDFs', null=True),
+        ),
+        migrations.AddField(
+            model_name='material',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, help_text='Width in pixels for images/video', null=True),
+        ),
+    ]
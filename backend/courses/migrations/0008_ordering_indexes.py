@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_material_media_metadata'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='course',
+            options={'ordering': ['-created_at', '-id']},
+        ),
+        migrations.AlterModelOptions(
+            name='level',
+            options={'ordering': ['level_number', 'order', 'id']},
+        ),
+        migrations.AlterModelOptions(
+            name='material',
+            options={'ordering': ['order', 'created_at', 'id']},
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['created_at', 'id'], name='course_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='level',
+            index=models.Index(fields=['level_number', 'order', 'id'], name='level_ordering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['order', 'created_at', 'id'], name='material_ordering_idx'),
+        ),
+    ]
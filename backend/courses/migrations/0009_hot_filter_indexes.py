@@ -0,0 +1,61 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:50
+
+from django.db import migrations, models
+
+
+def collapse_duplicate_file_paths(apps, schema_editor):
+    """
+    Rows sharing a file_path become duplicates of the oldest one (served
+    from its file) so the unique constraint can be created without losing
+    rows that lessons or levels point to.
+    """
+    Material = apps.get_model('courses', 'Material')
+    duplicated = (
+        Material.objects.filter(file_path__isnull=False)
+        .values('file_path')
+        .annotate(rows=models.Count('pk'))
+        .filter(rows__gt=1)
+        .values_list('file_path', flat=True)
+    )
+    for file_path in list(duplicated):
+        keeper, *others = Material.objects.filter(file_path=file_path).order_by('pk').values_list('pk', flat=True)
+        Material.objects.filter(pk__in=others).update(file_path=None, duplicate_of=keeper)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['order', 'created_at'], name='lesson_ordering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['course', 'order', 'created_at'], name='lesson_course_ordering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='level',
+            index=models.Index(fields=['course', 'level_number', 'order'], name='level_course_ordering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['course', 'order', 'created_at', 'id'], name='material_course_ordering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['level', 'order', 'created_at', 'id'], name='material_level_ordering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['lesson', 'order', 'created_at', 'id'], name='material_lesson_ordering_idx'),
+        ),
+        migrations.RunPython(collapse_duplicate_file_paths, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='material',
+            constraint=models.UniqueConstraint(condition=models.Q(('file_path__isnull', False)), fields=('file_path',), name='material_unique_file_path'),
+        ),
+    ]
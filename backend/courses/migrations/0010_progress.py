@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('courses', '0009_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(default=0, help_text='Playback position in seconds (page for PDFs)')),
+                ('percent', models.PositiveSmallIntegerField(default=0, help_text='Highest percentage reached (0-100)')),
+                ('completed', models.BooleanField(default=False)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('event_at', models.DateTimeField(help_text='Client time of the newest event applied')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress', to='courses.material')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='material_progress', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-event_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CourseProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_materials', models.PositiveIntegerField(default=0)),
+                ('total_materials', models.PositiveIntegerField(default=0)),
+                ('percent', models.PositiveSmallIntegerField(default=0, help_text='Average progress over every material of the course')),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress', to='courses.course')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='course_progress', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-last_activity_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='materialprogress',
+            constraint=models.UniqueConstraint(fields=('user', 'material'), name='material_progress_unique_user_material'),
+        ),
+        migrations.AddConstraint(
+            model_name='courseprogress',
+            constraint=models.UniqueConstraint(fields=('user', 'course'), name='course_progress_unique_user_course'),
+        ),
+    ]
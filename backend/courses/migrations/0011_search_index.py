@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+# Kept in sync with courses/search.py; rowids are shared by both tables
+CREATE_TABLES = [
+    "CREATE VIRTUAL TABLE courses_search USING fts5("
+    "kind UNINDEXED, object_id UNINDEXED, course_id UNINDEXED, title, body, path, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    "CREATE VIRTUAL TABLE courses_search_trigram USING fts5(title, body, path, tokenize = 'trigram')",
+]
+
+DROP_TABLES = [
+    'DROP TABLE IF EXISTS courses_search',
+    'DROP TABLE IF EXISTS courses_search_trigram',
+]
+
+
+def create_search_tables(apps, schema_editor):
+    # Other databases search with icontains lookups
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_TABLES:
+        schema_editor.execute(statement)
+
+
+def drop_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_TABLES:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_progress'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('course', 'Curso'), ('level', 'Nível'), ('lesson', 'Aula'), ('material', 'Material')], max_length=10)),
+                ('object_id', models.PositiveIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['deleted_at', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['updated_at', 'id'], name='course_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['updated_at', 'id'], name='lesson_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='level',
+            index=models.Index(fields=['updated_at', 'id'], name='level_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['updated_at', 'id'], name='material_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_idx'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
 import os
+import uuid
 
 
 class Course(models.Model):
@@ -20,7 +21,13 @@ class Course(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        ordering = ['-created_at']
+        # The id tiebreaker keeps pages stable when creation times are equal
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='course_created_idx'),
+            # Change feed of /api/sync/
+            models.Index(fields=['updated_at', 'id'], name='course_updated_idx'),
+        ]
     
     def __str__(self):
         return self.title
@@ -32,9 +39,15 @@ class Lesson(models.Model):
     description = models.TextField(blank=True)
     order = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['order', 'created_at']
+        indexes = [
+            models.Index(fields=['order', 'created_at'], name='lesson_ordering_idx'),
+            models.Index(fields=['course', 'order', 'created_at'], name='lesson_course_ordering_idx'),
+            models.Index(fields=['updated_at', 'id'], name='lesson_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.course.title} - {self.title}"
@@ -48,10 +61,17 @@ class Level(models.Model):
     level_number = models.IntegerField(default=1, help_text="Level order (1, 2, 3...)")
     order = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        ordering = ['level_number', 'order']
+        ordering = ['level_number', 'order', 'id']
         unique_together = ['course', 'level_number']
+        indexes = [
+            models.Index(fields=['level_number', 'order', 'id'], name='level_ordering_idx'),
+            # Levels of a course in order, read from the index alone
+            models.Index(fields=['course', 'level_number', 'order'], name='level_course_ordering_idx'),
+            models.Index(fields=['updated_at', 'id'], name='level_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.course.title} - Nível {self.level_number}: {self.title}"
@@ -81,17 +101,41 @@ class Material(models.Model):
     material_type = models.CharField(max_length=10, choices=MATERIAL_TYPE_CHOICES, default='other')
     file_size = models.BigIntegerField(blank=True, null=True)
     duration = models.IntegerField(blank=True, null=True, help_text="Duration in seconds for audio/video")
+    page_count = models.PositiveIntegerField(blank=True, null=True, help_text="Number of pages for PDFs")
+    width = models.PositiveIntegerField(blank=True, null=True, help_text="Width in pixels for images/video")
+    height = models.PositiveIntegerField(blank=True, null=True, help_text="Height in pixels for images/video")
+    metadata_extracted_at = models.DateTimeField(blank=True, null=True, help_text="When duration/pages/dimensions were last read from the file")
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True, help_text="SHA-256 of the file content")
+    duplicate_of = models.ForeignKey('self', related_name='duplicates', on_delete=models.SET_NULL, blank=True, null=True, help_text="Material whose stored file is served for this one")
     order = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        ordering = ['order', 'created_at']
+        ordering = ['order', 'created_at', 'id']
+        indexes = [
+            models.Index(fields=['order', 'created_at', 'id'], name='material_ordering_idx'),
+            # ?course= / ?level= lists and the lesson/level/course prefetches
+            models.Index(fields=['course', 'order', 'created_at', 'id'], name='material_course_ordering_idx'),
+            models.Index(fields=['level', 'order', 'created_at', 'id'], name='material_level_ordering_idx'),
+            models.Index(fields=['lesson', 'order', 'created_at', 'id'], name='material_lesson_ordering_idx'),
+            models.Index(fields=['updated_at', 'id'], name='material_updated_idx'),
+        ]
+        constraints = [
+            # One row per scanned file; the scanner matches rows by path
+            models.UniqueConstraint(
+                fields=['file_path'], condition=models.Q(file_path__isnull=False), name='material_unique_file_path',
+            ),
+        ]
     
     def __str__(self):
         return self.title
     
     def get_full_path(self):
         """Returns the full file system path to the material"""
+        if self.duplicate_of_id:
+            # Collapsed duplicate: the content is stored once, on the canonical row
+            return self.duplicate_of.get_full_path()
         if self.file:
             return self.file.path
         elif self.file_path:
@@ -132,4 +176,102 @@ class Material(models.Model):
                 self.material_type = ext_to_type[ext]
             if self.file.size:
                 self.file_size = self.file.size
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+
+class ScannedDirectory(models.Model):
+    """Directory mtime manifest used by scan_materials to skip unchanged subtrees"""
+    path = models.CharField(max_length=500, unique=True, help_text="Path relative to MATERIALS_ROOT ('.' for the root)")
+    mtime_ns = models.BigIntegerField()
+    scanned_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['path']
+    
+    def __str__(self):
+        return self.path
+
+
+class Tombstone(models.Model):
+    """Deleted course, level, lesson or material, reported to /api/sync/ clients (see courses/sync.py)"""
+    KIND_CHOICES = [
+        ('course', 'Curso'),
+        ('level', 'Nível'),
+        ('lesson', 'Aula'),
+        ('material', 'Material'),
+    ]
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['deleted_at', 'id']
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_idx'),
+        ]
+    
+    def __str__(self):
+        return f'{self.kind} {self.object_id}'
+
+
+class UploadSession(models.Model):
+    """Resumable upload in progress; chunks are written straight to ``file_name`` in storage"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='upload_sessions', on_delete=models.CASCADE)
+    course = models.ForeignKey(Course, related_name='upload_sessions', on_delete=models.CASCADE)
+    level = models.ForeignKey(Level, related_name='upload_sessions', on_delete=models.CASCADE, blank=True, null=True)
+    title = models.CharField(max_length=200)
+    order = models.IntegerField(default=0)
+    file_name = models.CharField(max_length=500, help_text="Storage name the material file is written to")
+    size = models.BigIntegerField(help_text="Total size announced by the client")
+    offset = models.BigIntegerField(default=0, help_text="Bytes received and committed so far")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['created_at']
+    
+    def __str__(self):
+        return f'{self.file_name} ({self.offset}/{self.size})'
+
+
+class MaterialProgress(models.Model):
+    """Latest learning progress of a user on a material (see courses/progress.py)"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='material_progress', on_delete=models.CASCADE)
+    material = models.ForeignKey(Material, related_name='progress', on_delete=models.CASCADE)
+    position = models.PositiveIntegerField(default=0, help_text="Playback position in seconds (page for PDFs)")
+    percent = models.PositiveSmallIntegerField(default=0, help_text="Highest percentage reached (0-100)")
+    completed = models.BooleanField(default=False)
+    completed_at = models.DateTimeField(blank=True, null=True)
+    event_at = models.DateTimeField(help_text="Client time of the newest event applied")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-event_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'material'], name='material_progress_unique_user_material'),
+        ]
+    
+    def __str__(self):
+        return f'{self.user_id} - {self.material_id}: {self.percent}%'
+
+
+class CourseProgress(models.Model):
+    """Per-course summary of MaterialProgress, rewritten after each flush"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='course_progress', on_delete=models.CASCADE)
+    course = models.ForeignKey(Course, related_name='progress', on_delete=models.CASCADE)
+    completed_materials = models.PositiveIntegerField(default=0)
+    total_materials = models.PositiveIntegerField(default=0)
+    percent = models.PositiveSmallIntegerField(default=0, help_text="Average progress over every material of the course")
+    last_activity_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-last_activity_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'course'], name='course_progress_unique_user_course'),
+        ]
+    
+    def __str__(self):
+        return f'{self.user_id} - {self.course_id}: {self.percent}%'
@@ -0,0 +1,173 @@
+"""
+Keyset (cursor) pagination for the course, level and material lists.
+
+Page-number pagination runs a COUNT(*) and an OFFSET that grows with every
+page. In cursor mode a page is fetched with ``WHERE (ordering columns) >
+(values of the last row seen) ORDER BY ... LIMIT n``, which is a range seek
+on the composite index matching the ordering, so page 5000 costs the same as
+page 1.
+
+Cursor mode is used when the request has a ``cursor`` parameter, or
+``?pagination=cursor`` for the first page. The ``next`` and ``previous``
+links carry the cursors. Requests without it keep the page-number
+behaviour (``?page=``, ``count``). Orderings end with the primary key so
+every row has a distinct position.
+"""
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Page-number pagination plus a cursor mode over ``ordering``, a tuple of
+    field names (``-`` for descending) ending with a unique tiebreaker.
+    """
+    ordering = ('-pk',)
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    invalid_cursor_message = 'Cursor inválido.'
+
+    def cursor_requested(self, request):
+        return (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_requested(request)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        reverse, position = self.decode_cursor(request)
+        ordering = [self._flip(field) for field in self.ordering] if reverse else list(self.ordering)
+
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = self._after(queryset, ordering, position)
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page_rows = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties'].pop('count')
+        return response_schema
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next or not self.page_rows:
+            return None
+        return self._link(False, self.page_rows[-1])
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page_rows:
+            return None
+        return self._link(True, self.page_rows[0])
+
+    def get_html_context(self):
+        if not self.keyset:
+            return super().get_html_context()
+        return {'previous_url': self.get_previous_link(), 'next_url': self.get_next_link()}
+
+    @property
+    def template(self):
+        if getattr(self, 'keyset', False):
+            return 'rest_framework/pagination/previous_and_next.html'
+        return 'rest_framework/pagination/numbers.html'
+
+    # Cursors ---------------------------------------------------------------
+
+    def _link(self, reverse, row):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        url = remove_query_param(url, self.mode_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(reverse, row))
+
+    def encode_cursor(self, reverse, row):
+        values = []
+        for field in self.ordering:
+            value = getattr(row, field.lstrip('-'))
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        payload = json.dumps([int(reverse), values], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request):
+        """Returns ``(reverse, values)``; values is ``None`` on the first page"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+        try:
+            payload = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            reverse, values = json.loads(payload)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return bool(reverse), values
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def _after(self, queryset, ordering, values):
+        """Rows strictly after ``values`` in ``ordering``"""
+        model = queryset.model
+        fields = [model._meta.get_field(name.lstrip('-')) if name.lstrip('-') != 'pk' else model._meta.pk
+                  for name in ordering]
+        try:
+            values = [field.to_python(value) for field, value in zip(fields, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+        # (a > x) OR (a = x AND b > y) OR ..., with < for descending columns
+        condition = Q()
+        for index, name in enumerate(ordering):
+            equal = {prior.lstrip('-'): value for prior, value in zip(ordering[:index], values[:index])}
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name.lstrip("-")}__{lookup}': values[index]})
+        # Implied by the condition; bounds the first column so the database
+        # seeks into the composite index instead of scanning it from the start
+        first = ordering[0]
+        bound = Q(**{f'{first.lstrip("-")}__{"lte" if first.startswith("-") else "gte"}': values[0]})
+        return queryset.filter(bound & condition)
+
+
+class CoursePagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class LevelPagination(KeysetPagination):
+    ordering = ('level_number', 'order', 'id')
+
+
+class MaterialPagination(KeysetPagination):
+    ordering = ('order', 'created_at', 'id')
@@ -0,0 +1,324 @@
+"""
+Resized previews of course thumbnails, user avatars, image materials and
+the first page of PDF materials.
+
+Variants are rendered on first request in one of the configured widths, as
+WebP (when the client accepts it) or JPEG, and cached on disk under
+``ROOT/<key[:2]>/<key>/<width>.<ext>``. The key is derived from the
+material's content hash when it is known, otherwise from the source path,
+size and mtime, so replacing a file yields new variants and the old ones
+simply stop being used.
+
+The cache is bounded by ``MAX_BYTES``. Access times are refreshed
+explicitly (at most every ``TOUCH_INTERVAL`` seconds per file) and, once
+the cache grows past the limit, the least recently used variants are
+deleted until it is back under 90% of it.
+
+PDF pages are rendered with ``pdftoppm`` (poppler-utils) when it is
+installed; otherwise the first JPEG image embedded in the first page is
+used, which covers scanned books and worksheets.
+"""
+import hashlib
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .conditional import check_preconditions, file_etag, set_validator_headers
+from .file_serving import serve_file
+from .media_metadata import MetadataError, PdfReader
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'ROOT': None,
+    'WIDTHS': [160, 320, 640, 1280],
+    'DEFAULT_WIDTH': 320,
+    'QUALITY': 80,
+    'MAX_BYTES': 512 * 1024 * 1024,
+    'PDFTOPPM': 'pdftoppm',
+}
+
+# Bumped when rendering changes, so previously cached variants are not reused
+RENDER_VERSION = 1
+
+OUTPUT_FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+
+# Variants taller than this many times their width are cropped by the box
+MAX_ASPECT_RATIO = 3
+
+# Seconds between two access time refreshes of the same variant
+TOUCH_INTERVAL = 60 * 60
+
+PDFTOPPM_TIMEOUT = 30
+
+
+class PreviewUnavailable(Exception):
+    """The source cannot be turned into a preview"""
+
+
+def get_preview_settings():
+    config = {**DEFAULT_SETTINGS, **getattr(settings, 'COURSES_PREVIEWS', {})}
+    if not config['ROOT']:
+        config['ROOT'] = os.path.join(settings.MEDIA_ROOT, 'previews')
+    return config
+
+
+def source_key(path, stat, content_hash=None):
+    """Cache key of a source file"""
+    config = get_preview_settings()
+    basis = content_hash or f'{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}'
+    return hashlib.sha256(f'{RENDER_VERSION}:{config["QUALITY"]}:{basis}'.encode('utf-8')).hexdigest()
+
+
+def choose_width(requested=None):
+    """Smallest configured width covering ``requested`` (the largest one otherwise)"""
+    config = get_preview_settings()
+    widths = sorted(config['WIDTHS'])
+    try:
+        requested = int(requested) if requested else config['DEFAULT_WIDTH']
+    except ValueError:
+        requested = config['DEFAULT_WIDTH']
+    for width in widths:
+        if width >= requested:
+            return width
+    return widths[-1]
+
+
+def choose_output(request):
+    """``?output=webp|jpeg`` or, by default, WebP for clients that accept it"""
+    output = request.GET.get('output')
+    if output in OUTPUT_FORMATS:
+        return output
+    return 'webp' if 'image/webp' in request.META.get('HTTP_ACCEPT', '') else 'jpeg'
+
+
+def _fit(image, width):
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((width, width * MAX_ASPECT_RATIO), Image.LANCZOS)
+    return image
+
+
+def render_image(path, width):
+    with Image.open(path) as image:
+        # JPEGs are decoded directly at a reduced scale
+        image.draft('RGB', (width, width))
+        return _fit(image, width)
+
+
+def _render_pdf_with_pdftoppm(executable, path, width):
+    with tempfile.TemporaryDirectory() as directory:
+        output_root = os.path.join(directory, 'page')
+        subprocess.run(
+            [executable, '-f', '1', '-l', '1', '-singlefile', '-png',
+             '-scale-to-x', str(width), '-scale-to-y', '-1', path, output_root],
+            check=True, capture_output=True, timeout=PDFTOPPM_TIMEOUT,
+        )
+        with Image.open(output_root + '.png') as image:
+            image.load()
+            return _fit(image, width)
+
+
+def render_pdf(path, width):
+    executable = shutil.which(get_preview_settings()['PDFTOPPM'] or '')
+    if executable:
+        try:
+            return _render_pdf_with_pdftoppm(executable, path, width)
+        except (subprocess.SubprocessError, OSError) as e:
+            logger.warning('pdftoppm failed on %s: %s', path, e)
+    with open(path, 'rb') as f:
+        try:
+            jpeg = PdfReader(f, os.fstat(f.fileno()).st_size).first_page_jpeg()
+        except (MetadataError, ValueError, IndexError, TypeError) as e:
+            raise PreviewUnavailable(str(e)) from e
+    if jpeg is None:
+        raise PreviewUnavailable('first page has no embedded JPEG image')
+    return render_image(io.BytesIO(jpeg), width)
+
+
+RENDERERS = {
+    'image': render_image,
+    'pdf': render_pdf,
+}
+
+
+class PreviewCache:
+    """Size-bounded on-disk store of rendered variants"""
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path_for(self, key, width, output):
+        return os.path.join(self.root, key[:2], key, f'{width}.{output}')
+
+    def get(self, key, width, output):
+        """Returns ``(path, stat)`` of a cached variant, or ``None``"""
+        path = self.path_for(key, width, output)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        now = time.time()
+        if now - stat.st_atime > TOUCH_INTERVAL:
+            # The access time is the LRU clock; the mtime (and ETag) stays
+            try:
+                os.utime(path, (now, stat.st_mtime))
+            except OSError:
+                pass
+        return path, stat
+
+    def put(self, key, width, output, image, quality):
+        path = self.path_for(key, width, output)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pil_format = OUTPUT_FORMATS[output][0]
+        if pil_format == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+            has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha and pil_format == 'WEBP' else 'RGB')
+        options = {'quality': quality}
+        if pil_format == 'JPEG':
+            options.update(optimize=True, progressive=True)
+        else:
+            options['method'] = 4
+        # Concurrent renders of the same variant each write their own file;
+        # the last rename wins and readers never see a partial file
+        temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            image.save(temporary_path, pil_format, **options)
+            os.replace(temporary_path, path)
+        except Exception:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        stat = os.stat(path)
+        self._account(stat.st_size)
+        return path, stat
+
+    def _account(self, added):
+        with self._lock:
+            if self._size is not None:
+                self._size += added
+            if self._size is None or self._size > self.max_bytes:
+                # Other processes write here too: recount while evicting
+                self._size = self.evict(int(self.max_bytes * 0.9))
+
+    def evict(self, target_bytes):
+        """Deletes least recently used variants until at most ``target_bytes`` remain"""
+        entries = []
+        total = 0
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_atime, stat.st_size, path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return total
+        entries.sort()
+        for _, size, path in entries:
+            if total <= target_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                # Other variants of the same source are still there
+                pass
+        return total
+
+
+_preview_cache = None
+
+
+def get_preview_cache():
+    global _preview_cache
+    if _preview_cache is None:
+        config = get_preview_settings()
+        _preview_cache = PreviewCache(config['ROOT'], config['MAX_BYTES'])
+    return _preview_cache
+
+
+@receiver(setting_changed)
+def reset_preview_cache(setting, **kwargs):
+    global _preview_cache
+    if setting in ('COURSES_PREVIEWS', 'MEDIA_ROOT'):
+        _preview_cache = None
+
+
+def get_preview(source_path, kind, width, output, content_hash=None):
+    """
+    Returns ``(path, stat)`` of the variant of ``source_path``, rendering it
+    when it is not cached yet. Raises PreviewUnavailable.
+    """
+    try:
+        source_stat = os.stat(source_path)
+    except OSError as e:
+        raise PreviewUnavailable(str(e)) from e
+    cache = get_preview_cache()
+    key = source_key(source_path, source_stat, content_hash)
+    cached = cache.get(key, width, output)
+    if cached is not None:
+        return cached
+    try:
+        image = RENDERERS[kind](source_path, width)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError, MetadataError) as e:
+        raise PreviewUnavailable(str(e)) from e
+    return cache.put(key, width, output, image, get_preview_settings()['QUALITY'])
+
+
+def preview_response(request, source_path, kind, content_hash=None):
+    """
+    Response serving the variant requested with ``?width=`` / ``?output=``,
+    or ``None`` when no preview can be produced.
+    """
+    width = choose_width(request.GET.get('width'))
+    output = choose_output(request)
+    try:
+        path, stat = get_preview(source_path, kind, width, output, content_hash)
+    except PreviewUnavailable as e:
+        logger.info('No preview for %s: %s', source_path, e)
+        return None
+
+    etag = file_etag(stat)
+    response = check_preconditions(request, etag, stat.st_mtime)
+    if response is None:
+        response = serve_file(request, path, OUTPUT_FORMATS[output][1], etag=etag, stat=stat)
+        set_validator_headers(response, etag, stat.st_mtime)
+    # The format depends on the Accept header unless ?output= is given
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def material_preview_kind(material):
+    """'image' or 'pdf' for materials that have a preview, otherwise ``None``"""
+    if material.material_type in RENDERERS:
+        return material.material_type
+    return None
+
+
+def preview_url(request, url_name, pk):
+    url = reverse(url_name, kwargs={'pk': pk})
+    return request.build_absolute_uri(url) if request else url
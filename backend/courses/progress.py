@@ -0,0 +1,314 @@
+"""
+Learning progress: ingestion of client events and per-course summaries.
+
+Clients (the mobile app in particular) send batches of events to
+``POST /api/progress/events/``. Each event reports a position, a percentage
+and/or completion for one material. Events are folded per (user, material)
+into an in-process buffer and written every ``FLUSH_INTERVAL`` seconds, or
+as soon as ``MAX_PENDING`` pairs are waiting, with one upsert per batch
+instead of one write per event. ``FLUSH_INTERVAL = 0`` writes during the
+request. Pending states are also written at exit and when
+``COURSES_PROGRESS`` changes, unless the database they were accepted for
+has been swapped out since (the test runner destroys its database first).
+
+Merging is order independent, so events from several devices, tabs and
+worker processes can arrive in any order: the position comes from the
+newest event (client time), the percentage only grows and completion is
+sticky. Stored rows are locked and merged with the buffered state in the
+flush transaction.
+
+Every flush rewrites the ``CourseProgress`` summary of the affected
+(user, course) pairs, which is what dashboards read; adding or deleting a
+material refreshes the summaries of its courses.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections, router, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import background
+from .models import CourseProgress, Lesson, Level, Material, MaterialProgress
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'FLUSH_INTERVAL': 5,
+    'MAX_PENDING': 1000,
+    'MAX_EVENTS_PER_REQUEST': 500,
+}
+
+# Rows per INSERT ... ON CONFLICT statement
+PROGRESS_BATCH_SIZE = 500
+
+STATE_FIELDS = ['position', 'percent', 'completed', 'completed_at', 'event_at']
+
+
+def get_progress_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'COURSES_PROGRESS', {})}
+
+
+def event_state(event):
+    """Progress state reported by one validated event"""
+    completed = event['completed'] or event['percent'] >= 100
+    return {
+        'position': event['position'],
+        'percent': 100 if completed else event['percent'],
+        'completed': completed,
+        'completed_at': event['occurred_at'] if completed else None,
+        'event_at': event['occurred_at'],
+    }
+
+
+def merge_states(state, other):
+    """Folds two states of the same (user, material); the result does not depend on the order"""
+    if state is None:
+        return other
+    newest = other if (other['event_at'], other['position']) > (state['event_at'], state['position']) else state
+    completed_at = [value for value in (state['completed_at'], other['completed_at']) if value is not None]
+    return {
+        'position': newest['position'],
+        'percent': max(state['percent'], other['percent']),
+        'completed': state['completed'] or other['completed'],
+        'completed_at': min(completed_at) if completed_at else None,
+        'event_at': newest['event_at'],
+    }
+
+
+def course_materials(course_id):
+    """Materials shown in a course: attached directly or through its levels and lessons"""
+    return Material.objects.filter(
+        Q(course=course_id)
+        | Q(level__in=Level.objects.filter(course=course_id).values('pk'))
+        | Q(lesson__in=Lesson.objects.filter(course=course_id).values('pk'))
+    )
+
+
+def material_courses(material_ids):
+    """``{material_id: {course_id, ...}}``"""
+    courses = defaultdict(set)
+    rows = Material.objects.filter(pk__in=material_ids).values_list(
+        'pk', 'course_id', 'level__course_id', 'lesson__course_id',
+    )
+    for pk, *course_ids in rows:
+        courses[pk].update(course_id for course_id in course_ids if course_id)
+    return courses
+
+
+def refresh_course_summaries(pairs):
+    """Recomputes the CourseProgress rows of the given ``(user_id, course_id)`` pairs"""
+    users_by_course = defaultdict(set)
+    for user_id, course_id in pairs:
+        users_by_course[course_id].add(user_id)
+
+    now = timezone.now()
+    summaries = []
+    for course_id, user_ids in users_by_course.items():
+        materials = course_materials(course_id).values('pk')
+        total = course_materials(course_id).count()
+        rows = {
+            row['user_id']: row
+            for row in MaterialProgress.objects.filter(user_id__in=user_ids, material__in=materials)
+            .values('user_id')
+            .annotate(done=Count('pk', filter=Q(completed=True)), percent_sum=Sum('percent'), last=Max('event_at'))
+        }
+        for user_id in user_ids:
+            row = rows.get(user_id, {'done': 0, 'percent_sum': 0, 'last': None})
+            summaries.append(CourseProgress(
+                user_id=user_id,
+                course_id=course_id,
+                completed_materials=row['done'],
+                total_materials=total,
+                percent=min(100, round(row['percent_sum'] / total)) if total else 0,
+                last_activity_at=row['last'],
+                updated_at=now,
+            ))
+    CourseProgress.objects.bulk_create(
+        summaries, batch_size=PROGRESS_BATCH_SIZE, update_conflicts=True, unique_fields=['user', 'course'],
+        update_fields=['completed_materials', 'total_materials', 'percent', 'last_activity_at', 'updated_at'],
+    )
+    return len(summaries)
+
+
+def refresh_courses(course_ids):
+    """Refreshes every summary of the given courses (their materials changed)"""
+    pairs = CourseProgress.objects.filter(course__in=course_ids).values_list('user_id', 'course_id')
+    return refresh_course_summaries(list(pairs))
+
+
+def write_progress(pending):
+    """
+    Upserts ``{(user_id, material_id): state}`` merged with the stored
+    rows and refreshes the affected course summaries. Returns the number of
+    rows written.
+    """
+    now = timezone.now()
+    courses = material_courses({material_id for _, material_id in pending})
+    with transaction.atomic():
+        stored = {
+            (row.user_id, row.material_id): row
+            for row in MaterialProgress.objects.select_for_update().filter(
+                user_id__in={user_id for user_id, _ in pending},
+                material_id__in=courses.keys(),
+            )
+        }
+        rows = []
+        for (user_id, material_id), state in pending.items():
+            if material_id not in courses:
+                # Deleted since the event was accepted
+                continue
+            row = stored.get((user_id, material_id))
+            if row is not None:
+                state = merge_states({field: getattr(row, field) for field in STATE_FIELDS}, state)
+            rows.append(MaterialProgress(user_id=user_id, material_id=material_id, updated_at=now, **state))
+        MaterialProgress.objects.bulk_create(
+            rows, batch_size=PROGRESS_BATCH_SIZE, update_conflicts=True, unique_fields=['user', 'material'],
+            update_fields=[*STATE_FIELDS, 'updated_at'],
+        )
+        refresh_course_summaries({
+            (row.user_id, course_id) for row in rows for course_id in courses[row.material_id]
+        })
+    return len(rows)
+
+
+class ProgressBuffer:
+    """Pending progress states of this process, keyed by (user_id, material_id)"""
+
+    def __init__(self, flush_interval, max_pending):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # The states belong to this database; the test runner swaps it out
+        self.database = current_database()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, user_id, states):
+        """Buffers ``{material_id: state}`` for a user"""
+        with self._lock:
+            for material_id, state in states.items():
+                key = (user_id, material_id)
+                self._pending[key] = merge_states(self._pending.get(key), state)
+            full = len(self._pending) >= self.max_pending
+            if not full:
+                self._arm_timer()
+        if not self.flush_interval:
+            self.flush()
+        elif full:
+            self._flush_in_background()
+
+    def _arm_timer(self):
+        # Called with the lock held
+        if self.flush_interval and self._timer is None:
+            self._timer = threading.Timer(self.flush_interval, self._flush_in_background)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def take(self, user_id=None):
+        """Removes and returns the pending states (of one user only, when given)"""
+        with self._lock:
+            if user_id is None:
+                pending, self._pending = self._pending, {}
+            else:
+                pending = {key: state for key, state in self._pending.items() if key[0] == user_id}
+                for key in pending:
+                    del self._pending[key]
+            return pending
+
+    def restore(self, pending):
+        """Puts back states whose write failed, merged with anything newer"""
+        with self._lock:
+            for key, state in pending.items():
+                self._pending[key] = merge_states(self._pending.get(key), state)
+            self._arm_timer()
+
+    def flush(self, user_id=None):
+        pending = self.take(user_id)
+        if not pending:
+            return 0
+        try:
+            return write_progress(pending)
+        except Exception:
+            self.restore(pending)
+            raise
+
+    def close(self):
+        """Stops the timer and writes what is pending"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if current_database() != self.database:
+            # The database the states were accepted for is gone (test runs)
+            pending = self.take()
+            if pending:
+                logger.warning('Dropped %d pending progress states of database %s', len(pending), self.database)
+            return
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Could not write %d pending progress states', len(self))
+
+    def _flush_in_background(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not background.submit(self.flush):
+            # Pool saturated: try again after another interval
+            with self._lock:
+                self._arm_timer()
+
+
+def current_database():
+    return connections[router.db_for_write(MaterialProgress)].settings_dict['NAME']
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_progress_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            config = get_progress_settings()
+            _buffer = ProgressBuffer(config['FLUSH_INTERVAL'], config['MAX_PENDING'])
+        return _buffer
+
+
+def close_progress_buffer():
+    """Writes the pending states and drops the buffer; the next events start a new one"""
+    global _buffer
+    with _buffer_lock:
+        buffer, _buffer = _buffer, None
+    if buffer is not None:
+        buffer.close()
+
+
+@receiver(setting_changed)
+def reset_progress_buffer(setting, **kwargs):
+    if setting == 'COURSES_PROGRESS':
+        close_progress_buffer()
+
+
+atexit.register(close_progress_buffer)
+
+
+def record_events(user_id, events):
+    """Buffers validated events of one user (see ProgressEventSerializer)"""
+    states = {}
+    for event in events:
+        material_id = event['material']
+        states[material_id] = merge_states(states.get(material_id), event_state(event))
+    get_progress_buffer().add(user_id, states)
+    return len(states)
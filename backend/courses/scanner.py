@@ -0,0 +1,232 @@
+"""
+Incremental scanner for MATERIALS_ROOT, shared by the ``scan_materials``
+management command and the ``MaterialViewSet.scan_materials`` action.
+
+All known ``file_path`` values are loaded once, the tree is streamed with
+``os.scandir`` and new or resized files are written with batched
+``bulk_create`` / ``bulk_update``. Directories whose mtime matches the
+stored manifest (``ScannedDirectory``) are not re-examined: their files are
+assumed unchanged and only their subdirectories are visited. A file whose
+content changes in place does not touch its directory's mtime, so use a
+full scan to pick up those size changes.
+"""
+import os
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import invalidate_all
+from .metrics import scan_created, scan_duration
+from .models import Material, ScannedDirectory
+from .search import index_objects
+
+
+# Extensions picked up by the scanner and the material type they map to
+SCAN_EXTENSIONS = {
+    '.pdf': 'pdf',
+    '.mp3': 'mp3',
+    '.mp4': 'video',
+    '.jpg': 'image',
+    '.jpeg': 'image',
+    '.png': 'image',
+}
+
+ROOT_DIRECTORY = '.'
+
+DEFAULT_BATCH_SIZE = 500
+
+
+class ScanReport:
+    """Outcome of a scan: paths created, changed and deleted on disk"""
+
+    def __init__(self, materials_root, dry_run=False):
+        self.materials_root = materials_root
+        self.dry_run = dry_run
+        self.created = []
+        self.changed = []
+        self.deleted = []
+        self.existing_count = 0
+        self.directories_scanned = 0
+        self.directories_skipped = 0
+        self.duration = 0.0
+
+    def as_dict(self, limit=None):
+        """Summary for API responses; path lists are truncated to ``limit`` items"""
+        return {
+            'dry_run': self.dry_run,
+            'created_count': len(self.created),
+            'changed_count': len(self.changed),
+            'deleted_count': len(self.deleted),
+            'existing_count': self.existing_count,
+            'directories_scanned': self.directories_scanned,
+            'directories_skipped': self.directories_skipped,
+            'duration': round(self.duration, 3),
+            'created': self.created[:limit],
+            'changed': self.changed[:limit],
+            'deleted': self.deleted[:limit],
+        }
+
+
+class MaterialScanner:
+    """Walks MATERIALS_ROOT and syncs it into Material rows"""
+
+    def __init__(self, materials_root=None, dry_run=False, full=False, batch_size=DEFAULT_BATCH_SIZE):
+        self.materials_root = materials_root or settings.MATERIALS_ROOT
+        self.dry_run = dry_run
+        self.full = full
+        self.batch_size = batch_size
+
+    def run(self):
+        started = time.monotonic()
+        report = ScanReport(self.materials_root, dry_run=self.dry_run)
+
+        # path -> (id, file_size), loaded with a single query
+        known = {
+            path: (pk, size)
+            for pk, path, size in Material.objects.filter(file_path__isnull=False)
+            .values_list('pk', 'file_path', 'file_size')
+            .iterator(chunk_size=2000)
+        }
+        known_by_directory = {}
+        for path in known:
+            known_by_directory.setdefault(os.path.dirname(path) or ROOT_DIRECTORY, []).append(path)
+        manifest = {} if self.full else dict(ScannedDirectory.objects.values_list('path', 'mtime_ns'))
+
+        seen = set()
+        to_create = []
+        to_update = []
+        directory_mtimes = {}
+
+        for directory, mtime_ns, entries in self._walk():
+            directory_mtimes[directory] = mtime_ns
+            if manifest.get(directory) == mtime_ns:
+                # Nothing was added, removed or renamed here since the last
+                # scan: match names against known rows without any stat call
+                report.directories_skipped += 1
+                names = {entry.name for entry in entries}
+                for path in known_by_directory.get(directory, []):
+                    if os.path.basename(path) in names:
+                        seen.add(path)
+                        report.existing_count += 1
+                continue
+
+            report.directories_scanned += 1
+            for entry in entries:
+                material_type = SCAN_EXTENSIONS.get(os.path.splitext(entry.name)[1].lower())
+                if material_type is None:
+                    continue
+                relative_path = entry.name if directory == ROOT_DIRECTORY else os.path.join(directory, entry.name)
+                seen.add(relative_path)
+                try:
+                    size = entry.stat().st_size
+                except OSError:
+                    size = None
+
+                if relative_path not in known:
+                    report.created.append(relative_path)
+                    to_create.append(Material(
+                        title=entry.name,
+                        file_path=relative_path,
+                        material_type=material_type,
+                        file_size=size,
+                    ))
+                    if len(to_create) >= self.batch_size:
+                        self._flush_created(to_create)
+                        to_create = []
+                    continue
+
+                report.existing_count += 1
+                pk, known_size = known[relative_path]
+                if size is not None and size != known_size:
+                    report.changed.append(relative_path)
+                    to_update.append(Material(pk=pk, file_size=size, content_hash=None, metadata_extracted_at=None))
+
+        self._flush_created(to_create)
+        self._flush_updated(to_update)
+        self._save_manifest(directory_mtimes)
+        if not self.dry_run and (report.created or report.changed):
+            # Bulk writes send no post_save signals
+            invalidate_all()
+
+        report.deleted = sorted(path for path in known if path not in seen)
+        report.duration = time.monotonic() - started
+        if not self.dry_run:
+            scan_duration.observe(report.duration, mode='full' if self.full else 'incremental')
+            scan_created.inc(len(report.created))
+        return report
+
+    def _walk(self):
+        """
+        Yields ``(relative_directory, mtime_ns, file_entries)`` for every
+        directory below the root, descending without following symlinks.
+        """
+        stack = [(ROOT_DIRECTORY, self.materials_root, os.stat(self.materials_root).st_mtime_ns)]
+        while stack:
+            directory, absolute_path, mtime_ns = stack.pop()
+            files = []
+            try:
+                with os.scandir(absolute_path) as iterator:
+                    for entry in iterator:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                child = entry.name if directory == ROOT_DIRECTORY else os.path.join(directory, entry.name)
+                                stack.append((child, entry.path, entry.stat(follow_symlinks=False).st_mtime_ns))
+                            elif entry.is_file():
+                                files.append(entry)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+            yield directory, mtime_ns, files
+
+    def _flush_created(self, materials):
+        if self.dry_run or not materials:
+            return
+        with transaction.atomic():
+            Material.objects.bulk_create(materials, batch_size=self.batch_size)
+            # bulk_create sends no post_save signals
+            index_objects('material', [material.pk for material in materials])
+
+    def _flush_updated(self, materials):
+        if self.dry_run or not materials:
+            return
+        # bulk_update skips auto_now, so set updated_at ourselves. The content
+        # hash and metadata are cleared so the new content is read again.
+        now = timezone.now()
+        for material in materials:
+            material.updated_at = now
+        with transaction.atomic():
+            Material.objects.bulk_update(
+                materials, ['file_size', 'content_hash', 'metadata_extracted_at', 'updated_at'], batch_size=self.batch_size,
+            )
+
+    def _save_manifest(self, directory_mtimes):
+        if self.dry_run:
+            return
+        now = timezone.now()
+        with transaction.atomic():
+            self._delete_stale_manifest(directory_mtimes)
+            ScannedDirectory.objects.bulk_create(
+                [ScannedDirectory(path=path, mtime_ns=mtime_ns, scanned_at=now) for path, mtime_ns in directory_mtimes.items()],
+                batch_size=self.batch_size,
+                update_conflicts=True,
+                unique_fields=['path'],
+                update_fields=['mtime_ns', 'scanned_at'],
+            )
+
+    def _delete_stale_manifest(self, directory_mtimes):
+        # Directories that no longer exist; compared in Python to avoid an
+        # oversized NOT IN (...) clause on large trees
+        stale = [
+            pk for pk, path in ScannedDirectory.objects.values_list('pk', 'path')
+            if path not in directory_mtimes
+        ]
+        for start in range(0, len(stale), self.batch_size):
+            ScannedDirectory.objects.filter(pk__in=stale[start:start + self.batch_size]).delete()
+
+
+def scan_materials(materials_root=None, dry_run=False, full=False, batch_size=DEFAULT_BATCH_SIZE):
+    """Runs a scan of MATERIALS_ROOT and returns its ScanReport"""
+    return MaterialScanner(materials_root, dry_run=dry_run, full=full, batch_size=batch_size).run()
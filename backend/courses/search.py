@@ -0,0 +1,347 @@
+"""
+Full-text search over courses, levels, lessons and materials (SQLite FTS5).
+
+Two FTS5 tables (created by migration 0011) share their rowids, derived from
+the kind and id of the indexed row:
+
+- ``courses_search`` holds the text as written, tokenized with
+  ``unicode61 remove_diacritics 2``. Words match as prefixes regardless of
+  case and accents ("licao" finds "Lição", "ingles" finds "Inglês"), which
+  suits Portuguese and English alike, and hits are ranked with bm25 with
+  titles weighing more than descriptions and file paths.
+- ``courses_search_trigram`` holds the same text lowercased and without
+  accents, tokenized in trigrams. It answers substring queries ("gram" in
+  "Grammar", part of a file name) when the word index finds nothing.
+
+The index is written by the signal handlers, by the scanner (which creates
+materials with ``bulk_create``) and by the bulk edit actions;
+``python manage.py rebuild_search_index`` rebuilds it in batches. Other
+databases fall back to ``icontains`` lookups.
+"""
+import html
+import re
+import unicodedata
+from functools import lru_cache
+
+from django.db import connection
+from django.db.models import CharField, F, Q, Value
+from django.db.models.functions import Coalesce
+
+from .models import Course, Lesson, Level, Material
+
+
+SEARCH_TABLE = 'courses_search'
+TRIGRAM_TABLE = 'courses_search_trigram'
+
+KINDS = ['course', 'level', 'lesson', 'material']
+
+# Rows indexed per statement batch
+SEARCH_BATCH_SIZE = 500
+
+# bm25 weights of the title, body and path columns
+COLUMN_WEIGHTS = (10.0, 3.0, 1.0)
+
+# Terms of a query; longer queries are cut
+MAX_QUERY_TERMS = 10
+
+# Characters shown around the first hit of a long description
+EXCERPT_CHARS = 120
+
+# Highlight markers, replaced by <mark> once the text is escaped
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+TERM = re.compile(r'\w+')
+
+
+def _material_course():
+    return Coalesce('course_id', 'level__course_id', 'lesson__course_id')
+
+
+# kind -> (model, course id, title, body, path, fields searched without the index)
+SEARCH_SOURCES = {
+    'course': (Course, F('pk'), F('title'), F('description'), Value(''), ['title', 'description']),
+    'level': (Level, F('course_id'), F('title'), F('description'), Value(''), ['title', 'description']),
+    'lesson': (Lesson, F('course_id'), F('title'), F('description'), Value(''), ['title', 'description']),
+    'material': (
+        Material, _material_course(), F('title'), Value(''),
+        Coalesce('file_path', 'file', output_field=CharField()), ['title', 'file_path'],
+    ),
+}
+
+SEARCH_MODELS = {source[0]: kind for kind, source in SEARCH_SOURCES.items()}
+
+
+def index_available():
+    return connection.vendor == 'sqlite'
+
+
+def search_rowid(kind, pk):
+    return pk * len(KINDS) + KINDS.index(kind)
+
+
+@lru_cache(maxsize=4096)
+def _fold_char(char):
+    base = ''.join(c for c in unicodedata.normalize('NFKD', char) if not unicodedata.combining(c)).lower()
+    if len(base) == 1:
+        return base
+    lower = char.lower()
+    return lower if len(lower) == 1 else char
+
+
+def fold(text):
+    """Lowercase text without accents, one character per input character so offsets still match"""
+    return ''.join(_fold_char(char) for char in text or '')
+
+
+# Index maintenance
+
+def _source_rows(kind, queryset=None):
+    model, course, title, body, path, _ = SEARCH_SOURCES[kind]
+    queryset = model.objects.all() if queryset is None else queryset
+    return queryset.order_by().values_list(
+        'pk', course, title, body, path,
+    )
+
+
+def _delete_rows(cursor, rowids):
+    placeholders = ', '.join(['%s'] * len(rowids))
+    for table in (SEARCH_TABLE, TRIGRAM_TABLE):
+        cursor.execute(f'DELETE FROM {table} WHERE rowid IN ({placeholders})', rowids)
+
+
+def _insert_rows(cursor, kind, rows):
+    cursor.executemany(
+        f'INSERT INTO {SEARCH_TABLE}(rowid, kind, object_id, course_id, title, body, path) '
+        f'VALUES (%s, %s, %s, %s, %s, %s, %s)',
+        [(search_rowid(kind, pk), kind, pk, course_id, title or '', body or '', path or '')
+         for pk, course_id, title, body, path in rows],
+    )
+    cursor.executemany(
+        f'INSERT INTO {TRIGRAM_TABLE}(rowid, title, body, path) VALUES (%s, %s, %s, %s)',
+        [(search_rowid(kind, pk), fold(title), fold(body), fold(path)) for pk, _, title, body, path in rows],
+    )
+
+
+def index_objects(kind, pks):
+    """(Re)indexes the rows of ``kind`` with the given primary keys"""
+    if not index_available():
+        return 0
+    pks = list(pks)
+    count = 0
+    model = SEARCH_SOURCES[kind][0]
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), SEARCH_BATCH_SIZE):
+            batch = pks[start:start + SEARCH_BATCH_SIZE]
+            rows = list(_source_rows(kind, model.objects.filter(pk__in=batch)))
+            _delete_rows(cursor, [search_rowid(kind, pk) for pk in batch])
+            _insert_rows(cursor, kind, rows)
+            count += len(rows)
+    return count
+
+
+def remove_objects(kind, pks):
+    if not index_available():
+        return
+    pks = list(pks)
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), SEARCH_BATCH_SIZE):
+            _delete_rows(cursor, [search_rowid(kind, pk) for pk in pks[start:start + SEARCH_BATCH_SIZE]])
+
+
+def rebuild_index(batch_size=SEARCH_BATCH_SIZE, progress=None):
+    """
+    Empties and refills both tables, ``batch_size`` rows per query, then
+    merges their b-trees. Returns ``{kind: rows indexed}``.
+    """
+    counts = {}
+    with connection.cursor() as cursor:
+        for table in (SEARCH_TABLE, TRIGRAM_TABLE):
+            cursor.execute(f'DELETE FROM {table}')
+        for kind in KINDS:
+            model = SEARCH_SOURCES[kind][0]
+            counts[kind] = 0
+            last_pk = 0
+            while True:
+                rows = list(_source_rows(kind, model.objects.filter(pk__gt=last_pk)).order_by('pk')[:batch_size])
+                if not rows:
+                    break
+                _insert_rows(cursor, kind, rows)
+                counts[kind] += len(rows)
+                last_pk = rows[-1][0]
+                if progress:
+                    progress(kind, counts[kind])
+        for table in (SEARCH_TABLE, TRIGRAM_TABLE):
+            cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+    return counts
+
+
+# Queries
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def word_query(query):
+    """FTS5 expression matching every word of ``query`` as a prefix"""
+    return ' '.join(f'{_quote(term)}*' for term in TERM.findall(query)[:MAX_QUERY_TERMS])
+
+
+def substring_terms(query):
+    """Folded whitespace separated terms the trigram index can look up (3+ characters)"""
+    return [fold(term) for term in query.split()[:MAX_QUERY_TERMS] if len(term) >= 3]
+
+
+def _filters(alias, kinds, course):
+    sql, params = '', []
+    if kinds:
+        sql += f' AND {alias}.kind IN ({", ".join(["%s"] * len(kinds))})'
+        params += list(kinds)
+    if course:
+        sql += f' AND {alias}.course_id = %s'
+        params.append(course)
+    return sql, params
+
+
+def _search_words(expression, kinds, course, limit, offset):
+    filters, params = _filters('s', kinds, course)
+    marks = f"char({ord(MARK_START)}), char({ord(MARK_END)})"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT s.kind, s.object_id, s.course_id, '
+            f'highlight({SEARCH_TABLE}, 3, {marks}), '
+            f"snippet({SEARCH_TABLE}, 4, {marks}, '…', 16), "
+            f'highlight({SEARCH_TABLE}, 5, {marks}), '
+            f'bm25({SEARCH_TABLE}, 0, 0, 0, %s, %s, %s) AS score '
+            f'FROM {SEARCH_TABLE} s WHERE {SEARCH_TABLE} MATCH %s{filters} '
+            f'ORDER BY score, s.rowid LIMIT %s OFFSET %s',
+            [*COLUMN_WEIGHTS, expression, *params, limit, offset],
+        )
+        return cursor.fetchall()
+
+
+def _search_substrings(terms, kinds, course, limit, offset):
+    filters, params = _filters('s', kinds, course)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT s.kind, s.object_id, s.course_id, s.title, s.body, s.path, '
+            f'bm25({TRIGRAM_TABLE}, %s, %s, %s) AS score '
+            f'FROM {TRIGRAM_TABLE} t JOIN {SEARCH_TABLE} s ON s.rowid = t.rowid '
+            f'WHERE {TRIGRAM_TABLE} MATCH %s{filters} '
+            f'ORDER BY score, t.rowid LIMIT %s OFFSET %s',
+            [*COLUMN_WEIGHTS, ' '.join(_quote(term) for term in terms), *params, limit, offset],
+        )
+        return [
+            (kind, pk, course_id, mark_terms(title, terms), excerpt(mark_terms(body, terms)),
+             mark_terms(path, terms), score)
+            for kind, pk, course_id, title, body, path, score in cursor.fetchall()
+        ]
+
+
+def _has_word_hits(expression, kinds, course):
+    return bool(_search_words(expression, kinds, course, 1, 0))
+
+
+def _search_icontains(query, kinds, course, limit, offset):
+    terms = [term for term in query.split()[:MAX_QUERY_TERMS]]
+    folded = [fold(term) for term in terms]
+    hits = []
+    for kind in kinds or KINDS:
+        model, course_expression, title, body, path, fields = SEARCH_SOURCES[kind]
+        queryset = model.objects.all()
+        for term in terms:
+            queryset = queryset.filter(Q(*[Q(**{f'{field}__icontains': term}) for field in fields], _connector=Q.OR))
+        if course:
+            queryset = queryset.annotate(search_course=course_expression).filter(search_course=course)
+        for pk, course_id, title_text, body_text, path_text in _source_rows(kind, queryset)[:offset + limit]:
+            # Title matches first
+            score = -float(sum(term in fold(title_text) for term in folded))
+            hits.append((kind, pk, course_id, mark_terms(title_text, folded), excerpt(mark_terms(body_text, folded)),
+                         mark_terms(path_text, folded), score))
+    hits.sort(key=lambda hit: (hit[-1], KINDS.index(hit[0]), hit[1]))
+    return hits[offset:offset + limit]
+
+
+def search(query, kinds=None, course=None, limit=20, offset=0):
+    """
+    Returns ``(mode, hits)``: ``mode`` is ``'words'``, ``'substrings'``
+    (trigram fallback) or ``'icontains'`` (no index), each hit a dict with
+    the kind, id, course, highlighted title / body excerpt / path and score.
+    """
+    if not index_available():
+        mode, rows = 'icontains', _search_icontains(query, kinds, course, limit, offset)
+    else:
+        mode, rows = 'words', []
+        expression = word_query(query)
+        if expression:
+            rows = _search_words(expression, kinds, course, limit, offset)
+        if not rows and not (offset and expression and _has_word_hits(expression, kinds, course)):
+            terms = substring_terms(query)
+            if terms:
+                mode, rows = 'substrings', _search_substrings(terms, kinds, course, limit, offset)
+    return mode, [
+        {
+            'kind': kind,
+            'id': pk,
+            'course': course_id,
+            'title': render_highlight(title),
+            'body': render_highlight(body),
+            'path': render_highlight(path),
+            'score': round(-score, 4),
+        }
+        for kind, pk, course_id, title, body, path, score in rows
+    ]
+
+
+def search_ids(kind, query, limit=1000):
+    """Primary keys of the ``kind`` rows matching ``query``, best first; ``None`` without the index"""
+    if not index_available():
+        return None
+    return [hit['id'] for hit in search(query, kinds=[kind], limit=limit)[1]]
+
+
+# Highlighting
+
+def mark_terms(text, terms):
+    """Surrounds the occurrences of the folded ``terms`` in ``text`` with the highlight markers"""
+    text = text or ''
+    folded = fold(text)
+    spans = []
+    for term in terms:
+        start = folded.find(term) if term else -1
+        while start != -1:
+            spans.append((start, start + len(term)))
+            start = folded.find(term, start + len(term))
+    if not spans:
+        return text
+    spans.sort()
+    merged = [list(spans[0])]
+    for start, end in spans[1:]:
+        if start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    parts, position = [], 0
+    for start, end in merged:
+        parts += [text[position:start], MARK_START, text[start:end], MARK_END]
+        position = end
+    parts.append(text[position:])
+    return ''.join(parts)
+
+
+def excerpt(text, width=EXCERPT_CHARS):
+    """The part of a long marked text around its first highlight"""
+    if len(text) <= width:
+        return text
+    first = max(text.find(MARK_START), 0)
+    start = max(0, first - width // 3)
+    end = start + width
+    # Do not cut a highlight in half
+    if text.rfind(MARK_START, start, end) > text.rfind(MARK_END, start, end):
+        end = text.find(MARK_END, end) + 1
+    return ('…' if start else '') + text[start:end] + ('…' if end < len(text) else '')
+
+
+def render_highlight(text):
+    """HTML-escapes indexed text and turns the markers into <mark> elements"""
+    return html.escape(text or '').replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
@@ -1,20 +1,27 @@
 from rest_framework import serializers
-from .models import Course, Lesson, Material, Level
+from django.utils import timezone
+from .models import Course, CourseProgress, Lesson, Material, MaterialProgress, Level
+from .previews import material_preview_kind, preview_url
+from .sparse_fields import SparseFieldsMixin
 
 
-class MaterialSerializer(serializers.ModelSerializer):
+class MaterialSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
-    course_id = serializers.IntegerField(source='course.id', read_only=True)
+    preview_url = serializers.SerializerMethodField()
+    course_id = serializers.IntegerField(read_only=True)
     course_title = serializers.CharField(source='course.title', read_only=True)
-    level_id = serializers.IntegerField(source='level.id', read_only=True)
+    level_id = serializers.IntegerField(read_only=True)
     level_title = serializers.CharField(source='level.title', read_only=True)
     
     class Meta:
         model = Material
-        fields = ['id', 'title', 'material_type', 'file_url', 'file_size', 'duration', 'order', 
-                  'course', 'course_id', 'course_title', 'level', 'level_id', 'level_title', 
-                  'file_path', 'file', 'created_at']
-        read_only_fields = ['title', 'material_type', 'file_size', 'file_path', 'created_at']
+        fields = ['id', 'title', 'material_type', 'file_url', 'preview_url', 'file_size', 'duration', 'page_count', 
+                  'width', 'height', 'order', 'course', 'course_id', 'course_title', 'level', 'level_id', 
+                  'level_title', 'file_path', 'file', 'content_hash', 'created_at']
+        read_only_fields = ['title', 'material_type', 'file_size', 'page_count', 'width', 'height', 
+                            'file_path', 'content_hash', 'created_at']
+        # Model fields read by method fields, for deferring columns (sparse_fields.py)
+        field_sources = {'preview_url': ['material_type', 'file', 'file_path', 'duplicate_of']}
     
     def get_file_url(self, obj):
         request = self.context.get('request')
@@ -23,12 +30,18 @@ class MaterialSerializer(serializers.ModelSerializer):
             url = reverse('material-file', kwargs={'pk': obj.pk})
             return request.build_absolute_uri(url)
         return None
+    
+    def get_preview_url(self, obj):
+        # Resized image / PDF first page; clients pick a size with ?width=
+        if material_preview_kind(obj) and (obj.file or obj.file_path or obj.duplicate_of_id):
+            return preview_url(self.context.get('request'), 'material-preview', obj.pk)
+        return None
 
 
-class LevelSerializer(serializers.ModelSerializer):
+class LevelSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     materials = MaterialSerializer(many=True, read_only=True)
     materials_count = serializers.SerializerMethodField()
-    course_id = serializers.IntegerField(source='course.id', read_only=True)
+    course_id = serializers.IntegerField(read_only=True)
     course_title = serializers.CharField(source='course.title', read_only=True)
     
     class Meta:
@@ -36,10 +49,14 @@ class LevelSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'description', 'level_number', 'order', 'course', 'course_id', 'course_title', 'materials', 'materials_count', 'created_at']
     
     def get_materials_count(self, obj):
-        return obj.materials.count()
+        # Annotated by LevelViewSet / CourseViewSet; query only when used elsewhere
+        count = getattr(obj, 'materials_count', None)
+        if count is None:
+            count = obj.materials.count()
+        return count
 
 
-class LessonSerializer(serializers.ModelSerializer):
+class LessonSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     materials = MaterialSerializer(many=True, read_only=True)
     
     class Meta:
@@ -47,30 +64,109 @@ class LessonSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'description', 'order', 'materials']
 
 
-class CourseSerializer(serializers.ModelSerializer):
+class CourseSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     lessons = LessonSerializer(many=True, read_only=True)
     materials = MaterialSerializer(many=True, read_only=True)
     levels = LevelSerializer(many=True, read_only=True)
     level_display = serializers.CharField(source='get_level_display', read_only=True)
+    thumbnail_preview_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Course
-        fields = ['id', 'title', 'description', 'thumbnail', 'level', 'level_display', 
+        fields = ['id', 'title', 'description', 'thumbnail', 'thumbnail_preview_url', 'level', 'level_display', 
                   'table_of_contents', 'created_at', 'updated_at', 'lessons', 'materials', 'levels']
+        field_sources = {
+            'level_display': ['level'],
+            'thumbnail_preview_url': ['thumbnail'],
+        }
+    
+    def get_thumbnail_preview_url(self, obj):
+        if obj.thumbnail:
+            return preview_url(self.context.get('request'), 'course-thumbnail', obj.pk)
+        return None
 
 
-class CourseListSerializer(serializers.ModelSerializer):
+class CourseListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     level_display = serializers.CharField(source='get_level_display', read_only=True)
     materials_count = serializers.SerializerMethodField()
     levels_count = serializers.SerializerMethodField()
+    thumbnail_preview_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Course
-        fields = ['id', 'title', 'description', 'thumbnail', 'level', 'level_display', 
+        fields = ['id', 'title', 'description', 'thumbnail', 'thumbnail_preview_url', 'level', 'level_display', 
                   'materials_count', 'levels_count', 'created_at']
+        field_sources = {
+            'level_display': ['level'],
+            'thumbnail_preview_url': ['thumbnail'],
+        }
+        # The course tree, embedded in list items with ?expand=levels etc.
+        expandable_fields = {
+            'lessons': (LessonSerializer, {'many': True, 'read_only': True}),
+            'materials': (MaterialSerializer, {'many': True, 'read_only': True}),
+            'levels': (LevelSerializer, {'many': True, 'read_only': True}),
+        }
+    
+    def get_thumbnail_preview_url(self, obj):
+        if obj.thumbnail:
+            return preview_url(self.context.get('request'), 'course-thumbnail', obj.pk)
+        return None
     
+    # Counts are annotated by CourseViewSet.list; query only when used elsewhere
     def get_materials_count(self, obj):
-        return obj.materials.count()
+        count = getattr(obj, 'materials_count', None)
+        if count is None:
+            count = obj.materials.count()
+        return count
     
     def get_levels_count(self, obj):
-        return obj.levels.count()
+        count = getattr(obj, 'levels_count', None)
+        if count is None:
+            count = obj.levels.count()
+        return count
+
+
+
+class MaterialChangeSerializer(serializers.Serializer):
+    """One entry of PATCH /api/materials/bulk/"""
+    id = serializers.IntegerField(min_value=1)
+    order = serializers.IntegerField(required=False)
+    level = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+    lesson = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+
+
+class LevelChangeSerializer(serializers.Serializer):
+    """One entry of PATCH /api/levels/bulk/"""
+    id = serializers.IntegerField(min_value=1)
+    order = serializers.IntegerField(required=False)
+    level_number = serializers.IntegerField(min_value=1, required=False)
+    course = serializers.IntegerField(min_value=1, required=False)
+
+
+class ProgressEventSerializer(serializers.Serializer):
+    """One progress event sent by a client to /api/progress/events/"""
+    material = serializers.IntegerField(min_value=1)
+    position = serializers.IntegerField(min_value=0, default=0)
+    percent = serializers.IntegerField(min_value=0, max_value=100, default=0)
+    completed = serializers.BooleanField(default=False)
+    occurred_at = serializers.DateTimeField(required=False)
+    
+    def validate(self, attrs):
+        # Client clocks drift; events from the future would win every merge
+        now = timezone.now()
+        attrs['occurred_at'] = min(attrs.get('occurred_at') or now, now)
+        return attrs
+
+
+class MaterialProgressSerializer(serializers.ModelSerializer):
+    
+    class Meta:
+        model = MaterialProgress
+        fields = ['material', 'position', 'percent', 'completed', 'completed_at', 'event_at', 'updated_at']
+
+
+class CourseProgressSerializer(serializers.ModelSerializer):
+    
+    class Meta:
+        model = CourseProgress
+        fields = ['course', 'completed_materials', 'total_materials', 'percent', 'last_activity_at', 'updated_at']
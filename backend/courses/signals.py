@@ -0,0 +1,133 @@
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import background
+from .cache import CATALOG_SCOPE, course_scope, invalidate_scopes, level_scope
+from .models import Course, Lesson, Level, Material, Tombstone
+from .progress import refresh_courses
+from .search import SEARCH_MODELS, index_objects, remove_objects
+from .sync import TOMBSTONE_KINDS
+
+
+@receiver(post_delete, sender=Lesson)
+@receiver(post_delete, sender=Level)
+@receiver(post_delete, sender=Material)
+def touch_course_on_child_delete(sender, instance, origin=None, **kwargs):
+    """
+    Bump Course.updated_at when a lesson, level or material is deleted.
+
+    Deletions leave no timestamp behind, so without this a course detail
+    validated with If-Modified-Since would keep answering 304.
+    """
+    if isinstance(origin, Course):
+        # The course itself is being deleted
+        return
+    lookup = Q(pk=instance.course_id)
+    if sender is Material:
+        if instance.level_id:
+            lookup |= Q(levels=instance.level_id)
+        if instance.lesson_id:
+            lookup |= Q(lessons=instance.lesson_id)
+    Course.objects.filter(lookup).update(updated_at=timezone.now())
+
+
+def _cache_scopes(sender, instance):
+    """Response cache scopes whose payload includes ``instance``"""
+    scopes = {CATALOG_SCOPE}
+    if sender is Course:
+        scopes.add(course_scope(instance.pk))
+        # Level-filtered material lists show the course title
+        scopes.update(level_scope(pk) for pk in Level.objects.filter(course=instance.pk).values_list('pk', flat=True))
+    elif sender is Level:
+        scopes.update({course_scope(instance.course_id), level_scope(instance.pk)})
+    elif sender is Lesson:
+        scopes.add(course_scope(instance.course_id))
+    elif sender is Material:
+        if instance.course_id:
+            scopes.add(course_scope(instance.course_id))
+        if instance.level_id:
+            scopes.add(level_scope(instance.level_id))
+        course_ids = Course.objects.filter(
+            Q(levels=instance.level_id) | Q(lessons=instance.lesson_id)
+        ).values_list('pk', flat=True) if instance.level_id or instance.lesson_id else []
+        scopes.update(course_scope(pk) for pk in course_ids)
+    return scopes
+
+
+@receiver(pre_save, sender=Level)
+@receiver(pre_save, sender=Lesson)
+@receiver(pre_save, sender=Material)
+def remember_previous_parents(sender, instance, raw=False, **kwargs):
+    """Keeps the scopes of the previous parents so moving a row invalidates both sides"""
+    instance._previous_cache_scopes = set()
+    if raw or instance.pk is None:
+        return
+    previous = sender.objects.filter(pk=instance.pk).first()
+    if previous is not None:
+        instance._previous_cache_scopes = _cache_scopes(sender, previous)
+        instance._previous_course_id = previous.course_id
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Level)
+@receiver(post_save, sender=Lesson)
+@receiver(post_save, sender=Material)
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Level)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_delete, sender=Material)
+def invalidate_cached_responses(sender, instance, origin=None, **kwargs):
+    if sender is not Course and isinstance(origin, Course):
+        # Covered by the post_delete of the course itself
+        return
+    scopes = _cache_scopes(sender, instance) | getattr(instance, '_previous_cache_scopes', set())
+    # After commit, so a concurrent read cannot cache the old rows under the new version
+    transaction.on_commit(lambda: invalidate_scopes(*scopes))
+
+
+@receiver(post_save, sender=Material)
+@receiver(post_delete, sender=Material)
+def refresh_course_progress(sender, instance, created=True, origin=None, **kwargs):
+    """A material added to or removed from a course changes the totals of its progress summaries"""
+    if not created or isinstance(origin, Course):
+        return
+    lookup = Q(pk=instance.course_id)
+    if instance.level_id:
+        lookup |= Q(levels=instance.level_id)
+    if instance.lesson_id:
+        lookup |= Q(lessons=instance.lesson_id)
+    course_ids = set(Course.objects.filter(lookup).values_list('pk', flat=True))
+    if course_ids:
+        transaction.on_commit(lambda: background.submit(refresh_courses, course_ids))
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Level)
+@receiver(post_save, sender=Lesson)
+@receiver(post_save, sender=Material)
+def update_search_index(sender, instance, **kwargs):
+    index_objects(SEARCH_MODELS[sender], [instance.pk])
+    if sender in (Level, Lesson) and getattr(instance, '_previous_course_id', None) not in (None, instance.course_id):
+        # Materials are indexed under the course of their level or lesson
+        materials = Material.objects.filter(**{sender._meta.model_name: instance.pk}).values_list('pk', flat=True)
+        index_objects('material', materials)
+
+
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Level)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_delete, sender=Material)
+def remove_from_search_index(sender, instance, **kwargs):
+    remove_objects(SEARCH_MODELS[sender], [instance.pk])
+
+
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Level)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_delete, sender=Material)
+def record_tombstone(sender, instance, **kwargs):
+    """Deletions leave no row behind; /api/sync/ clients learn about them from the tombstone"""
+    Tombstone.objects.create(kind=TOMBSTONE_KINDS[sender], object_id=instance.pk)
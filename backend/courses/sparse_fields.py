@@ -0,0 +1,176 @@
+"""
+Sparse fieldsets for the catalog endpoints.
+
+Read requests can shape the payload with three query parameters, each a
+comma separated list of field names, with dots for nested serializers:
+
+``?fields=id,title,levels.id``
+    only these fields (``levels`` alone keeps all of its default fields)
+``?omit=description,levels.materials``
+    every default field except these
+``?expand=levels``
+    add fields that are left out by default (``Meta.expandable_fields``)
+
+The parsed ``Fieldset`` is handed to the serializers through the context and
+to the viewsets' querysets, so a relation that is not rendered is neither
+joined nor prefetched. When ``fields``/``omit`` narrow the top-level
+payload, the columns no remaining field reads are deferred as well.
+Unknown names are ignored.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import ListSerializer
+
+
+FIELDSET_PARAMS = ('fields', 'omit', 'expand')
+
+
+class Fieldset:
+    """Selection of fields for one serializer level, plus the nested levels"""
+
+    def __init__(self):
+        self.fields = None
+        self.omit = set()
+        self.expand = set()
+        self.children = {}
+
+    @classmethod
+    def from_query_params(cls, query_params):
+        fieldset = cls()
+        for kind in FIELDSET_PARAMS:
+            for value in query_params.getlist(kind):
+                for path in value.split(','):
+                    path = path.strip()
+                    if path:
+                        fieldset._add(kind, path.split('.'))
+        return fieldset
+
+    def _add(self, kind, path):
+        name, rest = path[0], path[1:]
+        # levels.id selects (or expands) levels itself as well, while
+        # levels.materials only omits materials inside levels
+        if kind == 'fields':
+            self.fields = (self.fields or set()) | {name}
+        elif kind == 'expand':
+            self.expand.add(name)
+        elif not rest:
+            self.omit.add(name)
+        if rest:
+            self.children.setdefault(name, Fieldset())._add(kind, rest)
+
+    @property
+    def is_default(self):
+        return self.fields is None and not self.omit and not self.expand and not self.children
+
+    def wants(self, name):
+        """Whether the default field ``name`` is rendered"""
+        return (self.fields is None or name in self.fields) and name not in self.omit
+
+    def expands(self, name):
+        """Whether the expandable field ``name`` is rendered"""
+        selected = name in self.expand or (self.fields is not None and name in self.fields)
+        return selected and name not in self.omit
+
+    def child(self, name):
+        return self.children.get(name, ALL_FIELDS)
+
+
+ALL_FIELDS = Fieldset()
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin applying a Fieldset. The top-level serializer takes it
+    from ``context['fieldset']``; nested ones get their part from the parent.
+
+    ``Meta.expandable_fields`` maps names to ``(serializer_class, kwargs)``
+    for fields rendered only when expanded. ``Meta.field_sources`` lists the
+    model fields read by fields whose source is not a model field (method
+    fields, ``get_FOO_display``), for deferring columns.
+    """
+    _fieldset = None
+
+    def get_fieldset(self):
+        if self._fieldset is not None:
+            return self._fieldset
+        parent = self.parent
+        if isinstance(parent, ListSerializer):
+            parent = parent.parent
+        if parent is None:
+            return self.context.get('fieldset', ALL_FIELDS)
+        return ALL_FIELDS
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.get_fieldset()
+        if fieldset.is_default:
+            return fields
+
+        expanded = set()
+        for name, (serializer_class, kwargs) in getattr(self.Meta, 'expandable_fields', {}).items():
+            if fieldset.expands(name):
+                fields[name] = serializer_class(**kwargs)
+                expanded.add(name)
+        fields = {name: field for name, field in fields.items() if name in expanded or fieldset.wants(name)}
+
+        for name, field in fields.items():
+            nested = field.child if isinstance(field, ListSerializer) else field
+            if isinstance(nested, SparseFieldsMixin):
+                nested._fieldset = fieldset.child(name)
+        return fields
+
+
+def selected_columns(serializer):
+    """
+    Model field paths read by the fields ``serializer`` renders, for
+    ``QuerySet.only()``. Always includes the primary key and the default
+    ordering (the cursor pagination reads it).
+    """
+    model = serializer.Meta.model
+    field_sources = getattr(serializer.Meta, 'field_sources', {})
+    paths = {model._meta.pk.name}
+    paths.update(name.lstrip('-') for name in model._meta.ordering)
+    for name, field in serializer.fields.items():
+        for source in field_sources.get(name, [field.source]):
+            if source == '*':
+                continue
+            parts = source.split('.')
+            try:
+                model_field = model._meta.get_field(parts[0])
+            except FieldDoesNotExist:
+                continue
+            if not model_field.concrete or model_field.many_to_many:
+                continue
+            paths.add(model_field.name)
+            if len(parts) > 1 and model_field.is_relation:
+                paths.add(f'{model_field.name}__{parts[1]}')
+    return sorted(paths)
+
+
+class SparseFieldsViewMixin:
+    """
+    Viewset mixin parsing ``?fields=``/``?omit=``/``?expand=`` on read
+    actions. ``get_queryset()`` uses ``get_fieldset()`` to skip joins and
+    prefetches, and ``select_columns()`` to defer unread columns.
+    """
+    fieldset_actions = ('list', 'retrieve')
+
+    def get_fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            request = getattr(self, 'request', None)
+            if request is not None and request.method in SAFE_METHODS and self.action in self.fieldset_actions:
+                self._fieldset = Fieldset.from_query_params(request.query_params)
+            else:
+                self._fieldset = ALL_FIELDS
+        return self._fieldset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fieldset'] = self.get_fieldset()
+        return context
+
+    def select_columns(self, queryset):
+        fieldset = self.get_fieldset()
+        if fieldset.fields is None and not fieldset.omit:
+            return queryset
+        return queryset.only(*selected_columns(self.get_serializer()))
@@ -0,0 +1,204 @@
+"""
+Delta sync of the catalog for offline clients (``/api/sync/?since=``).
+
+Every change is identified by a key ``(timestamp, kind, id)``: the
+``updated_at`` of a course, level, lesson or material row, or the
+``deleted_at`` of the tombstone written when one is deleted. A sync cursor
+is the last key a client has received; the next page is the keys after it,
+read with one ``UNION ALL`` of index range scans on ``(updated_at, id)``
+(each part capped at the page size), so a client with nothing to catch up
+on costs a single indexed query. Only a page with changes loads the rows
+themselves, one query per kind.
+
+``updated_at`` is set when a row is saved, not when the transaction
+commits, so the cursor handed out at the end of the feed stays
+``SAFETY_WINDOW`` seconds behind the current time: rows written in that
+window are sent again on the next sync, and a slow transaction cannot hide
+behind a cursor that already moved past its timestamps.
+
+Without ``since`` the whole catalog is sent (an initial sync); tombstones
+older than the start of that sync are skipped, the client has nothing to
+delete. Tombstones are kept ``TOMBSTONE_RETENTION_DAYS``
+(``python manage.py prune_sync_tombstones``); older cursors are refused and
+the client starts over.
+"""
+import base64
+import json
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Course, Lesson, Level, Material, Tombstone
+
+
+DEFAULT_SETTINGS = {
+    'PAGE_SIZE': 500,
+    'MAX_PAGE_SIZE': 2000,
+    'SAFETY_WINDOW': 60,
+    'TOMBSTONE_RETENTION_DAYS': 90,
+}
+
+# (response key, tombstone kind, model, columns sent); the position is the kind code of the keys
+SYNC_SOURCES = [
+    ('courses', 'course', Course, ['id', 'title', 'description', 'level', 'thumbnail', 'table_of_contents',
+                                   'created_at', 'updated_at']),
+    ('levels', 'level', Level, ['id', 'course', 'title', 'description', 'level_number', 'order', 'updated_at']),
+    ('lessons', 'lesson', Lesson, ['id', 'course', 'title', 'description', 'order', 'updated_at']),
+    ('materials', 'material', Material, ['id', 'course', 'level', 'lesson', 'title', 'material_type', 'file_size',
+                                         'duration', 'page_count', 'width', 'height', 'content_hash', 'order',
+                                         'created_at', 'updated_at']),
+]
+
+DELETED = len(SYNC_SOURCES)
+
+RESPONSE_KEYS = {kind: key for key, kind, _, _ in SYNC_SOURCES}
+
+TOMBSTONE_KINDS = {model: kind for _, kind, model, _ in SYNC_SOURCES}
+
+
+class InvalidCursor(Exception):
+    """The cursor is malformed"""
+
+
+class ExpiredCursor(Exception):
+    """Tombstones the client would need have been pruned"""
+
+
+def get_sync_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'COURSES_SYNC', {})}
+
+
+def encode_cursor(key, started_at=None):
+    timestamp, code, pk = key
+    payload = json.dumps(
+        [timestamp.isoformat(), code, pk, started_at.isoformat() if started_at else None], separators=(',', ':'),
+    )
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _parse_timestamp(value):
+    timestamp = parse_datetime(value) if isinstance(value, str) else value
+    if timestamp is None:
+        raise InvalidCursor(value)
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp, dt_timezone.utc)
+    return timestamp
+
+
+def decode_cursor(encoded):
+    """``(key, started_at)`` of a cursor made by encode_cursor"""
+    try:
+        payload = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+        timestamp, code, pk, started_at = json.loads(payload)
+        key = (_parse_timestamp(timestamp), int(code), int(pk))
+        return key, _parse_timestamp(started_at) if started_at else None
+    except (TypeError, ValueError):
+        raise InvalidCursor(encoded)
+
+
+def _after(field, code, key):
+    """Rows of kind ``code`` whose key ``(field, code, id)`` sorts after ``key``"""
+    timestamp, key_code, pk = key
+    if code < key_code:
+        return Q(**{f'{field}__gt': timestamp})
+    if code > key_code:
+        return Q(**{f'{field}__gte': timestamp})
+    return Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'pk__gt': pk})
+
+
+def change_keys(after=None, limit=500, deleted_since=None):
+    """
+    The first ``limit`` change keys after ``after`` (from the start when
+    ``None``), in one query. Tombstones are included when ``deleted_since``
+    is given, from that time on.
+    """
+    parts = [(code, model.objects.all(), 'updated_at') for code, (_, _, model, _) in enumerate(SYNC_SOURCES)]
+    if deleted_since is not None:
+        parts.append((DELETED, Tombstone.objects.filter(deleted_at__gte=deleted_since), 'deleted_at'))
+
+    statements, params = [], []
+    for code, queryset, field in parts:
+        if after is not None:
+            queryset = queryset.filter(_after(field, code, after))
+        sql, part_params = queryset.order_by(field, 'pk').values_list(field, 'pk')[:limit].query.sql_with_params()
+        statements.append(f'SELECT changes_{code}.*, {code} FROM ({sql}) AS changes_{code}')
+        params += part_params
+    with connection.cursor() as cursor:
+        cursor.execute(f'{" UNION ALL ".join(statements)} ORDER BY 1, 3, 2 LIMIT %s', [*params, limit])
+        return [(_parse_timestamp(timestamp), code, pk) for timestamp, pk, code in cursor.fetchall()]
+
+
+def _row(kind, values):
+    if kind == 'course' and values['thumbnail']:
+        values['thumbnail'] = default_storage.url(values['thumbnail'])
+    return values
+
+
+def load_changes(keys):
+    """``(changes, deleted)``: the rows behind ``keys`` and the deleted ids, by response key"""
+    ids = {}
+    for _, code, pk in keys:
+        ids.setdefault(code, []).append(pk)
+    changes, deleted = {}, {}
+    for code, (key, kind, model, columns) in enumerate(SYNC_SOURCES):
+        if code in ids:
+            changes[key] = [_row(kind, values) for values in model.objects.filter(pk__in=ids[code]).order_by(
+                'updated_at', 'pk',
+            ).values(*columns)]
+    for kind, object_id in Tombstone.objects.filter(pk__in=ids.get(DELETED, [])).values_list('kind', 'object_id'):
+        deleted.setdefault(RESPONSE_KEYS[kind], []).append(object_id)
+    return changes, deleted
+
+
+def sync_page(cursor=None, page_size=None):
+    """
+    One page of changes after ``cursor`` (or of the whole catalog):
+    ``{'next', 'more', 'changes', 'deleted'}``. Raises InvalidCursor and
+    ExpiredCursor.
+    """
+    config = get_sync_settings()
+    page_size = page_size or config['PAGE_SIZE']
+    now = timezone.now()
+    if cursor:
+        after, started_at = decode_cursor(cursor)
+    else:
+        after, started_at = None, now
+    deleted_since = started_at or after[0]
+    if deleted_since < now - timedelta(days=config['TOMBSTONE_RETENTION_DAYS']):
+        raise ExpiredCursor(cursor)
+
+    keys = change_keys(after, page_size + 1, deleted_since=deleted_since if after else None)
+    more = len(keys) > page_size
+    keys = keys[:page_size]
+    if more:
+        next_key = keys[-1]
+    else:
+        # Stay behind the rows of transactions that may still be committing
+        safe_key = (now - timedelta(seconds=config['SAFETY_WINDOW']), 0, 0)
+        if keys:
+            next_key = min(keys[-1], safe_key)
+        else:
+            # Nothing after the cursor: move it up to the window (it never goes back)
+            next_key = max(after, safe_key) if after else safe_key
+        if started_at is not None and next_key[0] >= started_at:
+            started_at = None
+    changes, deleted = load_changes(keys) if keys else ({}, {})
+    return {
+        'next': encode_cursor(next_key, started_at),
+        'more': more,
+        'changes': changes,
+        'deleted': deleted,
+    }
+
+
+def prune_tombstones(now=None):
+    """Deletes the tombstones no valid cursor can reach any more; returns their number"""
+    now = now or timezone.now()
+    horizon = now - timedelta(days=get_sync_settings()['TOMBSTONE_RETENTION_DAYS'])
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=horizon).delete()
+    return deleted
@@ -0,0 +1,66 @@
+from rest_framework.test import APITestCase
+
+from accounts.models import User
+from courses.models import Course, Level
+
+
+class LevelBulkChangeTests(APITestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user('teacher', password='password', user_type='teacher')
+        self.client.force_authenticate(self.teacher)
+        self.course = Course.objects.create(title='Course')
+        self.other_course = Course.objects.create(title='Other course')
+        self.first = Level.objects.create(course=self.course, title='First', level_number=1)
+        self.second = Level.objects.create(course=self.course, title='Second', level_number=2)
+        self.other = Level.objects.create(course=self.other_course, title='Other', level_number=1)
+
+    def bulk(self, changes):
+        return self.client.patch('/api/levels/bulk/', changes, format='json')
+
+    def level_numbers(self):
+        return dict(Level.objects.values_list('pk', 'level_number'))
+
+    def test_swap_level_numbers(self):
+        response = self.bulk([
+            {'id': self.first.pk, 'level_number': 2},
+            {'id': self.second.pk, 'level_number': 1},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.level_numbers(), {self.first.pk: 2, self.second.pk: 1, self.other.pk: 1})
+
+    def test_shift_level_numbers(self):
+        response = self.bulk([
+            {'id': self.first.pk, 'level_number': 2},
+            {'id': self.second.pk, 'level_number': 3},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.level_numbers(), {self.first.pk: 2, self.second.pk: 3, self.other.pk: 1})
+
+    def test_move_to_course_with_free_number(self):
+        response = self.bulk([{'id': self.second.pk, 'course': self.other_course.pk}])
+
+        self.assertEqual(response.status_code, 200)
+        self.second.refresh_from_db()
+        self.assertEqual((self.second.course_id, self.second.level_number), (self.other_course.pk, 2))
+
+    def test_move_to_course_using_the_number_is_rejected(self):
+        response = self.bulk([{'id': self.first.pk, 'course': self.other_course.pk}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([detail['id'] for detail in response.data['details']], [self.first.pk])
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.course_id, self.course.pk)
+
+    def test_same_number_twice_in_a_batch_is_rejected(self):
+        third = Level.objects.create(course=self.course, title='Third', level_number=3)
+
+        response = self.bulk([
+            {'id': self.first.pk, 'level_number': 4},
+            {'id': third.pk, 'level_number': 4},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.level_numbers()[self.first.pk], 1)
+        self.assertEqual(self.level_numbers()[third.pk], 3)
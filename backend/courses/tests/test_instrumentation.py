@@ -0,0 +1,30 @@
+from django.test import TestCase, override_settings
+
+from courses.instrumentation import get_route_stats
+
+
+class InstrumentationTests(TestCase):
+
+    @override_settings(COURSES_INSTRUMENTATION={'SAMPLE_RATE': 0, 'SERVER_TIMING': True, 'LOG': True})
+    def test_server_timing_is_not_logged(self):
+        with self.assertNoLogs('courses.instrumentation'):
+            response = self.client.get('/api/courses/')
+
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertEqual(get_route_stats().summary()['GET course-list']['sampled'], 1)
+
+    @override_settings(COURSES_INSTRUMENTATION={'SAMPLE_RATE': 1, 'SERVER_TIMING': False, 'LOG': True})
+    def test_sampled_requests_are_logged(self):
+        with self.assertLogs('courses.instrumentation', 'INFO') as logs:
+            response = self.client.get('/api/courses/')
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('"route": "GET course-list"', logs.records[0].getMessage())
+
+    @override_settings(COURSES_INSTRUMENTATION={'SAMPLE_RATE': 0, 'SERVER_TIMING': False})
+    def test_not_recorded(self):
+        response = self.client.get('/api/courses/')
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(get_route_stats().summary(), {})
@@ -0,0 +1,63 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.models import User
+from courses.models import Course, Material
+
+
+class MaterialFileReplacementTests(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        teacher = User.objects.create_user('teacher', password='password', user_type='teacher')
+        self.client.force_authenticate(teacher)
+        course = Course.objects.create(title='Course')
+        self.original = Material.objects.create(
+            course=course, title='Original', file=ContentFile(b'old content', name='lesson.mp3'),
+        )
+        self.material = Material.objects.create(
+            course=course, title='Lesson', file=ContentFile(b'old content', name='lesson.mp3'),
+        )
+        Material.objects.filter(pk=self.material.pk).update(
+            content_hash='0' * 64, metadata_extracted_at=timezone.now(), duration=120, duplicate_of=self.original,
+        )
+
+    def patch(self, data):
+        with mock.patch('courses.views.schedule_hashing') as hashing, \
+                mock.patch('courses.views.schedule_metadata_extraction') as extraction:
+            response = self.client.patch(f'/api/materials/{self.material.pk}/', data, format='multipart')
+        return response, hashing, extraction
+
+    def test_new_file_resets_hash_and_metadata(self):
+        response, hashing, extraction = self.patch({'file': SimpleUploadedFile('lesson.mp3', b'new content')})
+
+        self.assertEqual(response.status_code, 200)
+        self.material.refresh_from_db()
+        self.assertIsNone(self.material.content_hash)
+        self.assertIsNone(self.material.metadata_extracted_at)
+        self.assertIsNone(self.material.duration)
+        self.assertIsNone(self.material.duplicate_of_id)
+        hashing.assert_called_once_with([self.material.pk])
+        extraction.assert_called_once_with([self.material.pk])
+
+    def test_other_changes_keep_hash_and_metadata(self):
+        response, hashing, extraction = self.patch({'order': 3})
+
+        self.assertEqual(response.status_code, 200)
+        self.material.refresh_from_db()
+        self.assertEqual(self.material.content_hash, '0' * 64)
+        self.assertIsNotNone(self.material.metadata_extracted_at)
+        self.assertEqual(self.material.duplicate_of_id, self.original.pk)
+        hashing.assert_not_called()
+        extraction.assert_not_called()
@@ -0,0 +1,149 @@
+import datetime
+from unittest import mock
+
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.models import User
+from courses import progress
+from courses.models import Course, CourseProgress, Level, Material, MaterialProgress
+
+
+@override_settings(COURSES_PROGRESS={'FLUSH_INTERVAL': 0})
+class ProgressEventTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('student', password='password')
+        cls.course = Course.objects.create(title='Course')
+        level = Level.objects.create(course=cls.course, title='Level 1', level_number=1)
+        # One material attached to the course, one through its level
+        cls.lesson = Material.objects.create(course=cls.course, title='Lesson', file_path='lesson.mp3')
+        cls.exercise = Material.objects.create(level=level, title='Exercise', file_path='exercise.pdf')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.now = timezone.now()
+
+    def post(self, *events):
+        return self.client.post('/api/progress/events/', {'events': list(events)}, format='json')
+
+    def event(self, minutes_ago, material=None, **fields):
+        occurred_at = self.now - datetime.timedelta(minutes=minutes_ago)
+        return {'material': (material or self.lesson).pk, 'occurred_at': occurred_at.isoformat(), **fields}
+
+    def stored(self, material=None):
+        return MaterialProgress.objects.get(user=self.user, material=material or self.lesson)
+
+    def test_events_are_written(self):
+        response = self.post(self.event(1, position=30, percent=20), self.event(0, material=self.exercise))
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data, {'accepted': 2, 'rejected': []})
+        self.assertEqual(self.stored().position, 30)
+        self.assertEqual(MaterialProgress.objects.filter(user=self.user).count(), 2)
+
+    def test_unknown_material_is_rejected(self):
+        response = self.post(self.event(0), {'material': 999999})
+
+        self.assertEqual(response.data, {'accepted': 1, 'rejected': [999999]})
+
+    def test_newest_position_wins(self):
+        self.post(self.event(1, position=30))
+        # Sent later by another device, but it happened before
+        self.post(self.event(5, position=90))
+
+        stored = self.stored()
+        self.assertEqual(stored.position, 30)
+        self.assertEqual(stored.event_at, self.now - datetime.timedelta(minutes=1))
+
+    def test_newest_position_wins_within_a_batch(self):
+        self.post(self.event(1, position=30), self.event(5, position=90))
+
+        self.assertEqual(self.stored().position, 30)
+
+    def test_percent_only_grows(self):
+        self.post(self.event(5, percent=60))
+        self.post(self.event(1, percent=40))
+
+        self.assertEqual(self.stored().percent, 60)
+
+    def test_completion_is_sticky(self):
+        self.post(self.event(5, completed=True))
+        self.post(self.event(1, percent=10, position=3))
+
+        stored = self.stored()
+        self.assertTrue(stored.completed)
+        self.assertEqual(stored.percent, 100)
+        self.assertEqual(stored.completed_at, self.now - datetime.timedelta(minutes=5))
+        self.assertEqual(stored.position, 3)
+
+    def test_full_percent_completes(self):
+        self.post(self.event(1, percent=100))
+
+        self.assertTrue(self.stored().completed)
+
+    def test_course_summary(self):
+        self.post(self.event(2, completed=True), self.event(1, material=self.exercise, percent=50))
+
+        summary = CourseProgress.objects.get(user=self.user, course=self.course)
+        self.assertEqual(summary.completed_materials, 1)
+        self.assertEqual(summary.total_materials, 2)
+        self.assertEqual(summary.percent, 75)
+        self.assertEqual(summary.last_activity_at, self.now - datetime.timedelta(minutes=1))
+
+        response = self.client.get('/api/progress/courses/')
+        self.assertEqual(response.status_code, 200)
+        rows = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertEqual(
+            [(row['course'], row['completed_materials'], row['percent']) for row in rows], [(self.course.pk, 1, 75)],
+        )
+
+    def test_course_summary_is_rewritten(self):
+        self.post(self.event(2, completed=True))
+        self.post(self.event(1, material=self.exercise, completed=True))
+
+        summary = CourseProgress.objects.get(user=self.user, course=self.course)
+        self.assertEqual((summary.completed_materials, summary.percent), (2, 100))
+
+
+class ProgressBufferTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('student', password='password')
+        course = Course.objects.create(title='Course')
+        cls.material = Material.objects.create(course=course, title='Lesson', file_path='lesson.mp3')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def post(self):
+        response = self.client.post('/api/progress/events/', [{'material': self.material.pk, 'percent': 40}], format='json')
+        self.assertEqual(response.status_code, 202)
+
+    def test_buffered_until_read(self):
+        with override_settings(COURSES_PROGRESS={'FLUSH_INTERVAL': 60}):
+            self.post()
+            self.assertFalse(MaterialProgress.objects.exists())
+
+            response = self.client.get('/api/progress/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(MaterialProgress.objects.get().percent, 40)
+
+    def test_settings_change_writes_the_pending_states(self):
+        with override_settings(COURSES_PROGRESS={'FLUSH_INTERVAL': 60}):
+            self.post()
+            buffer = progress.get_progress_buffer()
+        self.assertEqual(len(buffer), 0)
+        self.assertIsNone(buffer._timer)
+        self.assertEqual(MaterialProgress.objects.get().percent, 40)
+
+    def test_states_of_another_database_are_dropped(self):
+        with override_settings(COURSES_PROGRESS={'FLUSH_INTERVAL': 60}):
+            self.post()
+            with mock.patch('courses.progress.current_database', return_value='destroyed'):
+                with self.assertLogs('courses.progress', 'WARNING'):
+                    progress.close_progress_buffer()
+        self.assertFalse(MaterialProgress.objects.exists())
@@ -0,0 +1,74 @@
+from django.test import TestCase, override_settings
+
+from courses.models import Course, Lesson, Level, Material
+
+
+# Queries per endpoint, including the ETag / Last-Modified validator queries.
+# They must not depend on the size of the catalog.
+EXPECTED_QUERIES = {
+    'course list': 5,
+    'course detail': 10,
+    'level list': 5,
+    'level list by course': 5,
+    'level detail': 4,
+    'material list': 3,
+    'material list by course': 3,
+    'material list by level': 3,
+    'material detail': 2,
+}
+
+
+class QueryCountMixin:
+    courses = levels = materials = 0
+
+    @classmethod
+    def setUpTestData(cls):
+        for course_number in range(cls.courses):
+            course = Course.objects.create(title=f'Course {course_number}')
+            lesson = Lesson.objects.create(course=course, title='Lesson')
+            for level_number in range(1, cls.levels + 1):
+                level = Level.objects.create(course=course, title=f'Level {level_number}', level_number=level_number)
+                Material.objects.bulk_create([
+                    Material(
+                        course=course,
+                        level=level,
+                        lesson=lesson if n % 2 else None,
+                        title=f'Material {n}',
+                        file_path=f'{course_number}/{level_number}/{n}.pdf',
+                        material_type='pdf',
+                        order=n,
+                    )
+                    for n in range(cls.materials)
+                ])
+        cls.course = Course.objects.order_by('pk').last()
+        cls.level = Level.objects.filter(course=cls.course).order_by('level_number').first()
+        cls.material = Material.objects.filter(level=cls.level).order_by('pk').first()
+
+    def urls(self):
+        return {
+            'course list': '/api/courses/',
+            'course detail': f'/api/courses/{self.course.pk}/',
+            'level list': '/api/levels/',
+            'level list by course': f'/api/levels/?course={self.course.pk}',
+            'level detail': f'/api/levels/{self.level.pk}/',
+            'material list': '/api/materials/',
+            'material list by course': f'/api/materials/?course={self.course.pk}',
+            'material list by level': f'/api/materials/?level={self.level.pk}',
+            'material detail': f'/api/materials/{self.material.pk}/',
+        }
+
+    def test_query_counts(self):
+        for name, url in self.urls().items():
+            with self.subTest(name), self.assertNumQueries(EXPECTED_QUERIES[name]):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+
+@override_settings(COURSES_RESPONSE_CACHE={'ENABLED': False})
+class SmallCatalogQueryCountTests(QueryCountMixin, TestCase):
+    courses, levels, materials = 2, 2, 3
+
+
+@override_settings(COURSES_RESPONSE_CACHE={'ENABLED': False})
+class LargerCatalogQueryCountTests(QueryCountMixin, TestCase):
+    courses, levels, materials = 12, 5, 20
@@ -0,0 +1,50 @@
+import re
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from courses.models import Course, Level, Material
+
+
+# "SCAN courses_material" without an index; "SCAN ... USING INDEX" walks one in order
+FULL_SCAN = re.compile(r'\bSCAN courses_\w+$', re.MULTILINE)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN checks run on SQLite only')
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(title='Course')
+        cls.level = Level.objects.create(course=cls.course, title='Level', level_number=1)
+        Material.objects.create(course=cls.course, level=cls.level, title='Material', file_path='material.pdf')
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index}', plan)
+        self.assertIsNone(FULL_SCAN.search(plan), plan)
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_materials_by_course(self):
+        self.assertUsesIndex(Material.objects.filter(course=self.course), 'material_course_ordering_idx')
+
+    def test_materials_by_level(self):
+        self.assertUsesIndex(Material.objects.filter(level=self.level), 'material_level_ordering_idx')
+
+    def test_material_list(self):
+        self.assertUsesIndex(Material.objects.all(), 'material_ordering_idx')
+
+    def test_levels_by_course(self):
+        self.assertUsesIndex(Level.objects.filter(course=self.course), 'level_course_ordering_idx')
+
+    def test_level_list(self):
+        self.assertUsesIndex(Level.objects.all(), 'level_ordering_idx')
+
+    def test_scanner_path_lookup(self):
+        self.assertUsesIndex(Material.objects.filter(file_path='material.pdf'), 'material_unique_file_path')
+
+    def test_endpoint_queries(self):
+        # Every query of the catalog endpoints; raises CommandError on a scan or an unindexed sort
+        call_command('explain_queries', stdout=StringIO())
@@ -0,0 +1,88 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from courses.cache import LocalLRUCache
+from courses.checks import check_response_cache
+from courses.models import Course
+
+
+@override_settings(COURSES_RESPONSE_CACHE={'ENABLED': True})
+class ResponseCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(title='Before')
+
+    def get_course(self, **headers):
+        return self.client.get(f'/api/courses/{self.course.pk}/', **headers)
+
+    def test_cached_body(self):
+        first = self.get_course()
+        second = self.get_course()
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_write_without_version_bump(self):
+        # Like a write from another process: no post_save, the versions stay put
+        first = self.get_course()
+        Course.objects.filter(pk=self.course.pk).update(title='After', updated_at=timezone.now())
+        second = self.get_course()
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.json()['title'], 'After')
+
+        not_modified = self.get_course(HTTP_IF_NONE_MATCH=second['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        stale = self.get_course(HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(stale.json()['title'], 'After')
+
+
+class ResponseCacheCheckTests(SimpleTestCase):
+
+    @override_settings(COURSES_RESPONSE_CACHE={'ENABLED': False})
+    def test_disabled(self):
+        self.assertEqual(check_response_cache(None), [])
+
+    @override_settings(
+        COURSES_RESPONSE_CACHE={'ENABLED': True},
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    )
+    def test_process_local_versions(self):
+        self.assertEqual([message.id for message in check_response_cache(None)], ['courses.W001'])
+
+    @override_settings(COURSES_RESPONSE_CACHE={'ENABLED': True, 'VERSION_CACHE': 'missing'})
+    def test_unknown_alias(self):
+        self.assertEqual([message.id for message in check_response_cache(None)], ['courses.E001'])
+
+    @override_settings(
+        COURSES_RESPONSE_CACHE={'ENABLED': True, 'VERSION_CACHE': 'shared'},
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'shared': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'response_versions'},
+        },
+    )
+    def test_shared_versions(self):
+        self.assertEqual(check_response_cache(None), [])
+
+
+class LocalLRUCacheTests(SimpleTestCase):
+
+    def test_eviction(self):
+        store = LocalLRUCache(max_entries=2)
+        store.set('a', b'a')
+        store.set('b', b'b')
+        store.get('a')
+        store.set('c', b'c')
+        self.assertEqual([store.get(key) for key in 'abc'], [b'a', None, b'c'])
+
+    def test_timeout(self):
+        store = LocalLRUCache(timeout=600)
+        with mock.patch('courses.cache.time.monotonic', return_value=1000.0):
+            store.set('a', b'a')
+        with mock.patch('courses.cache.time.monotonic', return_value=1599.0):
+            self.assertEqual(store.get('a'), b'a')
+        with mock.patch('courses.cache.time.monotonic', return_value=1600.0):
+            self.assertIsNone(store.get('a'))
+        self.assertEqual(len(store._entries), 0)
@@ -0,0 +1,50 @@
+import shutil
+import tempfile
+
+from django.test.utils import override_settings
+from rest_framework.test import APITestCase
+
+from accounts.models import User
+from courses.models import Course
+
+
+class UploadChunkTests(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        teacher = User.objects.create_user('teacher', password='password', user_type='teacher')
+        self.client.force_authenticate(teacher)
+        course = Course.objects.create(title='Course')
+        response = self.client.post(
+            '/api/materials/uploads/', {'filename': 'lesson.mp3', 'size': 10, 'course': course.pk}, format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.url = f'/api/materials/uploads/{response.data["id"]}/'
+
+    def put(self, body, offset):
+        return self.client.generic(
+            'PUT', self.url, body, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_chunk_at_committed_offset(self):
+        response = self.put(b'12345', 0)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Upload-Offset'], '5')
+
+    def test_offset_past_the_size_is_an_offset_mismatch(self):
+        self.put(b'12345', 0)
+
+        response = self.put(b'12345', 20)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '5')
+
+    def test_chunk_larger_than_the_rest_of_the_file(self):
+        response = self.put(b'0123456789ab', 0)
+
+        self.assertEqual(response.status_code, 413)
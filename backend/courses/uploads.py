@@ -0,0 +1,139 @@
+"""
+Resumable uploads for large materials (videos, installers, archives).
+
+The client opens a session announcing the file name and total size, then
+PUTs the bytes in as many requests as it needs, each one starting at the
+committed offset (``Upload-Offset`` header). After a dropped connection it
+asks for the committed offset and carries on from there. Finalizing the
+session turns it into a Material.
+
+The storage name is reserved when the session is opened and every chunk is
+written in place, straight from the request stream. Nothing is buffered in
+memory or in temporary files, and finalizing does not copy the file. The
+offset is committed only after the bytes are on disk, so a chunk that was
+cut short still counts for the bytes that did arrive.
+"""
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .metrics import upload_bytes, upload_duration
+from .models import Material, UploadSession
+
+
+# Bytes read from the request stream per write
+UPLOAD_WRITE_CHUNK_SIZE = 1024 * 1024
+
+
+class OffsetMismatch(Exception):
+    """The chunk does not start at the committed offset"""
+
+    def __init__(self, offset):
+        super().__init__(offset)
+        self.offset = offset
+
+
+class IncompleteUpload(Exception):
+    """Finalize was requested before every byte was received"""
+
+
+def get_max_upload_size():
+    return getattr(settings, 'MATERIAL_UPLOAD_MAX_SIZE', None)
+
+
+def open_upload_session(user, course, filename, size, level=None, title=None, order=0):
+    """Reserves the final storage name and returns a new UploadSession"""
+    field = Material._meta.get_field('file')
+    name = field.generate_filename(None, os.path.basename(filename))
+    # Saving an empty file claims the name, so concurrent sessions never
+    # write to the same file
+    name = default_storage.save(name, ContentFile(b''))
+    return UploadSession.objects.create(
+        user=user,
+        course=course,
+        level=level,
+        title=title or os.path.basename(filename),
+        order=order,
+        file_name=name,
+        size=size,
+    )
+
+
+def write_chunk(session, offset, stream):
+    """
+    Appends the request body to the session file at ``offset``.
+
+    Reads at most the bytes still missing and returns the new committed
+    offset. Raises OffsetMismatch when ``offset`` is not the committed
+    offset, including when another request committed a chunk meanwhile.
+    """
+    if offset != session.offset:
+        raise OffsetMismatch(session.offset)
+
+    remaining = session.size - offset
+    written = 0
+    try:
+        with open(default_storage.path(session.file_name), 'r+b') as destination:
+            destination.seek(offset)
+            try:
+                while written < remaining:
+                    data = stream.read(min(UPLOAD_WRITE_CHUNK_SIZE, remaining - written))
+                    if not data:
+                        break
+                    destination.write(data)
+                    written += len(data)
+            finally:
+                # Commit whatever reached the disk, even when the client
+                # dropped the connection halfway through the chunk
+                destination.flush()
+                os.fsync(destination.fileno())
+    finally:
+        if written:
+            upload_bytes.inc(written, kind='resumable')
+            committed = UploadSession.objects.filter(pk=session.pk, offset=offset).update(
+                offset=offset + written, updated_at=timezone.now(),
+            )
+            if not committed:
+                session.refresh_from_db(fields=['offset'])
+                raise OffsetMismatch(session.offset)
+    session.offset = offset + written
+    return session.offset
+
+
+def finalize_upload(session):
+    """
+    Creates the Material for a fully received session and deletes the
+    session. Type and size are detected once, from the stored file.
+    """
+    if session.offset != session.size or default_storage.size(session.file_name) != session.size:
+        raise IncompleteUpload()
+    with transaction.atomic():
+        material = Material(
+            course=session.course,
+            level=session.level,
+            title=session.title,
+            order=session.order,
+        )
+        material.file.name = session.file_name
+        material.save()
+        session.delete()
+    upload_duration.observe((timezone.now() - session.created_at).total_seconds())
+    return material
+
+
+def discard_upload(session):
+    """Deletes a session together with the partial file"""
+    default_storage.delete(session.file_name)
+    session.delete()
+
+
+def stale_upload_sessions(max_age=None):
+    """Sessions that have not received a chunk for ``max_age``"""
+    if max_age is None:
+        max_age = timedelta(seconds=getattr(settings, 'MATERIAL_UPLOAD_SESSION_MAX_AGE', 24 * 60 * 60))
+    return UploadSession.objects.filter(updated_at__lt=timezone.now() - max_age)
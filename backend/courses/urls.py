@@ -1,14 +1,28 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CourseViewSet, LessonViewSet, MaterialViewSet, LevelViewSet
+from .views import (
+    CourseViewSet, LessonViewSet, MaterialViewSet, LevelViewSet, ProgressViewSet, instrumentation_report,
+    metrics, search_catalog, sync_catalog,
+)
+from .async_views import material_file
 
 router = DefaultRouter()
 router.register(r'courses', CourseViewSet, basename='course')
 router.register(r'lessons', LessonViewSet, basename='lesson')
 router.register(r'materials', MaterialViewSet, basename='material')
 router.register(r'levels', LevelViewSet, basename='level')
+router.register(r'progress', ProgressViewSet, basename='progress')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('materials/<int:pk>/file/', MaterialViewSet.as_view({'get': 'file'}), name='material-file'),
+    path('search/', search_catalog, name='search'),
+    path('sync/', sync_catalog, name='sync'),
+    path('instrumentation/', instrumentation_report, name='instrumentation'),
+    path('metrics/', metrics, name='metrics'),
 ]
+
+if getattr(settings, 'MATERIALS_ASYNC_FILE_VIEW', False):
+    # Has to come before the router, which also routes the file action
+    urlpatterns.insert(0, path('materials/<int:pk>/file/', material_file, name='material-file'))
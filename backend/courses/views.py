@@ -1,20 +1,163 @@
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated, IsAdminUser
-from rest_framework.parsers import MultiPartParser, FormParser
-from django.http import FileResponse, Http404
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.http import FileResponse, Http404, HttpResponse
 from django.conf import settings
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 import os
-from .models import Course, Lesson, Material, Level
-from .serializers import CourseSerializer, CourseListSerializer, LessonSerializer, MaterialSerializer, LevelSerializer
+from .models import Course, CourseProgress, Lesson, Material, MaterialProgress, Level, UploadSession
+from .serializers import (
+    CourseSerializer, CourseListSerializer, CourseProgressSerializer, LessonSerializer, LevelChangeSerializer,
+    MaterialChangeSerializer, MaterialSerializer, LevelSerializer, MaterialProgressSerializer, ProgressEventSerializer,
+)
+from .file_serving import get_content_type, serve_file, set_material_headers
+from .scanner import MaterialScanner
+from .hashing import schedule_hashing
+from .media_metadata import METADATA_FIELDS, schedule_metadata_extraction
+from .previews import material_preview_kind, preview_response
+from .uploads import (
+    IncompleteUpload, OffsetMismatch, discard_upload, finalize_upload, get_max_upload_size,
+    open_upload_session, write_chunk,
+)
+from .cache import CATALOG_SCOPE, CachedResponseMixin, course_scope, level_scope
+from .conditional import ConditionalGetMixin, check_preconditions, file_etag, set_validator_headers
+from .pagination import CoursePagination, LevelPagination, MaterialPagination
+from .sparse_fields import ALL_FIELDS, SparseFieldsViewMixin
+from .bulk_edit import MAX_BULK_CHANGES, BulkChangeError, apply_level_changes, apply_material_changes
+from .instrumentation import InstrumentedViewMixin, get_route_stats
+from .metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, CanReadMetrics, ScrapeTokenAuthentication, registry as metrics_registry,
+    track_file_stream, upload_bytes,
+)
+from .progress import course_materials, get_progress_buffer, get_progress_settings, record_events
+from .search import KINDS as SEARCH_KINDS, search
+from .sync import ExpiredCursor, InvalidCursor, get_sync_settings, sync_page
+from .zip_export import course_archive, level_archive, safe_name, zip_response
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+# Maximum number of paths listed per category in the scan_materials response
+SCAN_REPORT_LIMIT = 1000
+
+# Search hits per response (?limit=)
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+
+def bulk_change_response(request, serializer_class, apply_changes):
+    """
+    Shared body of the ``bulk`` actions: validates a list (or
+    ``{"changes": [...]}``) of changes and applies them in one transaction.
+    """
+    if request.user.user_type not in ['teacher', 'admin']:
+        from rest_framework.exceptions import PermissionDenied
+        raise PermissionDenied("Apenas professores e administradores podem reorganizar o conteúdo.")
+    changes = request.data.get('changes') if isinstance(request.data, dict) else request.data
+    if not isinstance(changes, list) or not changes:
+        return Response(
+            {'error': 'Envie uma lista de alterações.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(changes) > MAX_BULK_CHANGES:
+        return Response(
+            {'error': f'No máximo {MAX_BULK_CHANGES} alterações por requisição.'},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+    serializer = serializer_class(data=changes, many=True)
+    serializer.is_valid(raise_exception=True)
+    try:
+        rows = apply_changes(serializer.validated_data)
+    except BulkChangeError as e:
+        return Response(
+            {'error': 'Nenhuma alteração foi aplicada.', 'details': e.errors},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    attnames = {name: rows[0]._meta.get_field(name).attname for name in serializer_class().fields}
+    return Response({
+        'updated': len(rows),
+        'results': [{name: getattr(row, attname) for name, attname in attnames.items()} for row in rows],
+    })
+
+
+def related_count(model, field):
+    """
+    Correlated COUNT(*) of ``model`` rows pointing at the outer row through
+    ``field``, for annotating list querysets in a single SQL query. Unlike
+    Count() over joins it does not multiply rows when several are counted.
+    """
+    counts = (
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def material_queryset(fieldset=ALL_FIELDS):
+    """Materials with the relations MaterialSerializer reads (course/level titles)"""
+    queryset = Material.objects.all()
+    related = [name for name in ('course', 'level') if fieldset.wants(f'{name}_title')]
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset
+
+
+def level_queryset(fieldset=ALL_FIELDS):
+    """Levels with their course, materials and materials_count loaded for LevelSerializer"""
+    queryset = Level.objects.all()
+    if fieldset.wants('course_title'):
+        queryset = queryset.select_related('course')
+    if fieldset.wants('materials_count'):
+        queryset = queryset.annotate(materials_count=related_count(Material, 'level'))
+    if fieldset.wants('materials'):
+        queryset = queryset.prefetch_related(
+            Prefetch('materials', queryset=material_queryset(fieldset.child('materials'))),
+        )
+    return queryset
+
+
+def lesson_queryset(fieldset=ALL_FIELDS):
+    """Lessons with the materials LessonSerializer embeds"""
+    queryset = Lesson.objects.all()
+    if fieldset.wants('materials'):
+        queryset = queryset.prefetch_related(
+            Prefetch('materials', queryset=material_queryset(fieldset.child('materials'))),
+        )
+    return queryset
+
+
+COURSE_TREE = ('lessons', 'materials', 'levels')
+
+
+def course_tree_prefetches(fieldset=ALL_FIELDS, relations=COURSE_TREE):
+    """
+    Prefetches for the ``relations`` of the CourseSerializer tree: lessons ->
+    materials, materials and levels -> materials, one query each.
+    """
+    querysets = {
+        'lessons': lesson_queryset,
+        'materials': material_queryset,
+        'levels': level_queryset,
+    }
+    return [
+        Prefetch(name, queryset=querysets[name](fieldset.child(name)))
+        for name in COURSE_TREE if name in relations
+    ]
+
+
+class CourseViewSet(InstrumentedViewMixin, SparseFieldsViewMixin, ConditionalGetMixin, CachedResponseMixin,
+                    viewsets.ModelViewSet):
     queryset = Course.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = CoursePagination
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -22,8 +165,48 @@ class CourseViewSet(viewsets.ModelViewSet):
         return CourseSerializer
     
     def get_queryset(self):
+        fieldset = self.get_fieldset()
         queryset = Course.objects.all()
-        return queryset
+        if self.action == 'list':
+            counts = {
+                'materials_count': related_count(Material, 'course'),
+                'levels_count': related_count(Level, 'course'),
+            }
+            queryset = queryset.annotate(**{name: count for name, count in counts.items() if fieldset.wants(name)})
+            # The tree is only embedded in list items with ?expand=
+            expanded = [name for name in COURSE_TREE if fieldset.expands(name)]
+            if expanded:
+                queryset = queryset.prefetch_related(*course_tree_prefetches(fieldset, expanded))
+        elif self.action not in ('thumbnail', 'export'):
+            selected = [name for name in COURSE_TREE if fieldset.wants(name)]
+            queryset = queryset.prefetch_related(*course_tree_prefetches(fieldset, selected))
+        return self.select_columns(queryset)
+    
+    def get_validator_querysets(self):
+        if self.action == 'retrieve':
+            pk = self.kwargs['pk']
+            return [
+                (Course.objects.filter(pk=pk), {}),
+                (Level.objects.filter(course=pk), {}),
+                (Lesson.objects.filter(course=pk), {}),
+                # Subqueries rather than joins, so each branch of the OR uses its index
+                (Material.objects.filter(
+                    Q(course=pk)
+                    | Q(level__in=Level.objects.filter(course=pk).values('pk'))
+                    | Q(lesson__in=Lesson.objects.filter(course=pk).values('pk'))
+                ), {}),
+            ]
+        # The list only shows per-course counts of levels and materials
+        return [
+            (self.filter_queryset(self.get_queryset()), {}),
+            (Level.objects.all(), {}),
+            (Material.objects.filter(course__isnull=False), {}),
+        ]
+    
+    def get_cache_scopes(self):
+        if self.action == 'retrieve':
+            return [course_scope(self.kwargs['pk'])]
+        return [CATALOG_SCOPE]
     
     def get_permissions(self):
         """
@@ -34,41 +217,97 @@ class CourseViewSet(viewsets.ModelViewSet):
         else:
             permission_classes = [IsAuthenticatedOrReadOnly]
         return [permission() for permission in permission_classes]
+    
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """ZIP of every material file of the course, streamed (Range / If-Range resume it)"""
+        course = self.get_object()
+        return zip_response(request, course_archive(course), f'{safe_name(course.title, "curso")}.zip')
+    
+    @action(detail=True, methods=['get'])
+    def thumbnail(self, request, pk=None):
+        """Serve a resized course thumbnail (?width=, ?output=webp|jpeg)"""
+        course = self.get_object()
+        response = None
+        if course.thumbnail:
+            response = preview_response(request, course.thumbnail.path, 'image')
+        if response is None:
+            return Response(
+                {'error': 'Pré-visualização indisponível.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return response
 
 
-class LessonViewSet(viewsets.ReadOnlyModelViewSet):
+class LessonViewSet(InstrumentedViewMixin, SparseFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Lesson.objects.all()
     serializer_class = LessonSerializer
+    
+    def get_queryset(self):
+        return self.select_columns(lesson_queryset(self.get_fieldset()))
 
 
-class LevelViewSet(viewsets.ModelViewSet):
+class LevelViewSet(InstrumentedViewMixin, SparseFieldsViewMixin, ConditionalGetMixin, CachedResponseMixin,
+                   viewsets.ModelViewSet):
     queryset = Level.objects.all()
     serializer_class = LevelSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = LevelPagination
     
     def get_queryset(self):
-        queryset = Level.objects.all()
+        if self.action == 'export':
+            return Level.objects.select_related('course')
+        queryset = self.select_columns(level_queryset(self.get_fieldset()))
         course = self.request.query_params.get('course', None)
         if course:
             queryset = queryset.filter(course=course)
         return queryset
     
+    def get_validator_querysets(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.action == 'retrieve':
+            queryset = queryset.filter(pk=self.kwargs['pk'])
+        return [
+            (queryset, {'course_updated_at': 'course__updated_at'}),
+            (Material.objects.filter(level__in=queryset), {'course_updated_at': 'course__updated_at'}),
+        ]
+    
+    def get_cache_scopes(self):
+        if self.action != 'list':
+            return None
+        course = self.request.query_params.get('course')
+        return [course_scope(course)] if course else [CATALOG_SCOPE]
+    
     def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'bulk']:
             permission_classes = [IsAuthenticated]  # Only teachers/admins can manage levels
         else:
             permission_classes = [IsAuthenticatedOrReadOnly]
         return [permission() for permission in permission_classes]
+    
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """ZIP of every material file of the level, streamed (Range / If-Range resume it)"""
+        level = self.get_object()
+        filename = f'{safe_name(level.course.title, "curso")} - {safe_name(level.title, "nivel")}.zip'
+        return zip_response(request, level_archive(level), filename)
+    
+    @action(detail=False, methods=['patch'])
+    def bulk(self, request):
+        """Reorder levels or move them to other courses: ``[{id, order, level_number, course}, ...]``"""
+        return bulk_change_response(request, LevelChangeSerializer, apply_level_changes)
 
 
-class MaterialViewSet(viewsets.ModelViewSet):
+class MaterialViewSet(InstrumentedViewMixin, SparseFieldsViewMixin, ConditionalGetMixin, CachedResponseMixin,
+                      viewsets.ModelViewSet):
     queryset = Material.objects.all()
     serializer_class = MaterialSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = MaterialPagination
     parser_classes = [MultiPartParser, FormParser]
     
     def get_queryset(self):
-        queryset = Material.objects.all()
+        queryset = self.select_columns(material_queryset(self.get_fieldset()))
         course = self.request.query_params.get('course', None)
         level = self.request.query_params.get('level', None)
         if course:
@@ -77,11 +316,32 @@ class MaterialViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(level=level)
         return queryset
     
+    def get_validator_querysets(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.action == 'retrieve':
+            queryset = queryset.filter(pk=self.kwargs['pk'])
+        return [
+            (queryset, {'course_updated_at': 'course__updated_at', 'level_updated_at': 'level__updated_at'}),
+        ]
+    
+    def get_cache_scopes(self):
+        if self.action != 'list':
+            return None
+        course = self.request.query_params.get('course')
+        level = self.request.query_params.get('level')
+        scopes = []
+        if course:
+            scopes.append(course_scope(course))
+        if level:
+            scopes.append(level_scope(level))
+        return scopes or [CATALOG_SCOPE]
+    
     def get_permissions(self):
         """
         Instantiates and returns the list of permissions that this view requires.
         """
-        if self.action in ['create', 'update', 'partial_update', 'destroy', 'scan_materials', 'upload']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'scan_materials', 'upload',
+                           'start_upload', 'upload_session', 'finish_upload', 'bulk']:
             permission_classes = [IsAuthenticated]  # Only authenticated users can manage materials
         elif self.action == 'file':
             permission_classes = [IsAuthenticatedOrReadOnly]
@@ -95,7 +355,30 @@ class MaterialViewSet(viewsets.ModelViewSet):
         if user.user_type not in ['teacher', 'admin']:
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied("Apenas professores e administradores podem criar materiais.")
-        serializer.save()
+        material = serializer.save()
+        if material.file:
+            schedule_hashing([material.pk])
+            schedule_metadata_extraction([material.pk])
+    
+    def perform_update(self, serializer):
+        if 'file' not in serializer.validated_data:
+            serializer.save()
+            return
+        # A new file: the hash, the metadata and a collapsed duplicate belonged to the old content
+        material = serializer.save(
+            content_hash=None,
+            metadata_extracted_at=None,
+            duplicate_of=None,
+            **{field: None for field in METADATA_FIELDS},
+        )
+        if material.file:
+            schedule_hashing([material.pk])
+            schedule_metadata_extraction([material.pk])
+    
+    @action(detail=False, methods=['patch'], parser_classes=[JSONParser])
+    def bulk(self, request):
+        """Reorder materials or move them between levels and lessons: ``[{id, order, level, lesson}, ...]``"""
+        return bulk_change_response(request, MaterialChangeSerializer, apply_material_changes)
     
     @action(detail=True, methods=['get'])
     def file(self, request, pk=None):
@@ -116,75 +399,24 @@ class MaterialViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Determine content type based on file extension
-            content_type_map = {
-                '.pdf': 'application/pdf',
-                '.mp3': 'audio/mpeg',
-                '.wav': 'audio/wav',
-                '.mp4': 'video/mp4',
-                '.avi': 'video/x-msvideo',
-                '.mov': 'video/quicktime',
-                '.jpg': 'image/jpeg',
-                '.jpeg': 'image/jpeg',
-                '.png': 'image/png',
-                '.gif': 'image/gif',
-                '.exe': 'application/x-msdownload',
-                '.zip': 'application/zip',
-                '.doc': 'application/msword',
-                '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                '.xls': 'application/vnd.ms-excel',
-                '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                '.ppt': 'application/vnd.ms-powerpoint',
-                '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-            }
+            # Answer If-None-Match / If-Modified-Since before opening the file
+            stat = os.stat(file_path)
+            etag = file_etag(stat)
+            not_modified = check_preconditions(request, etag, stat.st_mtime)
+            if not_modified is not None:
+                return not_modified
             
-            ext = os.path.splitext(file_path)[1].lower()
-            content_type = content_type_map.get(ext, 'application/octet-stream')
+            content_type = get_content_type(file_path)
             
             try:
-                # Open file in binary mode and create response
-                # FileResponse will handle closing the file
-                file_handle = open(file_path, 'rb')
-                response = FileResponse(file_handle, content_type=content_type, as_attachment=False)
-                filename = os.path.basename(file_path)
-                
-                # Always use inline to prevent download - files should be viewed in platform
-                # Check user type - only students should have download disabled
-                user = request.user
-                is_student = hasattr(user, 'user_type') and user.user_type == 'student'
-                
-                if is_student:
-                    # For students: force inline viewing for most files, but allow .exe to be executable
-                    if ext == '.exe':
-                        # For .exe files, use inline so they can be executed in the platform
-                        response['Content-Disposition'] = f'inline; filename="{filename}"'
-                    else:
-                        # For other files: force inline viewing, prevent download
-                        response['Content-Disposition'] = f'inline; filename="{filename}"'
-                        # Prevent download via right-click and other methods
-                        response['X-Content-Type-Options'] = 'nosniff'
-                        response['Content-Security-Policy'] = "default-src 'self'"
-                else:
-                    # For teachers/admins: allow normal access
-                    if ext in ['.zip']:
-                        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-                    else:
-                        response['Content-Disposition'] = f'inline; filename="{filename}"'
+                # Full file, single range or multipart/byteranges depending on
+                # the Range / If-Range headers sent by the player or PDF viewer,
+                # transferred by the worker or offloaded to the server/proxy
+                response = serve_file(request, file_path, content_type, etag=etag, stat=stat)
+                set_validator_headers(response, etag, stat.st_mtime)
+                set_material_headers(response, request.user, file_path)
                 
-                # Add headers for viewing in iframe/embed
-                response['Access-Control-Allow-Origin'] = '*'
-                response['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
-                response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
-                
-                # Additional headers for specific file types
-                if ext == '.pdf':
-                    response['Content-Type'] = 'application/pdf'
-                    response['Accept-Ranges'] = 'bytes'
-                elif ext in ['.mp3', '.wav']:
-                    response['Accept-Ranges'] = 'bytes'
-                    response['Content-Type'] = content_type
-                
-                return response
+                return track_file_stream(request, response, material.material_type)
             except IOError as e:
                 return Response(
                     {'error': f'Error opening file: {str(e)}'},
@@ -204,6 +436,23 @@ class MaterialViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @action(detail=True, methods=['get'])
+    def preview(self, request, pk=None):
+        """Serve a resized image or first-page preview (?width=, ?output=webp|jpeg)"""
+        material = self.get_object()
+        kind = material_preview_kind(material)
+        file_path = material.get_full_path() if kind else None
+        response = None
+        if file_path:
+            content_hash = material.duplicate_of.content_hash if material.duplicate_of_id else material.content_hash
+            response = preview_response(request, file_path, kind, content_hash)
+        if response is None:
+            return Response(
+                {'error': 'Pré-visualização indisponível.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return response
+    
     @action(detail=False, methods=['post'])
     def upload(self, request):
         """Upload a new material file"""
@@ -259,6 +508,9 @@ class MaterialViewSet(viewsets.ModelViewSet):
                 file=uploaded_file,
                 order=order
             )
+            upload_bytes.inc(uploaded_file.size, kind='form')
+            schedule_hashing([material.pk])
+            schedule_metadata_extraction([material.pk])
             
             serializer = MaterialSerializer(material, context={'request': request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -269,6 +521,142 @@ class MaterialViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    def _upload_session_response(self, session, status_code=status.HTTP_200_OK):
+        response = Response({
+            'id': str(session.pk),
+            'file_name': session.file_name,
+            'size': session.size,
+            'offset': session.offset,
+        }, status=status_code)
+        response['Upload-Offset'] = str(session.offset)
+        response['Cache-Control'] = 'no-store'
+        return response
+    
+    def _get_upload_session(self, request, upload_id):
+        return UploadSession.objects.select_related('course', 'level').get(pk=upload_id, user=request.user)
+    
+    @action(detail=False, methods=['post'], url_path='uploads', parser_classes=[JSONParser, MultiPartParser, FormParser])
+    def start_upload(self, request):
+        """Open a resumable upload session"""
+        if request.user.user_type not in ['teacher', 'admin']:
+            return Response(
+                {'error': 'Apenas professores e administradores podem fazer upload de materiais.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        filename = request.data.get('filename')
+        course_id = request.data.get('course')
+        level_id = request.data.get('level')
+        if not filename:
+            return Response(
+                {'error': 'Nome do arquivo é obrigatório.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not course_id:
+            return Response(
+                {'error': 'ID do curso é obrigatório.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            size = int(request.data.get('size'))
+            order = int(request.data.get('order', 0))
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'Tamanho do arquivo inválido.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        max_size = get_max_upload_size()
+        if size <= 0 or (max_size and size > max_size):
+            return Response(
+                {'error': 'Tamanho do arquivo inválido.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            course = Course.objects.get(pk=course_id)
+        except Course.DoesNotExist:
+            return Response(
+                {'error': 'Curso não encontrado.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        level = None
+        if level_id:
+            try:
+                level = Level.objects.get(pk=level_id, course=course)
+            except Level.DoesNotExist:
+                return Response(
+                    {'error': 'Nível não encontrado.'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+        
+        session = open_upload_session(
+            request.user, course, filename, size,
+            level=level, title=request.data.get('title'), order=order,
+        )
+        return self._upload_session_response(session, status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['get', 'put', 'delete'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]{36})')
+    def upload_session(self, request, upload_id=None):
+        """Report the committed offset (GET/HEAD), receive a chunk (PUT) or cancel (DELETE)"""
+        try:
+            session = self._get_upload_session(request, upload_id)
+        except UploadSession.DoesNotExist:
+            return Response(
+                {'error': 'Sessão de upload não encontrada.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        if request.method == 'DELETE':
+            discard_upload(session)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if request.method != 'PUT':
+            return self._upload_session_response(session)
+        
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return Response(
+                {'error': 'Cabeçalho Upload-Offset obrigatório.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if offset != session.offset:
+            # Checked before the size: any offset but the committed one is a 409 carrying it
+            return self._upload_session_response(session, status.HTTP_409_CONFLICT)
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if content_length > session.size - offset:
+            return Response(
+                {'error': 'O bloco ultrapassa o tamanho declarado do arquivo.'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        try:
+            # Read the raw body; request.data is never touched so nothing is
+            # parsed or spooled to a temporary file
+            write_chunk(session, offset, request._request)
+        except OffsetMismatch:
+            session.refresh_from_db(fields=['offset'])
+            return self._upload_session_response(session, status.HTTP_409_CONFLICT)
+        return self._upload_session_response(session)
+    
+    @action(detail=False, methods=['post'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]{36})/finalize')
+    def finish_upload(self, request, upload_id=None):
+        """Turn a fully received upload session into a material"""
+        try:
+            session = self._get_upload_session(request, upload_id)
+        except UploadSession.DoesNotExist:
+            return Response(
+                {'error': 'Sessão de upload não encontrada.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        try:
+            material = finalize_upload(session)
+        except IncompleteUpload:
+            return self._upload_session_response(session, status.HTTP_409_CONFLICT)
+        schedule_hashing([material.pk])
+        schedule_metadata_extraction([material.pk])
+        
+        serializer = MaterialSerializer(material, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
     @action(detail=False, methods=['get'])
     def scan_materials(self, request):
         """Scan the materials directory and create Material objects"""
@@ -278,35 +666,177 @@ class MaterialViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Materials directory not found'}, 
                           status=status.HTTP_404_NOT_FOUND)
         
-        created_count = 0
+        dry_run = request.query_params.get('dry_run') in ('1', 'true')
+        full = request.query_params.get('full') in ('1', 'true')
+        report = MaterialScanner(materials_root, dry_run=dry_run, full=full).run()
+        if not dry_run:
+            schedule_hashing()
+            schedule_metadata_extraction()
         
-        # Walk through the directory structure
-        for root, dirs, files in os.walk(materials_root):
-            for file in files:
-                if file.lower().endswith(('.pdf', '.mp3', '.mp4', '.jpg', '.jpeg', '.png')):
-                    file_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(file_path, materials_root)
-                    
-                    # Determine material type
-                    ext = os.path.splitext(file)[1].lower()
-                    material_type_map = {
-                        '.pdf': 'pdf',
-                        '.mp3': 'mp3',
-                        '.mp4': 'video',
-                        '.jpg': 'image',
-                        '.jpeg': 'image',
-                        '.png': 'image',
-                    }
-                    material_type = material_type_map.get(ext, 'other')
-                    
-                    # Check if material already exists
-                    if not Material.objects.filter(file_path=relative_path).exists():
-                        Material.objects.create(
-                            title=file,
-                            file_path=relative_path,
-                            material_type=material_type,
-                            file_size=os.path.getsize(file_path) if os.path.exists(file_path) else None
-                        )
-                        created_count += 1
+        created_count = len(report.created)
+        message = f'Scan completed. Created {created_count} new materials.'
+        if dry_run:
+            message = f'Dry run completed. Would create {created_count} new materials.'
+        return Response({'message': message, **report.as_dict(limit=SCAN_REPORT_LIMIT)})
+
+
+class ProgressViewSet(InstrumentedViewMixin, viewsets.GenericViewSet):
+    """
+    Learning progress of the current user: ``list`` returns the per-material
+    rows (?course=, ?material=), ``courses`` the per-course summaries and
+    ``events`` ingests batches of progress events.
+    """
+    serializer_class = MaterialProgressSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        queryset = MaterialProgress.objects.filter(user=self.request.user.pk)
+        course = self.request.query_params.get('course')
+        material = self.request.query_params.get('material')
+        if course:
+            queryset = queryset.filter(material__in=course_materials(course).values('pk'))
+        if material:
+            queryset = queryset.filter(material=material)
+        return queryset
+    
+    def list(self, request):
+        # Read your own writes: events still buffered in this process first
+        get_progress_buffer().flush(user_id=request.user.pk)
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def courses(self, request):
+        """Per-course completion summaries"""
+        get_progress_buffer().flush(user_id=request.user.pk)
+        queryset = CourseProgress.objects.filter(user=request.user.pk)
+        course = request.query_params.get('course')
+        if course:
+            queryset = queryset.filter(course=course)
+        page = self.paginate_queryset(queryset)
+        serializer = CourseProgressSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+    
+    @action(detail=False, methods=['post'])
+    def events(self, request):
+        """
+        Accept a batch of progress events: a list, or ``{"events": [...]}``,
+        of ``{material, position, percent, completed, occurred_at}``.
+        """
+        events = request.data.get('events') if isinstance(request.data, dict) else request.data
+        if not isinstance(events, list):
+            return Response(
+                {'error': 'Envie uma lista de eventos.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        max_events = get_progress_settings()['MAX_EVENTS_PER_REQUEST']
+        if len(events) > max_events:
+            return Response(
+                {'error': f'No máximo {max_events} eventos por requisição.'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        serializer = ProgressEventSerializer(data=events, many=True)
+        serializer.is_valid(raise_exception=True)
         
-        return Response({'message': f'Scan completed. Created {created_count} new materials.'})
+        material_ids = {event['material'] for event in serializer.validated_data}
+        known = set(Material.objects.filter(pk__in=material_ids).values_list('pk', flat=True))
+        accepted = [event for event in serializer.validated_data if event['material'] in known]
+        record_events(request.user.pk, accepted)
+        return Response(
+            {'accepted': len(accepted), 'rejected': sorted(material_ids - known)},
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticatedOrReadOnly])
+def search_catalog(request):
+    """
+    Ranked search over courses, levels, lessons and materials:
+    ``?q=`` plus optional ``?kind=material,level``, ``?course=``,
+    ``?limit=`` and ``?offset=``. Hits carry the title, a description
+    excerpt and the file path with the matches inside <mark> elements.
+    """
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({'error': 'Informe o termo de busca (?q=).'}, status=status.HTTP_400_BAD_REQUEST)
+    kinds = [kind for kind in request.query_params.get('kind', '').split(',') if kind]
+    if any(kind not in SEARCH_KINDS for kind in kinds):
+        return Response(
+            {'error': f'Tipos válidos: {", ".join(SEARCH_KINDS)}.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        course = int(request.query_params['course']) if request.query_params.get('course') else None
+        limit = min(int(request.query_params.get('limit', SEARCH_DEFAULT_LIMIT)), SEARCH_MAX_LIMIT)
+        offset = int(request.query_params.get('offset', 0))
+    except ValueError:
+        return Response({'error': 'course, limit e offset devem ser números.'}, status=status.HTTP_400_BAD_REQUEST)
+    if limit < 1 or offset < 0:
+        return Response({'error': 'limit ou offset inválido.'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # One extra hit tells whether there is a next page
+    mode, hits = search(query, kinds=kinds, course=course, limit=limit + 1, offset=offset)
+    next_url = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        next_url = replace_query_param(request.build_absolute_uri(), 'offset', offset + limit)
+    return Response({
+        'query': query,
+        'mode': mode,
+        'next': next_url,
+        'results': hits,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticatedOrReadOnly])
+def sync_catalog(request):
+    """
+    Courses, levels, lessons and materials created, updated or deleted
+    since ``?since=`` (the ``next`` cursor of the previous response), or the
+    whole catalog without it. Follow ``next`` while ``more`` is true.
+    """
+    config = get_sync_settings()
+    try:
+        page_size = int(request.query_params.get('page_size', config['PAGE_SIZE']))
+    except ValueError:
+        page_size = 0
+    if not 1 <= page_size <= config['MAX_PAGE_SIZE']:
+        return Response(
+            {'error': f'page_size deve estar entre 1 e {config["MAX_PAGE_SIZE"]}.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        page = sync_page(request.query_params.get('since'), page_size)
+    except InvalidCursor:
+        return Response({'error': 'Cursor inválido.'}, status=status.HTTP_400_BAD_REQUEST)
+    except ExpiredCursor:
+        return Response(
+            {'error': 'Cursor expirado; sincronize novamente sem ?since=.'},
+            status=status.HTTP_410_GONE
+        )
+    return Response(page)
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def instrumentation_report(request):
+    """
+    p50/p95/p99 per route of the requests sampled by this worker process
+    (see courses/instrumentation.py); DELETE starts a new window.
+    """
+    stats = get_route_stats()
+    if request.method == 'DELETE':
+        stats.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response({'routes': stats.summary()})
+
+
+@api_view(['GET'])
+@authentication_classes([ScrapeTokenAuthentication, *api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+@permission_classes([CanReadMetrics])
+def metrics(request):
+    """Every metric of every worker process, in the Prometheus text format (see courses/metrics.py)"""
+    return HttpResponse(metrics_registry.exposition(), content_type=METRICS_CONTENT_TYPE)
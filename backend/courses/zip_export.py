@@ -0,0 +1,424 @@
+"""
+ZIP archives of a course or level, streamed for offline use.
+
+The archive is written on the fly from the material files, one chunk at a
+time: nothing is buffered in memory or in temporary files. Every member is
+STORED (not compressed). Materials are PDFs, audio, video, images and Office
+files, which are compressed already, and stored members keep the archive
+length a function of the file sizes alone. The whole layout (offsets of
+every header and member) is therefore known before the first byte is sent,
+so the response carries a Content-Length and single ranges are served by
+seeking, which lets an interrupted download resume.
+
+CRC-32s are not known up front, so members use data descriptors (general
+purpose flag bit 3): the CRC is computed while a member is streamed and
+written after its data. A range that skips some file data reads that file to
+compute the CRC the descriptor and central directory need; results are
+cached per (path, size, mtime). ZIP64 records are added when sizes or
+offsets pass 4 GiB or there are more than 65535 members.
+
+``manifest.json``, the first member, lists every file with its material id,
+size and SHA-256 (when the hashing job has computed it), plus the materials
+whose file is missing. The strong ETag covers the manifest and the mtime of
+every file, so If-Range only resumes an unchanged archive.
+"""
+import hashlib
+import json
+import os
+import re
+import struct
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from threading import Lock
+from urllib.parse import quote
+
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
+
+from .conditional import check_preconditions
+from .file_serving import requested_ranges
+from .models import Material
+from .progress import course_materials
+
+
+# Bytes read from a material file per chunk
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+# CRC-32s kept per process, keyed by (path, size, mtime_ns)
+CRC_CACHE_MAX_ENTRIES = 4096
+
+MANIFEST_NAME = 'manifest.json'
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_MAX_MEMBERS = 0xFFFF
+
+# General purpose flags: data descriptor, UTF-8 names
+ZIP_FLAGS = 0x08 | 0x800
+
+# Made by: UNIX host (permissions in the external attributes), spec 4.5
+VERSION_MADE_BY = (3 << 8) | 45
+VERSION_NEEDED = 20
+VERSION_NEEDED_ZIP64 = 45
+EXTERNAL_ATTRIBUTES = 0o100644 << 16
+
+UNSAFE_NAME_CHARACTERS = re.compile(r'[\\/:*?"<>|\x00-\x1f]+')
+
+
+class CrcCache:
+    """Least recently used CRC-32s of files on disk"""
+
+    def __init__(self, max_entries=CRC_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            crc = self._entries.get(key)
+            if crc is not None:
+                self._entries.move_to_end(key)
+            return crc
+
+    def set(self, key, crc):
+        with self._lock:
+            self._entries[key] = crc
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_crc_cache = CrcCache()
+
+
+def dos_datetime(timestamp):
+    """``(time, date)`` in MS-DOS format; ZIP cannot store dates before 1980"""
+    t = time.localtime(max(timestamp, 315532800))
+    year = max(t.tm_year, 1980)
+    return (
+        (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+        ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday,
+    )
+
+
+def safe_name(text, fallback='material'):
+    """A single path component made of ``text``"""
+    name = UNSAFE_NAME_CHARACTERS.sub('-', text or '').strip(' .-')
+    return name[:150] or fallback
+
+
+class ArchiveMember:
+    """One file of the archive: a file on disk, or bytes (the manifest)"""
+
+    def __init__(self, name, path=None, data=None, mtime=None, material=None):
+        self.name = name
+        self.encoded_name = name.encode('utf-8')
+        self.path = path
+        self.data = data
+        self.material = material
+        if data is not None:
+            self.size = len(data)
+            self.mtime = mtime or 0
+            self.mtime_ns = 0
+            self.crc = zlib.crc32(data)
+        else:
+            stat = os.stat(path)
+            self.size = stat.st_size
+            self.mtime = stat.st_mtime
+            self.crc = _crc_cache.get(self.crc_key(stat.st_mtime_ns))
+            self.mtime_ns = stat.st_mtime_ns
+        self.zip64 = self.size >= ZIP64_LIMIT
+        self.offset = None
+
+    def crc_key(self, mtime_ns):
+        return (self.path, self.size, mtime_ns)
+
+    def local_header(self):
+        dos_time, dos_date = dos_datetime(self.mtime)
+        extra = b''
+        size_field = 0
+        if self.zip64:
+            # Sizes are in the data descriptor; the extra field flags ZIP64
+            extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0)
+            size_field = ZIP64_LIMIT
+        return struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50,
+            VERSION_NEEDED_ZIP64 if self.zip64 else VERSION_NEEDED, ZIP_FLAGS, 0, dos_time, dos_date,
+            0, size_field, size_field, len(self.encoded_name), len(extra),
+        ) + self.encoded_name + extra
+
+    def descriptor_length(self):
+        return 24 if self.zip64 else 16
+
+    def descriptor(self):
+        if self.zip64:
+            return struct.pack('<IIQQ', 0x08074b50, self.crc, self.size, self.size)
+        return struct.pack('<IIII', 0x08074b50, self.crc, self.size, self.size)
+
+    def _central_extra_count(self):
+        return 2 * self.zip64 + (self.offset >= ZIP64_LIMIT)
+
+    def central_header_length(self):
+        count = self._central_extra_count()
+        return 46 + len(self.encoded_name) + (4 + 8 * count if count else 0)
+
+    def central_header(self):
+        dos_time, dos_date = dos_datetime(self.mtime)
+        values = []
+        size_field = self.size
+        offset_field = self.offset
+        if self.zip64:
+            values += [self.size, self.size]
+            size_field = ZIP64_LIMIT
+        if self.offset >= ZIP64_LIMIT:
+            values.append(self.offset)
+            offset_field = ZIP64_LIMIT
+        extra = struct.pack(f'<HH{len(values)}Q', 0x0001, 8 * len(values), *values) if values else b''
+        return struct.pack(
+            '<IHHHHHHIIIHHHHHII', 0x02014b50, VERSION_MADE_BY,
+            VERSION_NEEDED_ZIP64 if extra else VERSION_NEEDED, ZIP_FLAGS, 0, dos_time, dos_date,
+            self.crc, size_field, size_field, len(self.encoded_name), len(extra), 0, 0, 0,
+            EXTERNAL_ATTRIBUTES, offset_field,
+        ) + self.encoded_name + extra
+
+    def compute_crc(self):
+        """Reads the file for its CRC-32 (when a range skipped its data)"""
+        if self.crc is None:
+            crc = 0
+            for chunk in self.read(0, self.size):
+                crc = zlib.crc32(chunk, crc)
+            self.set_crc(crc)
+        return self.crc
+
+    def set_crc(self, crc):
+        self.crc = crc
+        if self.path is not None:
+            _crc_cache.set(self.crc_key(self.mtime_ns), crc)
+
+    def read(self, start, end):
+        """Yields the bytes ``[start, end)`` of the member data"""
+        if self.data is not None:
+            yield self.data[start:end]
+            return
+        with open(self.path, 'rb') as file_handle:
+            file_handle.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = file_handle.read(min(ZIP_CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise IOError(f'{self.path} is shorter than when the archive was planned')
+                remaining -= len(chunk)
+                yield chunk
+
+
+class ZipArchive:
+    """Layout of a STORED archive and a generator of any byte range of it"""
+
+    def __init__(self, members):
+        self.members = members
+        # Segments: (offset, length, kind, member)
+        self.segments = []
+        offset = 0
+        for member in members:
+            member.offset = offset
+            header = member.local_header()
+            self.segments.append((offset, len(header), 'bytes', header))
+            offset += len(header)
+            self.segments.append((offset, member.size, 'data', member))
+            offset += member.size
+            self.segments.append((offset, member.descriptor_length(), 'descriptor', member))
+            offset += member.descriptor_length()
+        self.central_directory_offset = offset
+        self.central_directory_length = sum(member.central_header_length() for member in members)
+        end_records = self._end_records()
+        self.segments.append((offset, self.central_directory_length + len(end_records), 'central', end_records))
+        self.size = offset + self.central_directory_length + len(end_records)
+
+    def _end_records(self):
+        count = len(self.members)
+        cd_offset, cd_length = self.central_directory_offset, self.central_directory_length
+        records = b''
+        if count >= ZIP_MAX_MEMBERS or cd_offset >= ZIP64_LIMIT or cd_length >= ZIP64_LIMIT:
+            zip64_end_offset = cd_offset + cd_length
+            records += struct.pack(
+                '<IQHHIIQQQQ', 0x06064b50, 44, VERSION_MADE_BY, VERSION_NEEDED_ZIP64, 0, 0,
+                count, count, cd_length, cd_offset,
+            )
+            records += struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1)
+            count = min(count, ZIP_MAX_MEMBERS)
+            cd_offset = min(cd_offset, ZIP64_LIMIT)
+            cd_length = min(cd_length, ZIP64_LIMIT)
+        records += struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, count, count, cd_length, cd_offset, 0)
+        return records
+
+    def _central(self, end_records):
+        for member in self.members:
+            member.compute_crc()
+            yield member.central_header()
+        yield end_records
+
+    def stream(self, start=0, end=None):
+        """Yields the archive bytes ``[start, end]`` (inclusive)"""
+        end = self.size - 1 if end is None else end
+        for offset, length, kind, value in self.segments:
+            if offset + length <= start or length == 0:
+                continue
+            if offset > end:
+                break
+            first = max(start - offset, 0)
+            last = min(end - offset + 1, length)
+            if kind == 'bytes':
+                yield value[first:last]
+            elif kind == 'data':
+                yield from self._stream_data(value, first, last)
+            elif kind == 'descriptor':
+                value.compute_crc()
+                yield value.descriptor()[first:last]
+            else:
+                yield from self._slice(self._central(value), first, last)
+
+    def _stream_data(self, member, first, last):
+        if first or last < member.size or member.crc is not None:
+            yield from member.read(first, last)
+            return
+        # The whole file: compute its CRC on the way for the descriptor
+        crc = 0
+        for chunk in member.read(0, member.size):
+            crc = zlib.crc32(chunk, crc)
+            yield chunk
+        member.set_crc(crc)
+
+    def _slice(self, chunks, first, last):
+        position = 0
+        for chunk in chunks:
+            chunk_end = position + len(chunk)
+            if chunk_end > first and position < last:
+                yield chunk[max(first - position, 0):last - position]
+            position = chunk_end
+
+    def etag(self):
+        digest = hashlib.sha256()
+        for member in self.members:
+            digest.update(member.encoded_name + b'\0')
+            # The manifest (with the SHA-256s) by content, files by size and mtime
+            digest.update(f'{member.size}:{member.mtime_ns}:{member.crc if member.data else ""}'.encode())
+        return f'"{digest.hexdigest()[:32]}"'
+
+
+def folder_members(materials, folder=''):
+    """
+    ``[(name, material, path)]`` for materials with a file on disk, named
+    after their position so the archive lists them in course order, and the
+    materials whose file is missing.
+    """
+    found, missing = [], []
+    for material in materials:
+        path = material.get_full_path()
+        if path and os.path.isfile(path):
+            found.append((material, path))
+        else:
+            missing.append(material)
+    width = max(2, len(str(len(found))))
+    members = []
+    for position, (material, path) in enumerate(found, 1):
+        base, ext = os.path.splitext(os.path.basename(path))
+        name = f'{position:0{width}d} {safe_name(material.title or base)}'
+        if not name.lower().endswith(ext.lower()):
+            name += ext.lower()
+        members.append((f'{folder}/{name}' if folder else name, material, path))
+    return members, missing
+
+
+def build_archive(title, kind, pk, folders):
+    """
+    ZipArchive for ``folders``, a list of ``(folder name, materials)``:
+    the manifest first, then the files of every folder in order.
+    """
+    entries, missing, names = [], [], set()
+    for folder, materials in folders:
+        folder_entries, folder_missing = folder_members(materials, safe_name(folder, 'materials') if folder else '')
+        missing += folder_missing
+        for name, material, path in folder_entries:
+            unique, counter = name, 2
+            while unique.lower() in names or unique == MANIFEST_NAME:
+                stem, ext = os.path.splitext(name)
+                unique, counter = f'{stem} ({counter}){ext}', counter + 1
+            names.add(unique.lower())
+            entries.append(ArchiveMember(unique, path=path, material=material))
+
+    manifest = {
+        'kind': kind,
+        'id': pk,
+        'title': title,
+        'files': [
+            {
+                'path': member.name,
+                'material': member.material.pk,
+                'title': member.material.title,
+                'material_type': member.material.material_type,
+                'size': member.size,
+                'sha256': member.material.content_hash,
+            }
+            for member in entries
+        ],
+        'missing': [{'material': material.pk, 'title': material.title} for material in missing],
+    }
+    newest = max((member.mtime for member in entries), default=0)
+    data = json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True).encode('utf-8')
+    return ZipArchive([ArchiveMember(MANIFEST_NAME, data=data, mtime=newest), *entries])
+
+
+def course_archive(course):
+    """
+    Materials attached to the course directly at the root, then one folder
+    per level and per lesson, in course order.
+    """
+    materials = course_materials(course.pk).select_related('level', 'lesson', 'duplicate_of').order_by(
+        F('level__level_number').asc(nulls_last=True), 'level__order', 'level_id',
+        'lesson__order', 'lesson__created_at', 'lesson_id', 'order', 'created_at', 'id',
+    )
+    folders = OrderedDict([('', [])])
+    for material in materials:
+        if material.level_id and material.level.course_id == course.pk:
+            folder = f'{material.level.level_number:02d} {material.level.title}'
+        elif material.lesson_id and material.lesson.course_id == course.pk:
+            folder = f'{material.lesson.title}'
+        else:
+            folder = ''
+        folders.setdefault(folder, []).append(material)
+    return build_archive(course.title, 'course', course.pk, list(folders.items()))
+
+
+def level_archive(level):
+    materials = Material.objects.filter(level=level.pk).select_related('duplicate_of')
+    return build_archive(level.title, 'level', level.pk, [('', materials)])
+
+
+def zip_response(request, archive, filename):
+    """200/206/304/416 response streaming ``archive`` (single ranges only)"""
+    etag = archive.etag()
+    not_modified = check_preconditions(request, etag)
+    if not_modified is not None:
+        return not_modified
+    ranges = requested_ranges(request, archive.size, etag)
+    if ranges is not None and len(ranges) > 1:
+        # Resuming needs one range; send the whole archive for multipart requests
+        ranges = None
+
+    if ranges == []:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{archive.size}'
+    elif ranges:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(archive.stream(start, end), status=206, content_type='application/zip')
+        response['Content-Range'] = f'bytes {start}-{end}/{archive.size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        response = StreamingHttpResponse(archive.stream(), content_type='application/zip')
+        response['Content-Length'] = str(archive.size)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    ascii_name = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode() or 'materials.zip'
+    response['Content-Disposition'] = f'attachment; filename="{ascii_name}"; filename*=UTF-8\'\'{quote(filename)}'
+    return response
@@ -3,6 +3,7 @@ Django settings for english_platform project.
 """
 
 from pathlib import Path
+from corsheaders.defaults import default_headers
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -38,6 +39,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'courses.instrumentation.InstrumentationMiddleware',
+    'courses.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -72,13 +75,62 @@ WSGI_APPLICATION = 'english_platform.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# 'sqlite' (default) or 'postgres', chosen with the DATABASE_PROFILE
+# environment variable. Both keep connections open between requests.
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'sqlite')
+
+# Applied to every SQLite connection (see courses/database.py): WAL lets reads
+# go on while uploads and scans write, writers wait BUSY_TIMEOUT ms for the lock
+# instead of failing with "database is locked"; TRANSACTION_MODE 'IMMEDIATE'
+# makes atomic blocks wait for it too. CACHE_SIZE and MMAP_SIZE are bytes per
+# connection. READ_ONLY_CONNECTIONS opens a second, query_only connection to
+# the same file that ReadOnlyRouter sends reads to.
+SQLITE_PROFILE = {
+    'JOURNAL_MODE': 'WAL',
+    'SYNCHRONOUS': 'NORMAL',
+    'TRANSACTION_MODE': 'IMMEDIATE',
+    'BUSY_TIMEOUT': 5000,
+    'CACHE_SIZE': 64 * 1024 * 1024,
+    'MMAP_SIZE': 256 * 1024 * 1024,
+    'READ_ONLY_CONNECTIONS': True,
 }
 
+if DATABASE_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'english_platform'),
+            'USER': os.environ.get('POSTGRES_USER', 'english_platform'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': 60,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if os.environ.get('POSTGRES_REPLICA_HOST'):
+        DATABASES['readonly'] = {
+            **DATABASES['default'],
+            'HOST': os.environ['POSTGRES_REPLICA_HOST'],
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'courses.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if SQLITE_PROFILE['READ_ONLY_CONNECTIONS']:
+        DATABASES['readonly'] = {
+            **DATABASES['default'],
+            'TEST': {'MIRROR': 'default'},
+        }
+
+DATABASE_ROUTERS = ['courses.database.ReadOnlyRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -121,8 +173,109 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-# Materials path
-MATERIALS_ROOT = r'J:\Ingles\platform'
+# Materials path (e.g. a catalog made by ``manage.py generate_catalog``)
+MATERIALS_ROOT = os.environ.get('MATERIALS_ROOT', r'J:\Ingles\platform')
+
+# How material files are transferred once MaterialViewSet.file has done the
+# lookup and permission checks: 'python' (streamed by the worker, for
+# development), 'sendfile' (wsgi.file_wrapper / os.sendfile in gunicorn or
+# uWSGI), 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache / lighttpd)
+MATERIALS_SERVE_BACKEND = 'python'
+
+# Internal nginx locations used with 'x-accel-redirect', keyed by the
+# filesystem root they serve
+MATERIALS_ACCEL_REDIRECT_LOCATIONS = {
+    MATERIALS_ROOT: '/protected/materials/',
+    MEDIA_ROOT: '/protected/media/',
+}
+
+# Route materials/<pk>/file/ to the native async view (courses/async_views.py).
+# Only worth enabling when served by an ASGI server (english_platform.asgi);
+# under WSGI every download would hold a worker thread either way.
+MATERIALS_ASYNC_FILE_VIEW = False
+
+# Content hashing of materials (scans, uploads, find_duplicate_materials).
+# Reads are capped so hashing does not starve live file serving.
+MATERIAL_HASH_WORKERS = 2
+MATERIAL_HASH_MAX_BYTES_PER_SEC = 32 * 1024 * 1024
+
+# Response cache for the course tree and list endpoints (see courses/cache.py).
+# BACKEND is 'courses.cache.LocalLRUCache' (per process) or
+# 'courses.cache.DjangoCache' (OPTIONS: {'alias': ...}). With several worker
+# processes VERSION_CACHE must name a cache shared by all of them (see CACHES):
+# the default LocMem cache is per process, so the response cache ships disabled.
+COURSES_RESPONSE_CACHE = {
+    'ENABLED': False,
+    'BACKEND': 'courses.cache.LocalLRUCache',
+    'OPTIONS': {'max_entries': 512},
+    'TIMEOUT': 600,
+    'VERSION_CACHE': 'default',
+}
+
+# Resumable uploads (MaterialViewSet uploads/ actions, see courses/uploads.py).
+# Sessions idle for longer than MATERIAL_UPLOAD_SESSION_MAX_AGE seconds are
+# removed, with their partial files, by `manage.py clear_stale_uploads`.
+MATERIAL_UPLOAD_MAX_SIZE = 20 * 1024 * 1024 * 1024
+MATERIAL_UPLOAD_SESSION_MAX_AGE = 24 * 60 * 60
+
+# Learning progress events (POST /api/progress/events/, see courses/progress.py)
+# are merged in memory and written every FLUSH_INTERVAL seconds, or once
+# MAX_PENDING (user, material) pairs are waiting. 0 writes during the request.
+COURSES_PROGRESS = {
+    'FLUSH_INTERVAL': 5,
+    'MAX_PENDING': 1000,
+    'MAX_EVENTS_PER_REQUEST': 500,
+}
+
+# Delta sync (/api/sync/, see courses/sync.py). The final cursor stays
+# SAFETY_WINDOW seconds behind now so rows of transactions still committing are
+# not skipped; tombstones of deleted rows are kept TOMBSTONE_RETENTION_DAYS
+# (prune them with `manage.py prune_sync_tombstones`).
+COURSES_SYNC = {
+    'PAGE_SIZE': 500,
+    'MAX_PAGE_SIZE': 2000,
+    'SAFETY_WINDOW': 60,
+    'TOMBSTONE_RETENTION_DAYS': 90,
+}
+
+# Per-request instrumentation (see courses/instrumentation.py). SAMPLE_RATE of
+# the requests record their SQL, serializer and streaming times, are logged as
+# JSON on the courses.instrumentation logger and summarised per route for admins
+# at /api/instrumentation/. SERVER_TIMING records every request and adds a
+# Server-Timing header without logging it; 0 and False leave the middleware a
+# single random draw. LOG is off in development (and the test suite).
+COURSES_INSTRUMENTATION = {
+    'SAMPLE_RATE': 0.01,
+    'SERVER_TIMING': DEBUG,
+    'LOG': not DEBUG,
+    'WINDOW': 1000,
+}
+
+# Prometheus metrics at /api/metrics/ (see courses/metrics.py), for staff users
+# and for scrapers sending "Authorization: Bearer <SCRAPE_TOKEN>". With several
+# worker processes DIRECTORY must be shared by all of them (empty it on
+# restart); each process writes its values there every FLUSH_INTERVAL seconds.
+COURSES_METRICS = {
+    'DIRECTORY': os.environ.get('METRICS_DIRECTORY') or None,
+    'FLUSH_INTERVAL': 5,
+    'SCRAPE_TOKEN': os.environ.get('METRICS_SCRAPE_TOKEN', ''),
+}
+
+# Resized previews of course thumbnails, avatars, image materials and PDF
+# first pages (see courses/previews.py). ROOT defaults to MEDIA_ROOT/previews;
+# the least recently used variants are evicted once MAX_BYTES is exceeded.
+# PDF pages are rendered with pdftoppm (poppler-utils) when it is installed.
+COURSES_PREVIEWS = {
+    'WIDTHS': [160, 320, 640, 1280],
+    'DEFAULT_WIDTH': 320,
+    'QUALITY': 80,
+    'MAX_BYTES': 512 * 1024 * 1024,
+    'PDFTOPPM': 'pdftoppm',
+}
+
+# Background pool for post-upload / post-scan work
+COURSES_BACKGROUND_WORKERS = 2
+COURSES_BACKGROUND_QUEUE_SIZE = 32
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -134,8 +287,12 @@ AUTH_USER_MODEL = 'accounts.User'
 
 # REST Framework settings
 REST_FRAMEWORK = {
+    # Builds request.user from the token claims instead of loading it on every
+    # request (see accounts/authentication.py). Use
+    # rest_framework_simplejwt.authentication.JWTAuthentication to always
+    # load the user row.
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.StatelessJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -155,6 +312,11 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Seconds an account state (active, role, password) is cached per process by
+# StatelessJWTAuthentication; deactivations and password or role changes
+# revoke existing tokens in other processes within this delay.
+JWT_REVOCATION_CHECK_TTL = 60
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -163,3 +325,20 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+
+# Resumable uploads send and read the committed offset in this header;
+# Server-Timing carries the instrumentation timings
+CORS_ALLOW_HEADERS = (*default_headers, 'upload-offset')
+CORS_EXPOSE_HEADERS = ['Upload-Offset', 'Server-Timing']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # One JSON line per sampled request
+        'courses.instrumentation': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}